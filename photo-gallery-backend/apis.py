@@ -1,20 +1,72 @@
 #region Description
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, APIRouter
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, APIRouter, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+import anyio.to_thread
 from pydantic import BaseModel
 import sqlite3
+from database import ConnectionPool
+from migrations import SEARCH_DATE_INDEX, SEARCH_RANGE_INDEXES, apply_migrations
+from jobs import JobQueue
+from storage import S3Storage
+from disk_cache import DiskLRUCache
+from metrics import REGISTRY, IMAGE_SECONDS, histogram, gauge
+from tracing import SamplingProfiler, end_trace, span, start_trace
+from imaging import (DERIVED_COLUMNS, VARIANT_FORMATS, PREVIEW_MAX_DIMENSION, DecodeBudget, DecodeBudgetExceeded,
+                     build_derivatives, decode_cost, typed_exif_from_text, render_variant)
 import os
-import boto3
 from uuid import uuid4
 from datetime import datetime
 from PIL import Image
-from PIL.ExifTags import TAGS
 import tempfile
+import threading
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+import base64
+import re
+import hashlib
+import json
+from functools import lru_cache
+from bisect import bisect_left
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+def json_dumps(content) -> bytes:
+    """
+    Encode a response body as compact UTF-8 JSON, with orjson when installed
+
+    Parameters:
+    content (Any): JSON-compatible data
+
+    Returns:
+    bytes: Encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with json_dumps
 
-app = FastAPI()
+    Handlers returning it directly also skip FastAPI's response model
+    validation and jsonable_encoder pass over the body.
+    """
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return json_dumps(content)
+
+app = FastAPI(default_response_class=FastJSONResponse)
 themesAPIs = APIRouter(prefix="/themes")
 collectionsAPIs = APIRouter(prefix="/collections")
 photosAPIs = APIRouter(prefix="/photos")
+galleryAPIs = APIRouter(prefix="/gallery")
 utilsAPIs = APIRouter(prefix="/utils")
 
 app.add_middleware(
@@ -23,41 +75,409 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods including OPTIONS
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
 
+HTTP_REQUEST_SECONDS = histogram("http_request_duration_seconds",
+                                 "Request latency until the response starts", ("method", "route", "status"))
+
+REQUEST_LOG_MIN_MS = 250  # requests faster than this are not logged; 0 logs every request
+# Allow ?profile=1 or "X-Profile: 1" to profile a single request; off unless PHOTO_GALLERY_PROFILE=1,
+# since profiles expose code paths and may sample other requests sharing the same threads
+PROFILE_ENABLED = os.environ.get("PHOTO_GALLERY_PROFILE") == "1"
+PROFILE_INTERVAL = 0.005  # seconds between profiler samples
+profile_lock = threading.Lock()  # one profiled request at a time
+
+def wants_profile(request:Request) -> bool:
+    """
+    Check whether the client asked for a profile of this request
+
+    Parameters:
+    request (Request): Incoming request
+
+    Returns:
+    bool: True if the profile query flag or the X-Profile header is set
+    """
+    return PROFILE_ENABLED and "1" in (request.query_params.get("profile"), request.headers.get("x-profile"))
+
+def log_request(request:Request, route:str, status:int, duration:float, stages:dict) -> None:
+    if duration * 1000 < REQUEST_LOG_MIN_MS:
+        return
+    print(json_dumps({
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "method": request.method,
+        "path": request.url.path,
+        "route": route,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "stages": stages
+    }).decode())
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time the request, log its stage timings as JSON and report them in Server-Timing
+
+    With a profile flag the response body is replaced by a sampling profile
+    of the request in the collapsed stack format; the handler's status code
+    is sent in X-Profile-Status.
+    """
+    trace, token = start_trace()
+    status = 500
+    profiler = None
+    if wants_profile(request):
+        if not profile_lock.acquire(blocking=False):
+            end_trace(token)
+            return PlainTextResponse("Another request is being profiled", status_code=429)
+        profiler = SamplingProfiler(trace, PROFILE_INTERVAL)
+        profiler.start()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if profiler is not None:
+            # Streamed listings do their work while the body is read, so read it inside the profile
+            async for _ in response.body_iterator:
+                pass
+            profiler.stop()
+            response = PlainTextResponse(profiler.collapsed(), headers={
+                "X-Profile-Status": str(status),
+                "X-Profile-Samples": str(profiler.samples),
+                "X-Profile-Interval-Ms": str(PROFILE_INTERVAL * 1000)
+            })
+        # Covers the work done until the response starts, like http_request_duration_seconds
+        response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profile_lock.release()
+        duration = trace.elapsed()
+        # Label by route template, not the raw path, to keep the series count bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_SECONDS.observe(duration, method=request.method, route=route, status=str(status))
+        log_request(request, route, status, duration, trace.summary())
+        end_trace(token)
+
 # MinIO Configuration
 MINIO_ENDPOINT = "http://localhost:9500"
 MINIO_ACCESS_KEY = "minioadmin"
 MINIO_SECRET_KEY = "minioadmin"
 MINIO_BUCKET = "photo-gallery"
 
-s3_client = boto3.client(
-    "s3", 
-    endpoint_url=MINIO_ENDPOINT,
-    aws_access_key_id=MINIO_ACCESS_KEY,
-    aws_secret_access_key=MINIO_SECRET_KEY,
+S3_MAX_CONNECTIONS = 64    # shared by request handlers, the derivative queue and presigning
+S3_CONNECT_TIMEOUT = 5
+S3_READ_TIMEOUT = 60
+S3_MAX_ATTEMPTS = 5
+
+storage = S3Storage(
+    MINIO_ENDPOINT,
+    MINIO_ACCESS_KEY,
+    MINIO_SECRET_KEY,
+    MINIO_BUCKET,
+    max_connections=S3_MAX_CONNECTIONS,
+    connect_timeout=S3_CONNECT_TIMEOUT,
+    read_timeout=S3_READ_TIMEOUT,
+    max_attempts=S3_MAX_ATTEMPTS,
     verify=False
 )
+# Blocking client for code already running off the event loop
+s3_client = storage.client
 
 DB_FILE = "images.db"
-
-def get_db_connection() -> sqlite3.Connection:
+# Every sync endpoint and run_in_threadpool call may hold a connection, and anyio runs up to 40 of them
+# at once (its default thread limiter); the job dispatcher borrows connections outside that threadpool.
+# Startup raises the size further if the limiter was configured larger.
+DB_POOL_EXTRA = 2
+DB_POOL_SIZE = 40 + DB_POOL_EXTRA
+db_pool = ConnectionPool(DB_FILE, max_size=DB_POOL_SIZE)
+
+def get_db_connection():
     """
-    Get SQLite database connection
+    Borrow a pooled SQLite connection for a `with` block
 
     Parameters:
     None
 
     Returns:
-    sqlite3.Connection: SQLite database connection
+    ContextManager[sqlite3.Connection]: Pooled connection, returned to the pool on exit
+    """
+    return db_pool.connection()
+
+class PresignedURLCache:
+    """
+    Bounded in-process LRU cache of presigned URLs
+
+    Entries are keyed by (object key, expiry bucket). Time is cut into
+    buckets of `expiration - safety_margin` seconds, and the bucket of a
+    URL is the end of the bucket it was signed in. A URL signed during a
+    bucket stays valid past the safety margin until the bucket ends, so
+    every request in the same bucket can share it. An entry is handed back
+    only until `safety_margin` seconds before the signed URL expires. The
+    total size of cached URLs is capped at `max_bytes`, evicting least
+    recently used first.
+    """
+    def __init__(self, max_bytes:int=16 * 1024 * 1024, safety_margin:int=300):
+        self.max_bytes = max_bytes
+        self.safety_margin = safety_margin
+        self._entries = OrderedDict()  # (key, bucket end) -> (url, signed_at, expiration)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bucket(self, expiration:int, at:float) -> int:
+        """
+        Get the expiry bucket of a URL signed at a given time
+
+        Parameters:
+        expiration (int): Lifetime of the signed URL in seconds
+        at (float): Signing time, Unix seconds
+
+        Returns:
+        int: End of the bucket in Unix seconds, None if such URLs are not worth caching
+        """
+        width = expiration - self.safety_margin
+        # URLs that would never be served before hitting the margin are not worth caching
+        if width <= 0:
+            return None
+        return (int(at // width) + 1) * width
+
+    def get(self, key:str, expiration:int) -> str:
+        """
+        Get a cached URL that is still valid past the safety margin
+
+        Parameters:
+        key (str): Object key in MinIO
+        expiration (int): Lifetime in seconds a freshly signed URL would have
+
+        Returns:
+        str: Cached presigned URL or None on miss
+        """
+        now = time.time()
+        cache_key = (key, self.bucket(expiration, now))
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                url, signed_at, lifetime = entry
+                if now < signed_at + lifetime - self.safety_margin:
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    return url
+                self._remove(cache_key)
+            self.misses += 1
+            return None
+
+    def put(self, key:str, expiration:int, url:str, signed_at:float) -> None:
+        """
+        Store a freshly signed URL
+
+        Parameters:
+        key (str): Object key in MinIO
+        expiration (int): Lifetime of the signed URL in seconds
+        url (str): Presigned URL
+        signed_at (float): time.time() taken before signing, so the expiry is never overestimated
+
+        Returns:
+        None
+        """
+        bucket = self.bucket(expiration, signed_at)
+        if bucket is None:
+            return
+        cache_key = (key, bucket)
+        with self._lock:
+            self._remove(cache_key)
+            self._entries[cache_key] = (url, signed_at, expiration)
+            self._bytes += len(key) + len(url)
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, cache_key:tuple) -> None:
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._bytes -= len(cache_key[0]) + len(entry[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get cache counters
+
+        Parameters:
+        None
+
+        Returns:
+        dict: hits, misses, evictions, hit_ratio, entries, bytes and max_bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+presigned_url_cache = PresignedURLCache()
+
+# Local copies of preview images served by /photos/{photo_id}/preview
+PREVIEW_CACHE_DIR = os.path.join(tempfile.gettempdir(), "photo-gallery-previews")
+PREVIEW_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 0 disables the cache; the route then redirects to MinIO
+PREVIEW_MAX_AGE = 7 * 24 * 3600
+preview_cache = DiskLRUCache(PREVIEW_CACHE_DIR, PREVIEW_CACHE_MAX_BYTES) if PREVIEW_CACHE_MAX_BYTES else None
+
+class BytesLRUCache:
+    """
+    Bounded in-process LRU cache of small binary objects
+
+    Objects larger than `max_item_bytes` are not cached so a few large
+    renders cannot flush the cache.
+    """
+    def __init__(self, max_bytes:int=64 * 1024 * 1024, max_item_bytes:int=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries = OrderedDict()  # key -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key:str) -> bytes:
+        """
+        Get a cached object
+
+        Parameters:
+        key (str): Cache key
+
+        Returns:
+        bytes: Cached object or None on miss
+        """
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key:str, content:bytes) -> None:
+        """
+        Store an object, evicting least recently used ones over the size limit
+
+        Parameters:
+        key (str): Cache key
+        content (bytes): Object
+
+        Returns:
+        None
+        """
+        if len(content) > self.max_item_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = content
+            self._bytes += len(content)
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Get cache counters
+
+        Parameters:
+        None
+
+        Returns:
+        dict: hits, misses, evictions, hit_ratio, entries, bytes and max_bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+class SingleFlight:
+    """
+    Share one running coroutine between concurrent callers with the same key
+
+    The shared task is shielded, so a caller that disconnects does not
+    cancel the work for the others.
+    """
+    def __init__(self):
+        self._tasks = {}
+        self.deduplicated = 0
+
+    async def run(self, key, factory):
+        """
+        Await the running call for `key`, starting it if there is none
+
+        Parameters:
+        key (Hashable): Call identity
+        factory (Callable): Returns the coroutine to run
+
+        Returns:
+        Any: Result of the coroutine
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.deduplicated += 1
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+# Resized variants served by /photos/{photo_id}/render, cached in memory and under VARIANT_PREFIX in S3
+VARIANT_PREFIX = "variants/"
+RENDER_MAX_DIMENSION = 4096
+# Requested sizes and qualities snap to these steps, so clients cannot create unbounded numbers of stored variants
+RENDER_SIZES = (64, 128, 256, 320, 480, 640, 800, 1024, 1280, 1600, 1920, 2560, 3200, 4096)
+RENDER_QUALITIES = (50, 65, 80, 90)
+RENDER_DEFAULT_QUALITY = 80
+RENDER_BUDGET_TIMEOUT = 2  # seconds a render waits for decode memory before answering 503
+variant_cache = BytesLRUCache()
+variant_flights = SingleFlight()
+variant_stats = {"storage_hits": 0, "rendered": 0}
+
+def object_key(filepath:str) -> str:
+    """
+    Get the object key of a stored filepath
+
+    Parameters:
+    filepath (str): Object filepath in MinIO, possibly prefixed with the bucket name
+
+    Returns:
+    str: Object key within MINIO_BUCKET
     """
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Remove duplicated bucket prefix if present in the filepath
+    prefix = f"{MINIO_BUCKET}/"
+    return filepath[len(prefix):] if filepath.startswith(prefix) else filepath
 
 def generate_presigned_url(filepath:str, expiration:int=3600) -> str:
     """
-    Generate presigned URL for MinIO object
+    Generate presigned URL for MinIO object, served from the URL cache when possible
 
     Parameters:
     filepath (str): Object filepath in MinIO
@@ -66,97 +486,499 @@ def generate_presigned_url(filepath:str, expiration:int=3600) -> str:
     Returns:
     str: Presigned URL
     """
+    if not filepath:
+        return None
     try:
-        # Remove duplicated bucket prefix if present in the filepath
-        prefix = f"{MINIO_BUCKET}/"
-        key = filepath[len(prefix):] if filepath.startswith(prefix) else filepath
-        
-        url = s3_client.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={
-                "Bucket": MINIO_BUCKET,
-                "Key": key
-            },
-            ExpiresIn=expiration
-        )
+        key = object_key(filepath)
+        url = presigned_url_cache.get(key, expiration)
+        if url is not None:
+            return url
+
+        signed_at = time.time()
+        with span("s3_sign"):
+            url = s3_client.generate_presigned_url(
+                ClientMethod="get_object",
+                Params={
+                    "Bucket": MINIO_BUCKET,
+                    "Key": key
+                },
+                ExpiresIn=expiration
+            )
+        presigned_url_cache.put(key, expiration, url, signed_at)
         return url
     except Exception as e:
         return None
 
-def get_exif_data(image_path:str) -> dict:
+class CatalogGenerations:
+    """
+    Generation counters for catalog listings, kept in SQLite
+
+    Triggers on themes, collections and images (migration 10) bump the
+    counters of the scopes a write changes, e.g. ["themes"] or
+    ["collection", theme, collection], in the writing transaction, so
+    every API worker process and the ingest script see the same values. A
+    listing's ETag is built from the counters of the scopes it reads, with
+    one indexed lookup instead of the listing query. The ETag also carries
+    the database's random epoch and a time window no longer than the
+    presigned URL safety margin, so a 304 never revalidates a body whose
+    URLs may have expired.
+    """
+    def __init__(self, window:int):
+        self.window = window
+        self._lock = threading.Lock()
+        self.not_modified = 0
+
+    def etag(self, *scopes:tuple) -> str:
+        """
+        Build the strong ETag of a listing
+
+        Read it before the listing query, so the ETag never claims a newer
+        state than the body it is sent with.
+
+        Parameters:
+        scopes (tuple): Scopes read by the listing
+
+        Returns:
+        str: Quoted ETag
+        """
+        keys = [self.key(scope) for scope in (("epoch",),) + scopes]
+        with get_db_connection() as conn:
+            rows = conn.execute(f"""
+                SELECT scope, generation FROM catalog_generations WHERE scope IN ({', '.join('?' * len(keys))})
+            """, keys).fetchall()
+        current = {row["scope"]: row["generation"] for row in rows}
+        generations = ".".join(str(current.get(key, 0)) for key in keys)
+        return f'"{generations}-{int(time.time() // self.window)}"'
+
+    @staticmethod
+    def key(scope:tuple) -> str:
+        """
+        Encode a scope the way json_array() does in the triggers
+
+        Parameters:
+        scope (tuple): Scope, e.g. ("collection", theme, collection)
+
+        Returns:
+        str: catalog_generations.scope value
+        """
+        return json.dumps(list(scope), ensure_ascii=False, separators=(",", ":"))
+
+    def bump(self, conn:sqlite3.Connection, scopes:set):
+        """
+        Advance the counters of the given scopes by one in the caller's transaction
+
+        Used by bulk writes, which switch the per-row triggers off (migration 13)
+        so a batch bumps each scope it changed exactly once.
+
+        Parameters:
+        conn (sqlite3.Connection): Connection holding the write transaction
+        scopes (set): Scopes changed by the write
+
+        Returns:
+        None
+        """
+        conn.executemany("""
+            INSERT INTO catalog_generations (scope, generation) VALUES (?, 1)
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1
+        """, [(self.key(scope),) for scope in sorted(scopes)])
+
+    def matches(self, if_none_match:str, etag:str) -> bool:
+        """
+        Check an If-None-Match header against the current ETag
+
+        Parameters:
+        if_none_match (str): If-None-Match request header
+        etag (str): Current ETag from etag()
+
+        Returns:
+        bool: True if the client's copy is current
+        """
+        # If-None-Match uses the weak comparison
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag not in candidates and "*" not in candidates:
+            return False
+        with self._lock:
+            self.not_modified += 1
+        return True
+
+    def stats(self) -> dict:
+        """
+        Get generation counter statistics
+
+        Parameters:
+        None
+
+        Returns:
+        dict: Number of tracked scopes and 304 responses served by this process
+        """
+        with get_db_connection() as conn:
+            scopes = conn.execute("SELECT COUNT(*) FROM catalog_generations").fetchone()[0]
+        with self._lock:
+            return {"scopes": scopes, "not_modified": self.not_modified}
+
+catalog_generations = CatalogGenerations(window=presigned_url_cache.safety_margin)
+
+def check_not_modified(request:Request, response:Response, *scopes:tuple, negotiated:bool=False) -> Response:
+    """
+    Answer a conditional GET from the catalog generation counters
+
+    Parameters:
+    request (Request): Incoming request
+    response (Response): Response whose ETag and Cache-Control headers are set
+    scopes (tuple): Scopes read by the listing
+    negotiated (bool): The listing is also served as NDJSON, see wants_ndjson
+
+    Returns:
+    Response: 304 response if the client's copy is current, otherwise None
+    """
+    etag = catalog_generations.etag(*scopes)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if negotiated:
+        # JSON and NDJSON bodies of the same URL differ, so each gets its own ETag and caches key on Accept
+        if wants_ndjson(request):
+            headers["ETag"] = etag = etag[:-1] + '-ndjson"'
+        headers["Vary"] = "Accept"
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and catalog_generations.matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Decoded pixels held at once by derivative jobs and renders, see imaging.DecodeBudget
+DECODE_BUDGET_BYTES = 1024 * 1024 * 1024
+UPLOAD_RETRY_AFTER = 10  # seconds, sent with 503 while image processing is saturated
+decode_budget = DecodeBudget(DECODE_BUDGET_BYTES)
+
+def processing_saturated(retry_after:int) -> HTTPException:
+    """
+    Build the 503 sent when there is no decode memory for a request
+
+    Parameters:
+    retry_after (int): Seconds for the Retry-After header
+
+    Returns:
+    HTTPException: Exception to raise
+    """
+    return HTTPException(status_code=503, detail="Image processing is saturated, retry later",
+                         headers={"Retry-After": str(retry_after)})
+
+def admit_upload(cost:int) -> None:
+    """
+    Refuse an upload whose decoding would not fit in the decode memory left
+
+    Jobs already waiting for memory are counted as if they held it, so uploads
+    are refused rather than queued behind them.
+
+    Parameters:
+    cost (int): Decode memory the upload needs, see decode_cost
+
+    Returns:
+    None
+    """
+    remaining = decode_budget.available() - derivative_queue.deferred_bytes
+    # A file larger than the whole budget runs on its own, see DecodeBudget.acquire
+    if min(cost, decode_budget.max_bytes) > remaining:
+        with upload_stats_lock:
+            upload_stats["rejected"] += 1
+        raise processing_saturated(UPLOAD_RETRY_AFTER)
+
+# Columns returned by the photo listing endpoints, in response order
+PHOTO_FIELDS = ("id", "name", "date_added", "theme", "collection", "favourite", "camera_model",
+                "focal_length", "exposure_time", "iso", "aperture", "preview_image", "placeholder",
+                "average_color", "status")
+MAX_PAGE_LIMIT = 1000
+
+def parse_fields(fields:str) -> tuple:
+    """
+    Parse a comma separated `fields=` projection
+
+    Parameters:
+    fields (str): Comma separated field names, or None for every field
+
+    Returns:
+    tuple: Requested field names in response order
+    """
+    if not fields:
+        return PHOTO_FIELDS
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(PHOTO_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(f for f in PHOTO_FIELDS if f in requested)
+
+def encode_cursor(sort_key, photo_id:str) -> str:
+    """
+    Encode the position after a photo as an opaque cursor
+
+    Parameters:
+    sort_key (str | float): Sort key of the last photo on the page (date_added, or search rank)
+    photo_id (str): id of the last photo on the page
+
+    Returns:
+    str: URL-safe cursor
+    """
+    raw = json.dumps([sort_key, photo_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor:str) -> tuple:
     """
-    Extract EXIF data from image
-    
+    Decode a cursor produced by encode_cursor
+
     Parameters:
-    image_path (str): Image file path
+    cursor (str): Opaque cursor
 
     Returns:
-    dict: EXIF data including camera_model, focal_length, exposure_time, iso, and aperture
+    tuple: (sort key, id) of the last photo already returned
     """
     try:
-        img = Image.open(image_path)
-        exif_data = img._getexif()
-        if not exif_data:
-            return {}
-        exif = {}
-        for tag, value in exif_data.items():
-            decoded = TAGS.get(tag, tag)
-            exif[decoded] = value
-        return {
-            "camera_model": exif.get("Model", "Unknown"),
-            "focal_length": exif.get("FocalLength", "Unknown"),
-            "exposure_time": exif.get("ExposureTime", "Unknown"),
-            "iso": exif.get("ISOSpeedRatings", "Unknown"),
-            "aperture": exif.get("FNumber", "Unknown")
-        }
-    except Exception as e:
-        print(f"Error extracting EXIF: {e}")
-        return {}
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_key, photo_id = json.loads(raw)
+        return sort_key, photo_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def fetch_photo_page(where:str, params:tuple, columns:tuple, limit:int=None, cursor:str=None) -> tuple:
+    """
+    Fetch photos ordered by (date_added, id) using keyset pagination
+
+    Parameters:
+    where (str): SQL condition selecting the photos
+    params (tuple): Parameters for the condition
+    columns (tuple): Columns to select
+    limit (int): Maximum number of photos, or None for all remaining photos
+    cursor (str): Cursor returned by the previous page
+
+    Returns:
+    tuple: (rows, next_cursor) where next_cursor is None on the last page
+    """
+    # Ordering keys are always selected so the cursor can be built from the last row
+    select = list(dict.fromkeys(columns + ("date_added", "id")))
+    sql = f"SELECT {', '.join(select)} FROM images WHERE {where}"
+    params = list(params)
+    if cursor:
+        sql += " AND (date_added, id) > (?, ?)"
+        params.extend(decode_cursor(cursor))
+    sql += " ORDER BY date_added, id"
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    with get_db_connection() as conn:
+        cursor_ = conn.cursor()
+        cursor_.execute(sql, params)
+        rows = cursor_.fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["date_added"], rows[-1]["id"])
+    return rows, next_cursor
+
+# Fields rendered as strings, "" for NULL, by the legacy /photos/ format
+LEGACY_STRING_FIELDS = ("favourite", "camera_model", "focal_length", "exposure_time", "iso", "aperture")
+THEME_FIELDS = ("id", "name", "preview_image", "placeholder", "average_color", "status")
+COLLECTION_FIELDS = ("id", "name", "theme", "preview_image", "placeholder", "average_color", "status")
+
+@lru_cache(maxsize=256)
+def row_mapper(fields:tuple, stringify:bool=False):
+    """
+    Build a function turning rows into response dicts, signing preview URLs
+
+    Rows must select `fields` first and in the same order, e.g. with
+    `SELECT {', '.join(fields)}`; columns after them are ignored.
+
+    Parameters:
+    fields (tuple): Field names, in select order
+    stringify (bool): Render metadata as strings with "" for NULL (legacy /photos/ format)
+
+    Returns:
+    Callable: row -> dict
+    """
+    sign = "preview_image" in fields
+    strings = tuple(field for field in LEGACY_STRING_FIELDS if field in fields) if stringify else ()
+
+    def to_dict(row) -> dict:
+        item = dict(zip(fields, row))
+        if sign:
+            item["preview_image"] = generate_presigned_url(item["preview_image"])
+        for field in strings:
+            value = item[field]
+            item[field] = str(value) if value is not None else ""
+        return item
+    return to_dict
+
+def json_response(content, response:Response=None) -> FastJSONResponse:
+    """
+    Return a body directly, keeping headers set on the injected response
+
+    Parameters:
+    content (Any): JSON-compatible data
+    response (Response): Injected response carrying e.g. ETag or X-Next-Cursor
+
+    Returns:
+    FastJSONResponse: Encoded response
+    """
+    return FastJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500  # rows fetched per query while streaming
+
+def wants_ndjson(request:Request) -> bool:
+    """
+    Check whether the client asked for a newline-delimited JSON stream
+
+    Parameters:
+    request (Request): Incoming request
+
+    Returns:
+    bool: True if the Accept header lists application/x-ndjson
+    """
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def stream_photo_listing(where:str, params:tuple, columns:tuple, response:Response, limit:int=None,
+                         cursor:str=None, stringify:bool=False) -> StreamingResponse:
+    """
+    Stream photos as newline-delimited JSON, one object per line
+
+    Rows are read in keyset batches of STREAM_BATCH_SIZE, each on a briefly
+    borrowed connection, and URLs are signed as each batch is written. Memory
+    stays flat whatever the row count and slow clients never pin a pooled
+    connection or a long read transaction.
+
+    Parameters:
+    where (str): SQL condition selecting the photos
+    params (tuple): Parameters for the condition
+    columns (tuple): Fields to return
+    response (Response): Response whose headers (e.g. ETag) are copied to the stream
+    limit (int): Maximum number of photos, or None for all remaining photos
+    cursor (str): Cursor to resume after
+    stringify (bool): Render metadata as in the legacy /photos/ format
+
+    Returns:
+    StreamingResponse: application/x-ndjson body
+    """
+    if cursor:
+        decode_cursor(cursor)  # reject a bad cursor before the 200 status is sent
+
+    to_dict = row_mapper(columns, stringify)
+
+    def lines():
+        remaining = limit
+        position = cursor
+        while remaining is None or remaining > 0:
+            batch = STREAM_BATCH_SIZE if remaining is None else min(STREAM_BATCH_SIZE, remaining)
+            rows, position = fetch_photo_page(where, params, columns, batch, position)
+            if rows:
+                yield b"".join(json_dumps(to_dict(row)) + b"\n" for row in rows)
+            if remaining is not None:
+                remaining -= len(rows)
+            if position is None:
+                break
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=dict(response.headers))
+
+# Uploads are streamed to S3 in parts of this size; S3 requires at least 5 MB per part
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+
+upload_stats_lock = threading.Lock()
+upload_stats = {
+    "in_flight": 0,
+    "completed": 0,
+    "failed": 0,
+    "bytes": 0,
+    "multipart": 0,
+    "deduplicated": 0,
+    "rejected": 0,
+    "peak_buffer_bytes": 0
+}
+
+def spool_upload(source, spool_path:str) -> dict:
+    """
+    Copy an upload to local disk, hashing it on the fly
 
-def convert_to_webp(image_path: str) -> str:
+    The digest is known before anything is sent to MinIO, so content that is
+    already stored is never uploaded again. The spooled copy is also used for
+    EXIF extraction and preview generation.
+
+    Parameters:
+    source (BinaryIO): Readable file object
+    spool_path (str): Local path the stream is copied to
+
+    Returns:
+    dict: size and sha256
     """
-    Convert an image to WebP format
-    
+    hasher = hashlib.sha256()
+    size = 0
+    with open(spool_path, "wb") as spool:
+        for chunk in iter(lambda: source.read(UPLOAD_PART_SIZE), b""):
+            hasher.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+    return {"size": size, "sha256": hasher.hexdigest()}
+
+def stream_to_s3(spool_path:str, key:str) -> dict:
+    """
+    Stream a spooled upload to MinIO in fixed-size parts
+
+    At most one part is held in memory at a time.
+
     Parameters:
-    image_path (str): Original image path
-    
+    spool_path (str): Local copy written by spool_upload
+    key (str): Object key in MinIO
+
     Returns:
-    str: Path to the WebP version or None if conversion failed
+    dict: size and number of parts uploaded
     """
+    size = 0
+    parts = []
+    upload_id = None
+    peak_buffer = 0
     try:
-        # Create output filename - make sure we use a clean name without path issues
-        base_filename = os.path.basename(image_path).rsplit('.', 1)[0]
-        temp_dir = os.path.dirname(image_path)
-        preview_path = os.path.join(temp_dir, f"{base_filename}.webp")
-        
-        print(f"Attempting to create WebP at: {preview_path}")
-        
-        # Open, convert, and save the image
-        with Image.open(image_path) as img:
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            img.save(preview_path, "WEBP", quality=80)
-            # Force flush to disk
-            img.close()
-        
-        # Verify file was created with a retry mechanism
-        for _ in range(3):  # retry up to 3 times
-            if os.path.isfile(preview_path):
-                file_size = os.path.getsize(preview_path)
-                if file_size > 0:
-                    print(f"WebP created successfully at: {preview_path} (size: {file_size} bytes)")
-                    return preview_path
-            # Small delay before checking again
-            import time
-            time.sleep(0.2)
-        
-        print(f"Failed to create WebP at: {preview_path} after retries")
-        return None
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error converting to WebP: {str(e)}\n{error_details}")
-        return None
+        with open(spool_path, "rb") as source:
+            buffer = bytearray()
+            eof = False
+            while not eof:
+                # A short read does not mean the end of the stream; only b"" does
+                chunk = source.read(UPLOAD_PART_SIZE - len(buffer))
+                eof = not chunk
+                buffer += chunk
+                size += len(chunk)
+                peak_buffer = max(peak_buffer, len(buffer))
+                if len(buffer) < UPLOAD_PART_SIZE and not eof:
+                    continue
+                if upload_id is None and eof:
+                    # Whole file fits in one part, skip the multipart handshake
+                    s3_client.put_object(Bucket=MINIO_BUCKET, Key=key, Body=bytes(buffer))
+                    break
+                if not buffer:
+                    break
+                if upload_id is None:
+                    upload_id = s3_client.create_multipart_upload(Bucket=MINIO_BUCKET, Key=key)["UploadId"]
+                part_number = len(parts) + 1
+                response = s3_client.upload_part(Bucket=MINIO_BUCKET, Key=key, UploadId=upload_id,
+                                                 PartNumber=part_number, Body=bytes(buffer))
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+                buffer = bytearray()
+
+        if upload_id is not None:
+            s3_client.complete_multipart_upload(Bucket=MINIO_BUCKET, Key=key, UploadId=upload_id,
+                                                MultipartUpload={"Parts": parts})
+    except Exception:
+        if upload_id is not None:
+            try:
+                s3_client.abort_multipart_upload(Bucket=MINIO_BUCKET, Key=key, UploadId=upload_id)
+            except Exception as e:
+                print(f"Failed to abort multipart upload {upload_id}: {e}")
+        raise
+    finally:
+        with upload_stats_lock:
+            upload_stats["peak_buffer_bytes"] = max(upload_stats["peak_buffer_bytes"], peak_buffer)
+
+    with upload_stats_lock:
+        upload_stats["bytes"] += size
+        upload_stats["multipart"] += 1 if upload_id is not None else 0
+    return {"size": size, "parts": max(len(parts), 1)}
 
 class PhotoUpdate(BaseModel):
     name: str
@@ -169,6 +991,24 @@ class PhotoUpdate(BaseModel):
     iso: str
     aperture: str
 
+class BulkPhotoIds(BaseModel):
+    ids: list[str]
+
+class BulkFavorite(BulkPhotoIds):
+    favourite: bool
+
+class BulkMove(BulkPhotoIds):
+    theme: str
+    collection: str
+
+class BulkEdit(BulkPhotoIds):
+    # Fields left as None are not changed
+    camera_model: str = None
+    focal_length: str = None
+    exposure_time: str = None
+    iso: str = None
+    aperture: str = None
+
 # New Pydantic models for Themes and Collections
 class ThemePayload(BaseModel):
     name: str
@@ -184,7 +1024,7 @@ class CollectionPayload(BaseModel):
 
 #region Themes
 @themesAPIs.get("/")
-def get_all_themes() -> list[dict]:
+def get_all_themes(request: Request, response: Response) -> list[dict]:
     """
     Get all active themes
 
@@ -192,21 +1032,35 @@ def get_all_themes() -> list[dict]:
     None
 
     Returns:
-    list: Themes data including id, name, preview_image, and status
+    list: Themes data including id, name, preview_image, placeholder, average_color, and status
+    """
+    not_modified = check_not_modified(request, response, ("themes",))
+    if not_modified:
+        return not_modified
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(THEME_FIELDS)} FROM themes WHERE status='active'")
+        themes = cursor.fetchall()
+
+    to_dict = row_mapper(THEME_FIELDS)
+    return json_response([to_dict(theme) for theme in themes], response)
+
+def cover_placeholder(cursor:sqlite3.Cursor, preview_image:str) -> tuple:
+    """
+    Get the placeholder of the photo whose preview is used as a cover
+
+    Parameters:
+    cursor (sqlite3.Cursor): Database cursor
+    preview_image (str): Cover preview filepath
+
+    Returns:
+    tuple: (placeholder, average_color), both None if no photo has this preview
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM themes WHERE status='active'")
-    themes = cursor.fetchall()
-    conn.close()
-    
-    return [  # changed from set to list comprehension
-        {"id": themes[i]['id'],
-        "name": themes[i]['name'],
-        "preview_image": generate_presigned_url(themes[i]['preview_image']),
-        "status": themes[i]['status']
-        } for i in range(len(themes))
-    ]
+    if not preview_image:
+        return None, None
+    row = cursor.execute("SELECT placeholder, average_color FROM images WHERE preview_image=? LIMIT 1",
+                         (preview_image,)).fetchone()
+    return (row['placeholder'], row['average_color']) if row else (None, None)
 
 @themesAPIs.post("/add")
 def add_theme(theme: ThemePayload) -> dict[str, str]:
@@ -219,15 +1073,14 @@ def add_theme(theme: ThemePayload) -> dict[str, str]:
     Returns:
     dict: Message indicating theme added successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    theme_id = str(uuid4())
-    cursor.execute("""
-        INSERT INTO themes (id, name, preview_image, status)
-        VALUES (?, ?, ?, ?)
-    """, (theme_id, theme.name, theme.preview_image, theme.status))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        theme_id = str(uuid4())
+        cursor.execute("""
+            INSERT INTO themes (id, name, preview_image, placeholder, average_color, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (theme_id, theme.name, theme.preview_image, *cover_placeholder(cursor, theme.preview_image), theme.status))
+        conn.commit()
     return {"message": "Theme added successfully", "id": theme_id}
 
 @themesAPIs.put("/edit/{theme_id}")
@@ -242,14 +1095,13 @@ def edit_theme(theme_id: str, theme: ThemePayload) -> dict[str, str]:
     Returns:
     dict: Message indicating theme updated successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE themes SET name=?, preview_image=?, status=?
-        WHERE id=?
-    """, (theme.name, theme.preview_image, theme.status, theme_id))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE themes SET name=?, preview_image=?, placeholder=?, average_color=?, status=?
+            WHERE id=?
+        """, (theme.name, theme.preview_image, *cover_placeholder(cursor, theme.preview_image), theme.status, theme_id))
+        conn.commit()
     return {"message": "Theme updated successfully"}
 
 @themesAPIs.delete("/delete/{theme_id}")
@@ -263,17 +1115,16 @@ def delete_theme(theme_id: str) -> dict[str, str]:
     Returns:
     dict: Message indicating theme deleted successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE themes SET status='inactive' WHERE id=?", (theme_id,))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE themes SET status='inactive' WHERE id=?", (theme_id,))
+        conn.commit()
     return {"message": "Theme deleted successfully"}
 #endregion
 
 #region Collections
 @collectionsAPIs.get("/")
-def get_all_collections() -> list[dict]:
+def get_all_collections(request: Request, response: Response) -> list[dict]:
     """
     Get all active collections
 
@@ -281,25 +1132,21 @@ def get_all_collections() -> list[dict]:
     None
 
     Returns:
-    list: Collections data including id, name, theme, preview_image, and status
+    list: Collections data including id, name, theme, preview_image, placeholder, average_color, and status
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM collections WHERE status='active'")
-    collections = cursor.fetchall()
-    conn.close()
-    
-    return [  # changed from set to list comprehension
-        {"id": collections[i]['id'],
-        "name": collections[i]['name'],
-        "theme": collections[i]['theme'],
-        "preview_image": generate_presigned_url(collections[i]['preview_image']),
-        "status": collections[i]['status']
-        } for i in range(len(collections))
-    ]
+    not_modified = check_not_modified(request, response, ("collections",))
+    if not_modified:
+        return not_modified
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(COLLECTION_FIELDS)} FROM collections WHERE status='active'")
+        collections = cursor.fetchall()
+
+    to_dict = row_mapper(COLLECTION_FIELDS)
+    return json_response([to_dict(collection) for collection in collections], response)
 
 @collectionsAPIs.get("/{theme}")
-def get_collections_by_theme(theme: str) -> list[dict]:
+def get_collections_by_theme(theme: str, request: Request, response: Response) -> list[dict]:
     """
     Get collections by theme
 
@@ -307,22 +1154,19 @@ def get_collections_by_theme(theme: str) -> list[dict]:
     theme (str): Theme name
 
     Returns:
-    list: Collections data including id, name, theme, preview_image, and status
+    list: Collections data including id, name, theme, preview_image, placeholder, average_color, and status
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM collections WHERE theme=? AND status='active'", (theme,))
-    collections = cursor.fetchall()
-    conn.close()
-    
-    return [  # changed from set to list comprehension
-        {"id": collections[i]['id'],
-        "name": collections[i]['name'],
-        "theme": collections[i]['theme'],
-        "preview_image": generate_presigned_url(collections[i]['preview_image']),
-        "status": collections[i]['status']
-        } for i in range(len(collections))
-    ]
+    not_modified = check_not_modified(request, response, ("theme", theme))
+    if not_modified:
+        return not_modified
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(COLLECTION_FIELDS)} FROM collections WHERE theme=? AND status='active'",
+                       (theme,))
+        collections = cursor.fetchall()
+
+    to_dict = row_mapper(COLLECTION_FIELDS)
+    return json_response([to_dict(collection) for collection in collections], response)
 
 @collectionsAPIs.post("/add")
 def add_collection(collection: CollectionPayload) -> dict[str, str]:
@@ -335,15 +1179,15 @@ def add_collection(collection: CollectionPayload) -> dict[str, str]:
     Returns:
     dict: Message indicating collection added successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    collection_id = str(uuid4())
-    cursor.execute("""
-        INSERT INTO collections (id, name, theme, preview_image, status)
-        VALUES (?, ?, ?, ?, ?)
-    """, (collection_id, collection.name, collection.theme, collection.preview_image, collection.status))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        collection_id = str(uuid4())
+        cursor.execute("""
+            INSERT INTO collections (id, name, theme, preview_image, placeholder, average_color, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (collection_id, collection.name, collection.theme, collection.preview_image,
+              *cover_placeholder(cursor, collection.preview_image), collection.status))
+        conn.commit()
     return {"message": "Collection added successfully", "id": collection_id}
 
 @collectionsAPIs.put("/edit/{collection_id}")
@@ -357,14 +1201,14 @@ def edit_collection(collection_id: str, collection: CollectionPayload) -> dict[s
     Returns:
     dict: Message indicating collection updated successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE collections SET name=?, theme=?, preview_image=?, status=?
-        WHERE id=?
-    """, (collection.name, collection.theme, collection.preview_image, collection.status, collection_id))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE collections SET name=?, theme=?, preview_image=?, placeholder=?, average_color=?, status=?
+            WHERE id=?
+        """, (collection.name, collection.theme, collection.preview_image,
+              *cover_placeholder(cursor, collection.preview_image), collection.status, collection_id))
+        conn.commit()
     return {"message": "Collection updated successfully"}
 
 @collectionsAPIs.delete("/delete/{collection_id}")
@@ -378,85 +1222,354 @@ def delete_collection(collection_id: str) -> dict[str, str]:
     Returns:
     dict: Message indicating collection deleted successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE collections SET status='inactive' WHERE id=?", (collection_id,))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE collections SET status='inactive' WHERE id=?", (collection_id,))
+        conn.commit()
     return {"message": "Collection deleted successfully"}
 #endregion
 
+#region Gallery
+@galleryAPIs.get("/overview")
+def get_gallery_overview(request: Request, response: Response) -> dict:
+    """
+    Get every active theme with its active collections, photo counts and cover URLs
+
+    Photo counts come from collection_stats, which triggers on images keep current.
+
+    Parameters:
+    None
+
+    Returns:
+    dict: themes (id, name, preview_image, placeholder, average_color, photo_count and collections
+        with id, name, preview_image, placeholder, average_color and photo_count) and the total photo_count
+    """
+    not_modified = check_not_modified(request, response, ("themes",), ("collections",), ("gallery",))
+    if not_modified:
+        return not_modified
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT themes.id AS theme_id, themes.name AS theme_name, themes.preview_image AS theme_preview,
+                   themes.placeholder AS theme_placeholder, themes.average_color AS theme_color,
+                   collections.id AS collection_id, collections.name AS collection_name,
+                   collections.preview_image AS collection_preview,
+                   collections.placeholder AS collection_placeholder, collections.average_color AS collection_color,
+                   COALESCE(collection_stats.photo_count, 0) AS photo_count
+            FROM themes
+            LEFT JOIN collections ON collections.theme = themes.name AND collections.status='active'
+            LEFT JOIN collection_stats ON collection_stats.theme = themes.name
+                                      AND collection_stats.collection = collections.name
+            WHERE themes.status='active'
+            ORDER BY themes.name, collections.name
+        ''')
+        rows = cursor.fetchall()
+
+    themes = {}
+    for row in rows:
+        theme = themes.get(row['theme_id'])
+        if theme is None:
+            theme = themes[row['theme_id']] = {
+                "id": row['theme_id'],
+                "name": row['theme_name'],
+                "preview_image": generate_presigned_url(row['theme_preview']),
+                "placeholder": row['theme_placeholder'],
+                "average_color": row['theme_color'],
+                "photo_count": 0,
+                "collections": []
+            }
+        if row['collection_id'] is not None:
+            theme["collections"].append({
+                "id": row['collection_id'],
+                "name": row['collection_name'],
+                "preview_image": generate_presigned_url(row['collection_preview']),
+                "placeholder": row['collection_placeholder'],
+                "average_color": row['collection_color'],
+                "photo_count": row['photo_count']
+            })
+            theme["photo_count"] += row['photo_count']
+    for theme in themes.values():
+        # Themes without their own preview borrow the first collection cover
+        if theme["preview_image"] is None:
+            cover = next((collection for collection in theme["collections"] if collection["preview_image"]), None)
+            if cover is not None:
+                theme.update({field: cover[field] for field in ("preview_image", "placeholder", "average_color")})
+
+    return {"themes": list(themes.values()),
+            "photo_count": sum(theme["photo_count"] for theme in themes.values())}
+#endregion
+
 #region Photos
 @photosAPIs.get("/", deprecated=True)
-def get_all_photos() -> list[dict[str, str]]:
+def get_all_photos(request: Request, response: Response,
+                   limit: int = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+                   cursor: str = None,
+                   fields: str = None) -> list[dict[str, str]]:
     """
     Get all active photos
 
     Parameters:
-    None
+    limit (int): Maximum number of photos per page (default all)
+    cursor (str): Cursor from the X-Next-Cursor header of the previous page
+    fields (str): Comma separated fields to return (default all)
 
     Returns:
     list: Photos data including id, name, date_added, theme, collection, favourite, camera_model, 
-        focal_length, exposure_time, iso, aperture, preview_image, and status
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM images WHERE status='active'")
-    photos = cursor.fetchall()
-    conn.close()
-    
-    return [  # changed from set to list comprehension
-        {"id": photos[i]['id'],
-        "name": photos[i]['name'],
-        "date_added": photos[i]['date_added'],
-        "theme": photos[i]['theme'],
-        "collection": photos[i]['collection'],
-        "favourite": str(photos[i]['favourite']) if photos[i]['favourite'] is not None else "",
-        "camera_model": str(photos[i]['camera_model']) if photos[i]['camera_model'] is not None else "",
-        "focal_length": str(photos[i]['focal_length']) if photos[i]['focal_length'] is not None else "",
-        "exposure_time": str(photos[i]['exposure_time']) if photos[i]['exposure_time'] is not None else "",
-        "iso": str(photos[i]['iso']) if photos[i]['iso'] is not None else "",
-        "aperture": str(photos[i]['aperture']) if photos[i]['aperture'] is not None else "",
-        "preview_image": generate_presigned_url(photos[i]['preview_image']),
-        "status": photos[i]['status']
-        } for i in range(len(photos))
-    ]
+        focal_length, exposure_time, iso, aperture, preview_image, placeholder, average_color, and status;
+        streamed as NDJSON when the request accepts application/x-ndjson
+    """
+    columns = parse_fields(fields)
+    response.headers["Vary"] = "Accept"
+    if wants_ndjson(request):
+        return stream_photo_listing("status='active'", (), columns, response, limit, cursor, stringify=True)
+    photos, next_cursor = fetch_photo_page("status='active'", (), columns, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    to_dict = row_mapper(columns, stringify=True)
+    return json_response([to_dict(photo) for photo in photos], response)
 
 @photosAPIs.get("/theme/{theme}/collection/{collection}")
-def get_photos_by_theme_and_collection(theme: str, collection: str) -> list[dict]:
+def get_photos_by_theme_and_collection(theme: str, collection: str, request: Request, response: Response,
+                                       limit: int = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+                                       cursor: str = None,
+                                       fields: str = None) -> list[dict]:
+    """
+    Get photos by theme and collection, ordered by date_added then id
+
+    Parameters:
+    theme (str): Theme name
+    collection (str): Collection name
+    limit (int): Maximum number of photos per page (default all)
+    cursor (str): Cursor from the X-Next-Cursor header of the previous page
+    fields (str): Comma separated fields to return (default all)
+
+    Returns:
+    list: Photos data including id, name, date_added, theme, collection, favourite, camera_model, 
+        focal_length, exposure_time, iso, aperture, preview_image, placeholder, average_color, and status;
+        streamed as NDJSON when the request accepts application/x-ndjson
+    """
+    columns = parse_fields(fields)
+    not_modified = check_not_modified(request, response, ("collection", theme, collection), negotiated=True)
+    if not_modified:
+        return not_modified
+    if wants_ndjson(request):
+        return stream_photo_listing("theme=? AND collection=? AND status='active'", (theme, collection),
+                                    columns, response, limit, cursor)
+    photos, next_cursor = fetch_photo_page("theme=? AND collection=? AND status='active'",
+                                           (theme, collection), columns, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    to_dict = row_mapper(columns)
+    return json_response([to_dict(photo) for photo in photos], response)
+
+# Largest full-text match set that is ranked by relevance. BM25 reads every posting of each search word
+# and costs about 3 us per match on top, so this keeps ranking within the 20 ms search budget.
+SEARCH_RANK_LIMIT = 1000
+# Broad unranked text searches whose range filters leave at most this many photos check each of them
+# against the full-text query (about 0.1 ms apiece) instead of walking every text match
+SEARCH_FTS_CHECK_LIMIT = 100
+# Range filters matching at most this many photos are read from their index and sorted by date;
+# broader ones find a page sooner by walking the date order
+SEARCH_RANGE_SORT_LIMIT = 2000
+# Range index entries counted per filter when looking for the most selective one
+SEARCH_RANGE_PROBE_LIMIT = 20000
+
+def build_fts_query(q:str) -> str:
+    """
+    Turn free text into an FTS5 query matching every word as a prefix
+
+    Parameters:
+    q (str): User search text
+
+    Returns:
+    str: FTS5 MATCH expression, or None if q has no searchable words
+    """
+    words = re.findall(r"\w+", q or "")
+    return " ".join(f'"{word}"*' for word in words) or None
+
+def range_conditions(ranges:dict, prefix:str="") -> tuple:
+    """
+    Render EXIF range filters as SQL conditions
+
+    Parameters:
+    ranges (dict): Column -> list of (operator, value)
+    prefix (str): "+" keeps SQLite from driving the query with the column indexes
+
+    Returns:
+    tuple: (list of conditions, list of parameters)
     """
-    Get photos by theme and collection
+    conditions, params = [], []
+    for column, bounds in ranges.items():
+        for operator, value in bounds:
+            conditions.append(f"{prefix}images.{column}{operator}?")
+            params.append(value)
+    return conditions, params
+
+def choose_range_index(cursor:sqlite3.Cursor, ranges:dict) -> tuple:
+    """
+    Pick the range index to read a search from, if the range filters are selective enough
+
+    Without range statistics SQLite guesses how many rows a range holds, and would as readily sort a
+    year of photos as a day of them. Counting a bounded number of index entries per filter tells them apart.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Database cursor
+    ranges (dict): Column -> list of (operator, value)
+
+    Returns:
+    tuple: (index name, photos matching every range filter), or (None, None) when they are too many
+    """
+    sizes = {}
+    for column, bounds in ranges.items():
+        conditions, params = range_conditions({column: bounds})
+        cursor.execute(f"""
+            SELECT count(*) FROM (SELECT 1 FROM images INDEXED BY {SEARCH_RANGE_INDEXES[column]}
+                                  WHERE images.status='active' AND {' AND '.join(conditions)} LIMIT ?)
+        """, (*params, SEARCH_RANGE_PROBE_LIMIT))
+        sizes[column] = cursor.fetchone()[0]
+    column = min(sizes, key=sizes.get)
+    if len(ranges) == 1 and sizes[column] <= SEARCH_RANGE_SORT_LIMIT:
+        return SEARCH_RANGE_INDEXES[column], sizes[column]
+    if sizes[column] >= SEARCH_RANGE_PROBE_LIMIT or len(ranges) == 1:
+        return None, None
+    # The other range columns are in the same index entries, so counting the combination stays off the table
+    conditions, params = range_conditions(ranges)
+    cursor.execute(f"""
+        SELECT count(*) FROM (SELECT 1 FROM images INDEXED BY {SEARCH_RANGE_INDEXES[column]}
+                              WHERE images.status='active' AND {' AND '.join(conditions)} LIMIT ?)
+    """, (*params, SEARCH_RANGE_SORT_LIMIT + 1))
+    matches = cursor.fetchone()[0]
+    return (SEARCH_RANGE_INDEXES[column], matches) if matches <= SEARCH_RANGE_SORT_LIMIT else (None, None)
+
+@photosAPIs.get("/search")
+def search_photos(response: Response,
+                  q: str = None,
+                  camera_model: str = None,
+                  focal_min: float = None,
+                  focal_max: float = None,
+                  aperture_min: float = None,
+                  aperture_max: float = None,
+                  iso_min: int = None,
+                  iso_max: int = None,
+                  taken_after: str = None,
+                  taken_before: str = None,
+                  theme: str = None,
+                  collection: str = None,
+                  limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+                  cursor: str = None,
+                  fields: str = None) -> list[dict]:
+    """
+    Search active photos by name and EXIF filters
+
+    Results matching `q` are ranked by relevance (BM25). Terms matching more than
+    SEARCH_RANK_LIMIT photos are too broad to rank within budget and come back
+    newest first instead. Without `q`, photos are ordered by date_added then id.
 
     Parameters:
+    q (str): Words to match against photo, theme and collection names (prefix match)
+    camera_model (str): Camera model, case-insensitive exact match
+    focal_min, focal_max (float): Focal length range in mm
+    aperture_min, aperture_max (float): f-number range
+    iso_min, iso_max (int): ISO range
+    taken_after, taken_before (str): DateTimeOriginal range, "YYYY-MM-DD[ HH:MM:SS]"
     theme (str): Theme name
     collection (str): Collection name
+    limit (int): Maximum number of photos per page (default 50)
+    cursor (str): Cursor from the X-Next-Cursor header of the previous page
+    fields (str): Comma separated fields to return (default all)
 
     Returns:
     list: Photos data including id, name, date_added, theme, collection, favourite, camera_model, 
-        focal_length, exposure_time, iso, aperture, preview_image, and
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM images WHERE theme=? AND collection=? AND status='active'", (theme, collection))
-    photos = cursor.fetchall()
-    conn.close()
-    
-    return [  # changed from set to list comprehension
-        {"id": photos[i]['id'],
-        "name": photos[i]['name'],
-        "date_added": photos[i]['date_added'],
-        "theme": photos[i]['theme'],
-        "collection": photos[i]['collection'],
-        "favourite": photos[i]['favourite'],
-        "camera_model": photos[i]['camera_model'],
-        "focal_length": photos[i]['focal_length'],
-        "exposure_time": photos[i]['exposure_time'],
-        "iso": photos[i]['iso'],
-        "aperture": photos[i]['aperture'],
-        "preview_image": generate_presigned_url(photos[i]['preview_image']),
-        "status": photos[i]['status']
-        } for i in range(len(photos))
-    ]
+        focal_length, exposure_time, iso, aperture, preview_image, placeholder, average_color, and status
+    """
+    columns = parse_fields(fields)
+    conditions = ["images.status='active'"]
+    params = []
+    for sql, value in (("images.camera_model=? COLLATE NOCASE", camera_model),
+                       ("images.theme=?", theme),
+                       ("images.collection=?", collection)):
+        if value is not None:
+            conditions.append(sql)
+            params.append(value)
+    ranges = {}
+    for column, operator, value in (("focal_length_mm", ">=", focal_min), ("focal_length_mm", "<=", focal_max),
+                                    ("f_number", ">=", aperture_min), ("f_number", "<=", aperture_max),
+                                    ("iso_speed", ">=", iso_min), ("iso_speed", "<=", iso_max),
+                                    ("taken_at", ">=", taken_after), ("taken_at", "<=", taken_before)):
+        if value is not None:
+            ranges.setdefault(column, []).append((operator, value))
+    after = decode_cursor(cursor) if cursor else None
+
+    select = ", ".join(f"images.{column}" for column in dict.fromkeys(columns + ("date_added", "id")))
+    match = build_fts_query(q)
+    with get_db_connection() as conn:
+        cursor_ = conn.cursor()
+        ranked = False
+        if match:
+            if after is None:
+                # Only rank when the match set is small enough; probing in rowid order is cheap
+                cursor_.execute("SELECT rowid FROM images_fts WHERE images_fts MATCH ? LIMIT 1 OFFSET ?",
+                                (match, SEARCH_RANK_LIMIT))
+                ranked = cursor_.fetchone() is None
+            else:
+                ranked = after[0] is not None
+        range_index, range_matches = choose_range_index(cursor_, ranges) if ranges and not ranked else (None, None)
+        if match and range_index and range_matches > SEARCH_FTS_CHECK_LIMIT:
+            range_index = None
+        # Range filters not read from their index are written as +column, so SQLite keeps driving the query
+        # from the full-text match or the date order and only checks them on the way
+        range_sql, range_params = range_conditions(ranges, "" if range_index else "+")
+        if ranges and not match and not range_index and len(conditions) == 1:
+            # SQLite prefers the narrower date index, which reads every row to check the ranges
+            range_index = SEARCH_DATE_INDEX
+        conditions.extend(range_sql)
+        params.extend(range_params)
+        if ranked:
+            conditions.insert(0, "images_fts MATCH ?")
+            params.insert(0, match)
+            sort_key, order = "images_fts.rank", "images_fts.rank, images.id"
+            if after:
+                conditions.append("(images_fts.rank, images.id) > (?, ?)")
+                params.extend(after)
+            sql = f"SELECT {select}, {sort_key} AS sort_key FROM images_fts JOIN images ON images.rowid = images_fts.rowid"
+        elif match and range_index:
+            # A handful of photos in range: check each against the full-text query instead of walking
+            # every match of a broad term to find them
+            conditions.append("EXISTS (SELECT 1 FROM images_fts WHERE images_fts MATCH ? AND images_fts.rowid = images.rowid)")
+            params.append(match)
+            order = "images.rowid DESC"
+            if after:
+                conditions.append("images.rowid < (SELECT rowid FROM images WHERE id=?)")
+                params.append(after[1])
+            sql = f"SELECT {select}, NULL AS sort_key FROM images INDEXED BY {range_index}"
+        elif match:
+            conditions.insert(0, "images_fts MATCH ?")
+            params.insert(0, match)
+            order = "images_fts.rowid DESC"
+            if after:
+                conditions.append("images_fts.rowid < (SELECT rowid FROM images WHERE id=?)")
+                params.append(after[1])
+            sql = f"SELECT {select}, NULL AS sort_key FROM images_fts JOIN images ON images.rowid = images_fts.rowid"
+        else:
+            sql = f"SELECT {select}, images.date_added AS sort_key FROM images"
+            if range_index:
+                sql += f" INDEXED BY {range_index}"
+            order = "images.date_added, images.id"
+            if after:
+                conditions.append("(images.date_added, images.id) > (?, ?)")
+                params.extend(after)
+        sql += f" WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ?"
+        params.append(limit + 1)
+        cursor_.execute(sql, params)
+        photos = cursor_.fetchall()
+
+    if len(photos) > limit:
+        photos = photos[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(photos[-1]["sort_key"], photos[-1]["id"])
+    to_dict = row_mapper(columns)
+    return json_response([to_dict(photo) for photo in photos], response)
 
 @photosAPIs.get("/detail/{photo_id}")
 def get_photo_details(photo_id: str) -> dict:
@@ -468,34 +1581,54 @@ def get_photo_details(photo_id: str) -> dict:
 
     Returns:
     dict: Photo data including id, name, date_added, theme, collection, favourite, camera_model, 
-        focal_length, exposure_time, iso, aperture, preview_image, and status
+        focal_length, exposure_time, iso, aperture, preview_image, placeholder, average_color, and status
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(PHOTO_FIELDS)} FROM images WHERE id=?", (photo_id,))
+        photo = cursor.fetchone()
+    if photo:
+        return json_response(row_mapper(PHOTO_FIELDS)(photo))
+    else:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+@photosAPIs.get("/status/{photo_id}")
+def get_photo_status(photo_id: str) -> dict:
+    """
+    Get background processing status of a photo
+
+    Parameters:
+    photo_id (str): Photo ID
+
+    Returns:
+    dict: processing_status (pending, processing, done or failed), attempts and last_error
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM images WHERE id=?", (photo_id,))
-    photo = cursor.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT images.processing_status, processing_jobs.attempts, processing_jobs.last_error
+            FROM images LEFT JOIN processing_jobs ON processing_jobs.image_id = images.id
+            WHERE images.id=?
+        ''', (photo_id,))
+        photo = cursor.fetchone()
     if photo:
         return {
-            "id": photo['id'],
-            "name": photo['name'],
-            "date_added": photo['date_added'],
-            "theme": photo['theme'],
-            "collection": photo['collection'],
-            "favourite": photo['favourite'],
-            "camera_model": photo['camera_model'],
-            "focal_length": photo['focal_length'],
-            "exposure_time": photo['exposure_time'],
-            "iso": photo['iso'],
-            "aperture": photo['aperture'],
-            "preview_image": generate_presigned_url(photo['preview_image']),
-            "status": photo['status']
+            "id": photo_id,
+            "processing_status": photo['processing_status'],
+            "attempts": photo['attempts'] or 0,
+            "last_error": photo['last_error']
         }
     else:
         raise HTTPException(status_code=404, detail="Photo not found")
 
+def get_photo_filepath(photo_id:str) -> sqlite3.Row:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT filepath, content_hash FROM images WHERE id=?", (photo_id,))
+        return cursor.fetchone()
+
 @photosAPIs.get("/download/{photo_id}")
-def download_photo(photo_id: str) -> dict[str, str]:
+async def download_photo(photo_id: str) -> dict[str, str]:
     """
     Get photo download URL by id
 
@@ -505,77 +1638,564 @@ def download_photo(photo_id: str) -> dict[str, str]:
     Returns:
     dict: Photo download URL
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT filepath FROM images WHERE id=?", (photo_id,))
-    photo = cursor.fetchone()
-    conn.close()
+    photo = await run_in_threadpool(get_photo_filepath, photo_id)
     if photo:
         return {"url": generate_presigned_url(photo['filepath'])}
     else:
         raise HTTPException(status_code=404, detail="Photo not found")
-#endregion
 
-#region Utils
-@utilsAPIs.get("/favorites")
-def get_favorites() -> list[dict]:
+def etag_matches(request:Request, etag:str) -> bool:
+    # If-None-Match uses the weak comparison
+    candidates = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    return etag in candidates or "*" in candidates
+
+class CachedFileResponse(FileResponse):
+    """
+    FileResponse that releases its disk cache lease once sent, also when the client disconnects
     """
-    Get all favorite photos
+    def __init__(self, path:str, release, **kwargs):
+        super().__init__(path, **kwargs)
+        self.release = release
 
-    Parameters:
-    None
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
 
-    Returns:
-    list: Favorite photos data including id, name, date_added, theme, collection, favourite, camera_model, 
-        focal_length, exposure_time, iso, aperture, preview_image, and status
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM images WHERE favourite=1")
-    favorites = cursor.fetchall()
-    conn.close()
-    
-    return [  # changed from set to list comprehension
-        {"id": favorites[i]['id'],
-        "name": favorites[i]['name'],
-        "date_added": favorites[i]['date_added'],
-        "theme": favorites[i]['theme'],
-        "collection": favorites[i]['collection'],
-        "favourite": favorites[i]['favourite'],
-        "camera_model": favorites[i]['camera_model'],
-        "focal_length": favorites[i]['focal_length'],
-        "exposure_time": favorites[i]['exposure_time'],
-        "iso": favorites[i]['iso'],
-        "aperture": favorites[i]['aperture'],
-        "preview_image": generate_presigned_url(favorites[i]['preview_image']),
-        "status": favorites[i]['status']
-        } for i in range(len(favorites))
-    ]
+def get_photo_preview_key(photo_id:str) -> sqlite3.Row:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT preview_image, content_hash FROM images WHERE id=?", (photo_id,))
+        return cursor.fetchone()
 
-@utilsAPIs.put("/favorite/{photo_id}")
-def set_favorite(photo_id: str, favorite: bool) -> dict[str, str]:
+@photosAPIs.get("/{photo_id}/preview", response_class=FileResponse)
+async def get_photo_preview(photo_id: str, request: Request):
     """
-    Set favorite status for a photo
+    Serve preview image bytes from the local disk cache, filled from S3 on miss
+
+    Supports Range requests and If-None-Match. The ETag and the cache entry
+    are derived from the photo's content hash as well as the preview key, so
+    a re-ingested photo whose objects were rewritten in place is not served
+    stale, and responses may be cached by the browser.
 
     Parameters:
     photo_id (str): Photo ID
-    favorite (bool): Favorite status
 
     Returns:
-    dict: Message indicating favorite status updated
+    FileResponse: Preview image, or a redirect to MinIO when the cache is disabled
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE images SET favourite=? WHERE id=?", (favorite, photo_id))
-    conn.commit()
-    conn.close()
-    return {"message": "Favorite status updated"}
+    photo = await run_in_threadpool(get_photo_preview_key, photo_id)
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    if not photo['preview_image']:
+        raise HTTPException(status_code=404, detail="Preview not available")
+    if preview_cache is None:
+        return RedirectResponse(generate_presigned_url(photo['preview_image']), status_code=307)
+    key = object_key(photo['preview_image'])
+    # Rows from before content hashing only have their key to go by
+    cache_key = f"{photo['content_hash']}/{key}" if photo['content_hash'] else key
+
+    headers = {
+        "ETag": '"' + hashlib.sha1(cache_key.encode()).hexdigest()[:20] + '"',
+        "Cache-Control": f"public, max-age={PREVIEW_MAX_AGE}",
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
 
-@utilsAPIs.post("/upload")
-def upload_photo(file: UploadFile = File(...), 
-                 theme: str = Form(...), 
-                 collection: str = Form(...)) -> dict[str, str]:
-    """
+    try:
+        path = await preview_cache.get_or_fill(cache_key, lambda local_path: storage.download_file(key, local_path))
+    except Exception as e:
+        print(f"Error filling preview cache for {key}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Preview could not be fetched from storage")
+    return CachedFileResponse(path, lambda: preview_cache.release(cache_key), headers=headers,
+                              media_type="image/webp" if key.lower().endswith(".webp") else None)
+
+async def load_variant(key:str, source:str, width:int, height:int, fmt:str, quality:int) -> bytes:
+    """
+    Get a variant from S3, or render it from the original and store it there
+
+    Parameters:
+    key (str): Variant object key
+    source (str): Original object key
+    width (int): Maximum width, None for unbounded
+    height (int): Maximum height, None for unbounded
+    fmt (str): Output format, a key of VARIANT_FORMATS
+    quality (int): Encoder quality
+
+    Returns:
+    bytes: Encoded variant
+    """
+    content = await storage.get_bytes(key)
+    if content is not None:
+        variant_stats["storage_hits"] += 1
+    else:
+        local_path = os.path.join(tempfile.gettempdir(), f"{uuid4()}{os.path.splitext(source)[1]}")
+        try:
+            await storage.download_file(source, local_path)
+            timings = {}
+            content = await run_in_threadpool(render_within_budget, local_path, width, height, fmt, quality, timings)
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+        for operation, seconds in timings.items():
+            IMAGE_SECONDS.observe(seconds, operation=f"render_{operation}")
+        variant_stats["rendered"] += 1
+        await storage.put_bytes(key, content, VARIANT_FORMATS[fmt][1])
+    variant_cache.put(key, content)
+    return content
+
+def render_within_budget(local_path:str, width:int, height:int, fmt:str, quality:int, timings:dict) -> bytes:
+    cost = decode_cost(local_path, (width, height))
+    with decode_budget.reserve(cost, timeout=RENDER_BUDGET_TIMEOUT):
+        return render_variant(local_path, width, height, fmt, quality, timings)
+
+def snap_dimension(size:int) -> int:
+    # Smallest allowed size that is not smaller than requested
+    if size is None:
+        return None
+    return RENDER_SIZES[min(bisect_left(RENDER_SIZES, size), len(RENDER_SIZES) - 1)]
+
+def snap_quality(quality:int) -> int:
+    return min(RENDER_QUALITIES, key=lambda step: (abs(step - quality), -step))
+
+@photosAPIs.get("/{photo_id}/render", response_class=Response)
+async def render_photo(photo_id: str, request: Request,
+                       w: int = Query(None, ge=1, le=RENDER_MAX_DIMENSION),
+                       h: int = Query(None, ge=1, le=RENDER_MAX_DIMENSION),
+                       fmt: str = Query(None, pattern="^(webp|jpeg|jpg)$"),
+                       q: int = Query(RENDER_DEFAULT_QUALITY, ge=1, le=100)):
+    """
+    Serve a resized copy of the original, rendered on first request
+
+    Variants come from an in-process LRU cache, then from the `variants/`
+    prefix in S3, and are otherwise rendered from the original; concurrent
+    requests for the same variant share one render. Sizes are rounded up to
+    the next of RENDER_SIZES and qualities to the nearest of RENDER_QUALITIES,
+    and the original is never upscaled.
+
+    Parameters:
+    photo_id (str): Photo ID
+    w (int): Maximum width in pixels
+    h (int): Maximum height in pixels
+    fmt (str): webp or jpeg (default WebP when the Accept header allows it, else JPEG)
+    q (int): Encoder quality, 1-100
+
+    Returns:
+    Response: Encoded image
+    """
+    photo = await run_in_threadpool(get_photo_filepath, photo_id)
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    width, height = snap_dimension(w), snap_dimension(h)
+    q = snap_quality(q)
+    if fmt is None:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    elif fmt == "jpg":
+        fmt = "jpeg"
+    # Variants are keyed by the original's content hash, so an original rewritten in place gets new variants;
+    # rows from before content hashing fall back to the original's key
+    source = object_key(photo['filepath'])
+    version = photo['content_hash'] or os.path.splitext(source)[0]
+    key = f"{VARIANT_PREFIX}{version}/{width or 0}x{height or 0}q{q}.{fmt}"
+
+    headers = {
+        "ETag": '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"',
+        "Cache-Control": f"public, max-age={PREVIEW_MAX_AGE}",
+    }
+    if "fmt" not in request.query_params:
+        headers["Vary"] = "Accept"
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    content = variant_cache.get(key)
+    if content is None:
+        try:
+            content = await variant_flights.run(key, lambda: load_variant(key, source, width, height, fmt, q))
+        except DecodeBudgetExceeded:
+            raise processing_saturated(max(1, int(RENDER_BUDGET_TIMEOUT)))
+        except Image.DecompressionBombError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            print(f"Error rendering {key}: {str(e)}")
+            raise HTTPException(status_code=502, detail="Variant could not be rendered")
+    return Response(content, media_type=VARIANT_FORMATS[fmt][1], headers=headers)
+#endregion
+
+#region Utils
+@utilsAPIs.get("/favorites")
+def get_favorites(request: Request, response: Response,
+                  limit: int = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+                  cursor: str = None,
+                  fields: str = None) -> list[dict]:
+    """
+    Get all favorite photos, ordered by date_added then id
+
+    Parameters:
+    limit (int): Maximum number of photos per page (default all)
+    cursor (str): Cursor from the X-Next-Cursor header of the previous page
+    fields (str): Comma separated fields to return (default all)
+
+    Returns:
+    list: Favorite photos data including id, name, date_added, theme, collection, favourite, camera_model, 
+        focal_length, exposure_time, iso, aperture, preview_image, placeholder, average_color, and status;
+        streamed as NDJSON when the request accepts application/x-ndjson
+    """
+    columns = parse_fields(fields)
+    not_modified = check_not_modified(request, response, ("favorites",), negotiated=True)
+    if not_modified:
+        return not_modified
+    if wants_ndjson(request):
+        return stream_photo_listing("favourite=1", (), columns, response, limit, cursor)
+    favorites, next_cursor = fetch_photo_page("favourite=1", (), columns, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    to_dict = row_mapper(columns)
+    return json_response([to_dict(photo) for photo in favorites], response)
+
+@utilsAPIs.get("/cache/presigned")
+def get_presigned_cache_stats() -> dict:
+    """
+    Get presigned URL cache statistics
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Cache hit/miss counters and memory usage
+    """
+    return presigned_url_cache.stats()
+
+@utilsAPIs.get("/cache/previews")
+def get_preview_cache_stats() -> dict:
+    """
+    Get local preview cache statistics
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Cache hit/miss counters and disk usage, or enabled=False when the cache is disabled
+    """
+    if preview_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **preview_cache.stats()}
+
+@utilsAPIs.get("/cache/variants")
+def get_variant_cache_stats() -> dict:
+    """
+    Get rendered variant cache statistics
+
+    Parameters:
+    None
+
+    Returns:
+    dict: In-memory cache counters, S3 hits, renders, deduplicated requests and renders in flight
+    """
+    return {
+        "memory": variant_cache.stats(),
+        **variant_stats,
+        "deduplicated": variant_flights.deduplicated,
+        "in_flight": len(variant_flights)
+    }
+
+@utilsAPIs.get("/cache/catalog")
+def get_catalog_cache_stats() -> dict:
+    """
+    Get conditional GET statistics for the catalog listings
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Number of tracked scopes and 304 responses served
+    """
+    return catalog_generations.stats()
+
+@utilsAPIs.get("/decode/stats")
+def get_decode_stats() -> dict:
+    """
+    Get decode memory budget usage
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Budget size, bytes in use, peak, rejected reservations and derivative jobs waiting for budget
+    """
+    return {**decode_budget.stats(), "deferred_jobs": derivative_queue.deferred,
+            "deferred_bytes": derivative_queue.deferred_bytes}
+
+@utilsAPIs.get("/storage/stats")
+def get_storage_stats() -> dict:
+    """
+    Get S3 storage pool statistics
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Pool size, calls, errors and calls in flight on the storage thread pool
+    """
+    return storage.stats()
+
+@utilsAPIs.get("/db/pool")
+def get_db_pool_stats() -> dict:
+    """
+    Get SQLite connection pool statistics
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Pool size, usage and contention counters
+    """
+    return db_pool.stats()
+
+@utilsAPIs.get("/uploads/stats")
+def get_upload_stats() -> dict:
+    """
+    Get upload counters
+
+    Parameters:
+    None
+
+    Returns:
+    dict: In-flight, completed and failed uploads, bytes stored and peak bytes buffered in memory per upload
+    """
+    with upload_stats_lock:
+        return {**upload_stats, "part_size": UPLOAD_PART_SIZE}
+
+@utilsAPIs.get("/dedup/stats")
+def get_dedup_stats() -> dict:
+    """
+    Get content deduplication savings
+
+    Parameters:
+    None
+
+    Returns:
+    dict: Photo and distinct original counts, logical and stored bytes, and bytes saved
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) AS photos, COALESCE(SUM(blobs.size), 0) AS logical_bytes
+            FROM images JOIN blobs ON blobs.sha256 = images.content_hash
+        ''')
+        logical = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) AS originals, COALESCE(SUM(size), 0) AS stored_bytes FROM blobs")
+        physical = cursor.fetchone()
+    return {
+        "photos": logical['photos'],
+        "originals": physical['originals'],
+        "duplicates": logical['photos'] - physical['originals'],
+        "logical_bytes": logical['logical_bytes'],
+        "stored_bytes": physical['stored_bytes'],
+        "bytes_saved": logical['logical_bytes'] - physical['stored_bytes']
+    }
+
+@utilsAPIs.put("/favorite/{photo_id}")
+def set_favorite(photo_id: str, favorite: bool) -> dict[str, str]:
+    """
+    Set favorite status for a photo
+
+    Parameters:
+    photo_id (str): Photo ID
+    favorite (bool): Favorite status
+
+    Returns:
+    dict: Message indicating favorite status updated
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE images SET favourite=? WHERE id=?", (favorite, photo_id))
+        conn.commit()
+    return {"message": "Favorite status updated"}
+
+MAX_BULK_IDS = 1000
+
+def apply_bulk_update(ids:list, assignments:dict) -> dict:
+    """
+    Apply the same column assignments to many photos in one transaction
+
+    Parameters:
+    ids (list): Photo IDs
+    assignments (dict): Column name -> new value
+
+    Returns:
+    dict: Number of photos updated and a per-id result, "updated" or "not_found"
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > MAX_BULK_IDS:
+        raise HTTPException(status_code=400, detail=f"Expected between 1 and {MAX_BULK_IDS} ids")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Switch the per-row generation triggers off for this transaction; taking the write lock first
+        # also keeps the rows read below current until the commit
+        cursor.execute("INSERT INTO catalog_bulk_writes (started_at) VALUES (datetime('now'))")
+        cursor.execute(f"""
+            SELECT id, theme, collection, favourite, status FROM images WHERE id IN ({', '.join('?' * len(ids))})
+        """, ids)
+        found = cursor.fetchall()
+        columns = ", ".join(f"{column}=?" for column in assignments)
+        values = tuple(assignments.values())
+        cursor.executemany(f"UPDATE images SET {columns} WHERE id=?", [(*values, photo['id']) for photo in found])
+        cursor.execute("DELETE FROM catalog_bulk_writes")
+        # The union of what catalog_images_update would have bumped row by row
+        scopes = set()
+        for photo in found:
+            new = {column: assignments.get(column, photo[column]) for column in ("theme", "collection", "favourite", "status")}
+            scopes.add(("collection", photo["theme"], photo["collection"]))
+            scopes.add(("collection", new["theme"], new["collection"]))
+            if photo["favourite"] == 1 or new["favourite"] == 1:
+                scopes.add(("favorites",))
+            if any(photo[column] != new[column] for column in ("theme", "collection", "status")):
+                scopes.add(("gallery",))
+        catalog_generations.bump(conn, scopes)
+        conn.commit()
+
+    updated = {photo['id'] for photo in found}
+    return {
+        "updated": len(updated),
+        "results": [{"id": photo_id, "status": "updated" if photo_id in updated else "not_found"} for photo_id in ids]
+    }
+
+@utilsAPIs.put("/bulk/favorite")
+def bulk_set_favorite(update: BulkFavorite) -> dict:
+    """
+    Set favorite status for many photos in one transaction
+
+    Parameters:
+    update (BulkFavorite): Photo IDs and favorite status
+
+    Returns:
+    dict: Number of photos updated and a per-id result
+    """
+    return apply_bulk_update(update.ids, {"favourite": update.favourite})
+
+@utilsAPIs.put("/bulk/move")
+def bulk_move_photos(update: BulkMove) -> dict:
+    """
+    Move many photos to another theme and collection in one transaction
+
+    Parameters:
+    update (BulkMove): Photo IDs and target theme and collection
+
+    Returns:
+    dict: Number of photos updated and a per-id result
+    """
+    return apply_bulk_update(update.ids, {"theme": update.theme, "collection": update.collection})
+
+@utilsAPIs.put("/bulk/edit")
+def bulk_edit_photos(update: BulkEdit) -> dict:
+    """
+    Set the same EXIF details on many photos in one transaction
+
+    Parameters:
+    update (BulkEdit): Photo IDs and the fields to change; fields left out are kept
+
+    Returns:
+    dict: Number of photos updated and a per-id result
+    """
+    text = {"camera_model": update.camera_model, "focal_length": update.focal_length,
+            "exposure_time": update.exposure_time, "iso": update.iso, "aperture": update.aperture}
+    assignments = {column: value for column, value in text.items() if value is not None}
+    if not assignments:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    # Keep the typed columns used for filtering in step with the edited display values
+    typed = typed_exif_from_text(update.focal_length, update.exposure_time, update.iso, update.aperture)
+    for source, column in (("focal_length", "focal_length_mm"), ("exposure_time", "exposure_seconds"),
+                           ("iso", "iso_speed"), ("aperture", "f_number")):
+        if source in assignments:
+            assignments[column] = typed[column]
+    return apply_bulk_update(update.ids, assignments)
+
+@utilsAPIs.post("/bulk/delete")
+def bulk_delete_photos(update: BulkPhotoIds) -> dict:
+    """
+    Delete many photos in one transaction
+
+    Parameters:
+    update (BulkPhotoIds): Photo IDs
+
+    Returns:
+    dict: Number of photos deleted and a per-id result
+    """
+    return apply_bulk_update(update.ids, {"status": "inactive"})
+
+def record_upload(name:str, theme:str, collection:str, filepath:str, temp_path:str, stored:dict) -> dict:
+    """
+    Insert the database rows for a stored upload and queue its derivatives
+
+    Parameters:
+    name (str): Original file name
+    theme (str): Theme name
+    collection (str): Collection name
+    filepath (str): Object key the upload was stored under
+    temp_path (str): Local spooled copy of the original
+    stored (dict): Return value of spool_upload
+
+    Returns:
+    dict: id, duplicate (content already stored), duplicate_filepath, whether a
+        processed duplicate donated its EXIF data and preview (reused) and the id of
+        the photo whose pending job will also fill this one (derivatives_from)
+    """
+    date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    new_id = str(uuid4())
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # The primary key on blobs.sha256 decides which of two identical uploads owns the object
+        cursor.execute('''
+            INSERT OR IGNORE INTO blobs (sha256, filepath, size, created_at) VALUES (?, ?, ?, ?)
+        ''', (stored["sha256"], filepath, stored["size"], date_added))
+        duplicate = cursor.rowcount == 0
+        duplicate_filepath = None
+        donor = None
+        owner = None
+        if duplicate:
+            blob = cursor.execute("SELECT filepath, preview_image FROM blobs WHERE sha256=?",
+                                  (stored["sha256"],)).fetchone()
+            duplicate_filepath = blob["filepath"]
+            donor = cursor.execute(f'''
+                SELECT {', '.join(DERIVED_COLUMNS)}, preview_image FROM images
+                WHERE content_hash=? AND processing_status='done' AND preview_image IS NOT NULL LIMIT 1
+            ''', (stored["sha256"],)).fetchone()
+            if donor is None:
+                owner = cursor.execute('''
+                    SELECT image_id FROM processing_jobs
+                    WHERE status IN ('pending', 'running')
+                      AND image_id IN (SELECT id FROM images WHERE content_hash=?)
+                    LIMIT 1
+                ''', (stored["sha256"],)).fetchone()
+
+        if donor:
+            # Same bytes already processed: reuse the stored original and preview as is
+            cursor.execute(f'''
+                INSERT INTO images (id, name, filepath, date_added, theme, collection, {', '.join(DERIVED_COLUMNS)},
+                                    preview_image, processing_status, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' * len(DERIVED_COLUMNS))}, ?, 'done', ?)
+            ''', (new_id, name, duplicate_filepath, date_added, theme, collection,
+                  *(donor[column] for column in DERIVED_COLUMNS), donor["preview_image"], stored["sha256"]))
+        else:
+            cursor.execute('''
+                INSERT INTO images (id, name, filepath, date_added, theme, collection, processing_status, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)
+            ''', (new_id, name, duplicate_filepath if duplicate else filepath,
+                  date_added, theme, collection, stored["sha256"]))
+            # Same bytes still being processed: complete_derivative_job fills this row from that job
+            if owner is None:
+                derivative_queue.enqueue(conn, new_id, temp_path)
+        conn.commit()
+    return {"id": new_id, "duplicate": duplicate, "duplicate_filepath": duplicate_filepath, "reused": donor is not None,
+            "derivatives_from": owner["image_id"] if owner else None}
+
+@utilsAPIs.post("/upload")
+async def upload_photo(file: UploadFile = File(...), 
+                       theme: str = Form(...), 
+                       collection: str = Form(...)) -> dict:
+    """
     Upload a photo
 
     Parameters:
@@ -584,8 +2204,13 @@ def upload_photo(file: UploadFile = File(...),
     collection (str): Collection name
 
     Returns:
-    dict: Message indicating photo uploaded successfully
+    dict: Message indicating photo uploaded successfully; the preview and EXIF data
+        are generated in the background, see /photos/status/{photo_id}. Files whose
+        content is already stored reuse the existing original and preview.
     """
+    temp_path = None
+    with upload_stats_lock:
+        upload_stats["in_flight"] += 1
     try:
         # Create a unique filename
         file_ext = file.filename.split(".")[-1].lower()
@@ -596,79 +2221,300 @@ def upload_photo(file: UploadFile = File(...),
         temp_dir = tempfile.gettempdir()
         temp_path = os.path.join(temp_dir, filename)
         
-        print(f"Saving uploaded file to temp location: {temp_path}")
-        
-        # Save uploaded file to temp location
-        with open(temp_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        
-        # Verify the temp file exists
-        if not os.path.isfile(temp_path):
-            raise HTTPException(status_code=500, detail=f"Failed to save temporary file at {temp_path}")
-        
         # Define S3 path
         filepath = f"{theme}/{collection}/{filename}"
-        
-        # Upload original image
-        print(f"Uploading original image to S3 path: {filepath}")
-        s3_client.upload_file(temp_path, MINIO_BUCKET, filepath)
-        
-        # Extract EXIF data
-        exif = get_exif_data(temp_path)
-        
-        # Create preview image
-        preview_url = None
-        print("Attempting to create WebP preview")
-        preview_local = convert_to_webp(temp_path)
-        
-        if preview_local and os.path.isfile(preview_local):
-            try:
-                preview_filename = os.path.basename(preview_local)
-                preview_path = f"{theme}/{collection}/previews/{preview_filename}"
-                
-                print(f"Uploading WebP preview to S3 path: {preview_path}")
-                s3_client.upload_file(preview_local, MINIO_BUCKET, preview_path)
-                preview_url = f"{MINIO_BUCKET}/{preview_path}"
-                
-                print(f"Removing local WebP preview: {preview_local}")
-                os.remove(preview_local)
-                print(f"WebP preview removed successfully")
-            except Exception as e:
-                import traceback
-                error_details = traceback.format_exc()
-                print(f"Error handling WebP preview: {str(e)}\n{error_details}")
-        else:
-            print(f"Preview creation failed or file doesn't exist")
-        
-        # Clean up original temp file
+
+        # Spool the upload to the temp location, hashing it on the way
+        stored = await run_in_threadpool(spool_upload, file.file, temp_path)
+
+        # Decompression bombs are refused from the header before anything is stored
         try:
+            with span("pillow"):
+                cost = await run_in_threadpool(decode_cost, temp_path, (PREVIEW_MAX_DIMENSION, PREVIEW_MAX_DIMENSION))
+        except Image.DecompressionBombError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        # Refuse work the decode budget cannot take rather than queueing it behind thrashing workers
+        admit_upload(cost)
+
+        # Content already stored is recorded against the existing object instead of being uploaded again
+        existing = await run_in_threadpool(find_stored_content, [stored["sha256"]])
+        uploaded = stored["sha256"] not in existing
+        if uploaded:
+            print(f"Streaming original image to S3 path: {filepath}")
+            await storage.run(stream_to_s3, temp_path, filepath)
+        else:
+            filepath = existing[stored["sha256"]][0]
+
+        # Add record to database; EXIF and preview are filled in by the derivative queue
+        photo = await run_in_threadpool(record_upload, file.filename, theme, collection, filepath, temp_path, stored)
+
+        if photo["duplicate"] and uploaded:
+            # An identical upload stored its object first
+            print(f"Duplicate of {photo['duplicate_filepath']}, removing {filepath}")
+            await storage.delete(filepath)
+        if photo["reused"] or photo["derivatives_from"]:
             os.remove(temp_path)
-            print(f"Removed original temp file: {temp_path}")
-        except Exception as e:
-            print(f"Warning: Failed to remove temp file {temp_path}: {str(e)}")
-        
-        # Add record to database
-        date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        new_id = str(uuid4())
-        cursor.execute('''
-            INSERT INTO images (id, name, filepath, date_added, theme, collection, 
-                                camera_model, focal_length, exposure_time, iso, aperture, preview_image)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (new_id, file.filename, filepath, date_added, theme, collection, 
-              exif.get("camera_model"), exif.get("focal_length"), exif.get("exposure_time"), 
-              exif.get("iso"), exif.get("aperture"), preview_url))
-        conn.commit()
-        conn.close()
+        else:
+            derivative_queue.notify()
         
-        return {"message": "Photo uploaded successfully", "id": new_id}
+        with upload_stats_lock:
+            upload_stats["completed"] += 1
+            upload_stats["deduplicated"] += 1 if photo["duplicate"] else 0
+        return {"message": "Photo uploaded successfully", "id": photo["id"], "sha256": stored["sha256"],
+                "processing_status": "done" if photo["reused"] else "pending", "deduplicated": photo["duplicate"]}
+    except HTTPException:
+        with upload_stats_lock:
+            upload_stats["failed"] += 1
+        if temp_path and os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"Upload error: {str(e)}\n{error_details}")
+        with upload_stats_lock:
+            upload_stats["failed"] += 1
+        if temp_path and os.path.isfile(temp_path):
+            os.remove(temp_path)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        with upload_stats_lock:
+            upload_stats["in_flight"] -= 1
+
+MAX_BATCH_FILES = 500
+
+def find_stored_content(hashes:list) -> dict:
+    """
+    Look up content that is already stored and a processed photo of it
+
+    Parameters:
+    hashes (list): SHA-256 digests
+
+    Returns:
+    dict: sha256 -> (filepath of the stored original, row with the derived columns
+        and preview_image of a processed photo or None)
+    """
+    if not hashes:
+        return {}
+    placeholders = ', '.join('?' * len(hashes))
+    with get_db_connection() as conn:
+        blobs = conn.execute(f"SELECT sha256, filepath FROM blobs WHERE sha256 IN ({placeholders})",
+                             hashes).fetchall()
+        donors = conn.execute(f'''
+            SELECT content_hash, {', '.join(DERIVED_COLUMNS)}, preview_image FROM images
+            WHERE content_hash IN ({placeholders}) AND processing_status='done' AND preview_image IS NOT NULL
+        ''', hashes).fetchall()
+    donors = {donor["content_hash"]: donor for donor in donors}
+    return {blob["sha256"]: (blob["filepath"], donors.get(blob["sha256"])) for blob in blobs}
+
+async def derive_batch_file(image_path:str, cost:int, theme:str, collection:str) -> tuple:
+    """
+    Build the derivatives of one batch file on the batch process pool and upload its preview
+
+    Parameters:
+    image_path (str): Local path of the original image
+    cost (int): Decode memory to reserve, see decode_cost
+    theme (str): Theme name
+    collection (str): Collection name
+
+    Returns:
+    tuple: (EXIF and placeholder dict, preview_image value)
+    """
+    # Only as many files as there are workers hold decode memory; the rest wait here, not in the pool
+    async with batch_slots:
+        await run_in_threadpool(decode_budget.acquire, cost)
+        try:
+            exif, preview_local, timings = await asyncio.get_running_loop().run_in_executor(
+                batch_pool, build_derivatives, image_path)
+        finally:
+            decode_budget.release(cost)
+    for operation, seconds in timings.items():
+        IMAGE_SECONDS.observe(seconds, operation=operation)
+    preview_path = f"{theme}/{collection}/previews/{os.path.basename(preview_local)}"
+    try:
+        await storage.upload_file(preview_local, preview_path)
+    finally:
+        os.remove(preview_local)
+    return exif, f"{MINIO_BUCKET}/{preview_path}"
+
+def insert_batch(photos:list, blobs:list) -> None:
+    """
+    Insert the rows of a batch upload in one transaction
+
+    Parameters:
+    photos (list): (id, name, filepath, date_added, theme, collection, *DERIVED_COLUMNS,
+        preview_image, content_hash) tuples
+    blobs (list): (sha256, filepath, size, created_at, preview_image) tuples of newly processed content
+
+    Returns:
+    None
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO blobs (sha256, filepath, size, created_at, preview_image) VALUES (?, ?, ?, ?, ?)
+        ''', blobs)
+        # Content stored earlier but never processed gets the preview built here
+        cursor.executemany("UPDATE blobs SET preview_image=? WHERE sha256=? AND preview_image IS NULL",
+                           [(blob[4], blob[0]) for blob in blobs])
+        cursor.executemany(f'''
+            INSERT INTO images (id, name, filepath, date_added, theme, collection, {', '.join(DERIVED_COLUMNS)},
+                                preview_image, processing_status, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' * len(DERIVED_COLUMNS))}, ?, 'done', ?)
+        ''', photos)
+        conn.commit()
+
+@utilsAPIs.post("/upload/batch")
+async def upload_photo_batch(files: list[UploadFile] = File(...),
+                             theme: str = Form(...),
+                             collection: str = Form(...)) -> dict:
+    """
+    Upload many photos in one multipart request
+
+    Originals stream to MinIO concurrently. New content is processed on a
+    process pool and each preview is uploaded as soon as it is ready, while
+    content already stored reuses its original and preview. All rows are
+    inserted in one transaction, so the photos are listed complete with
+    their EXIF data and preview.
+
+    Parameters:
+    files (list[UploadFile]): Photo files, at most MAX_BATCH_FILES
+    theme (str): Theme name
+    collection (str): Collection name
+
+    Returns:
+    dict: Per-file results in request order (filename, id, status "uploaded" or "failed",
+        deduplicated, error), counts, seconds spent and throughput in files and bytes per second
+    """
+    if not files or len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Expected between 1 and {MAX_BATCH_FILES} files")
+    start = time.perf_counter()
+    temp_dir = tempfile.gettempdir()
+    items = []
+    for file in files:
+        filename = f"{uuid4()}.{file.filename.split('.')[-1].lower()}"
+        items.append({"file": file, "temp_path": os.path.join(temp_dir, filename),
+                      "filepath": f"{theme}/{collection}/{filename}", "error": None})
+    with upload_stats_lock:
+        upload_stats["in_flight"] += len(items)
+
+    async def spool(item:dict) -> None:
+        item["stored"] = await run_in_threadpool(spool_upload, item["file"].file, item["temp_path"])
+        # Decompression bombs are refused from the header before anything is stored
+        item["cost"] = await run_in_threadpool(decode_cost, item["temp_path"],
+                                               (PREVIEW_MAX_DIMENSION, PREVIEW_MAX_DIMENSION))
+
+    async def upload(item:dict) -> None:
+        try:
+            await storage.run(stream_to_s3, item["temp_path"], item["filepath"])
+            item["uploaded"] = True
+        except Exception as e:
+            item["error"] = str(e)
+
+    derived = {}
+    uploaded = []
+    try:
+        for item, outcome in zip(items, await asyncio.gather(*(spool(item) for item in items), return_exceptions=True)):
+            if isinstance(outcome, Exception):
+                item["error"] = str(outcome)
+        stored = [item for item in items if item["error"] is None]
+        # Files are decoded one per worker, so the batch fits if its largest file does
+        admit_upload(max((item["cost"] for item in stored), default=0))
+        existing = await run_in_threadpool(find_stored_content,
+                                           list({item["stored"]["sha256"] for item in stored}))
+
+        # Each distinct content is uploaded and processed once, by its first file; later copies and
+        # stored content share it
+        firsts = {}
+        owners = {}
+        for item in stored:
+            sha256 = item["stored"]["sha256"]
+            source, donor = existing.get(sha256, (None, None))
+            item["duplicate"] = source is not None or sha256 in firsts
+            item["first"] = firsts.setdefault(sha256, item)
+            item["source"] = source or item["first"]["filepath"]
+            if donor is None and sha256 not in owners:
+                owners[sha256] = item
+        new_content = [item for item in firsts.values() if item["stored"]["sha256"] not in existing]
+        print(f"Streaming {len(new_content)} new originals to S3 path: {theme}/{collection}/")
+        outcomes = await asyncio.gather(
+            asyncio.gather(*(upload(item) for item in new_content)),
+            asyncio.gather(*(derive_batch_file(item["temp_path"], item["cost"], theme, collection)
+                             for item in owners.values()), return_exceptions=True))
+        derived = dict(zip(owners, outcomes[1]))
+        for item in stored:
+            if item["first"]["error"] is not None:
+                item["error"] = item["first"]["error"]
+
+        date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        photos = []
+        blobs = []
+        for item in stored:
+            if item["error"] is not None:
+                continue
+            sha256 = item["stored"]["sha256"]
+            if sha256 in derived:
+                if isinstance(derived[sha256], Exception):
+                    item["error"] = str(derived[sha256])
+                    continue
+                exif, preview_image = derived[sha256]
+                values = [exif.get(column) for column in DERIVED_COLUMNS]
+                if owners[sha256] is item:
+                    blobs.append((sha256, item["filepath"], item["stored"]["size"], date_added, preview_image))
+            else:
+                donor = existing[sha256][1]
+                values = [donor[column] for column in DERIVED_COLUMNS]
+                preview_image = donor["preview_image"]
+            item["id"] = str(uuid4())
+            photos.append((item["id"], item["file"].filename, item["source"], date_added, theme, collection,
+                           *values, preview_image, sha256))
+        if photos:
+            await run_in_threadpool(insert_batch, photos, blobs)
+        uploaded = [item for item in stored if item["error"] is None]
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        print(f"Batch upload error: {str(e)}\n{traceback.format_exc()}")
+        await storage.delete_many([item["filepath"] for item in items if item.get("uploaded")]
+                                  + [object_key(value[1]) for value in derived.values() if not isinstance(value, Exception)])
+        raise HTTPException(status_code=500, detail=f"Batch upload failed: {str(e)}")
+    finally:
+        for item in items:
+            if os.path.isfile(item["temp_path"]):
+                os.remove(item["temp_path"])
+        with upload_stats_lock:
+            upload_stats["in_flight"] -= len(items)
+
+    # Originals of failed files are not referenced by any row
+    referenced = {item["source"] for item in uploaded}
+    unreferenced = [item["filepath"] for item in items if item.get("uploaded") and item["filepath"] not in referenced]
+    if unreferenced:
+        print(f"Removing {len(unreferenced)} failed originals")
+        await storage.delete_many(unreferenced)
+
+    seconds = time.perf_counter() - start
+    size = sum(item["stored"]["size"] for item in uploaded)
+    deduplicated = sum(item["duplicate"] for item in uploaded)
+    with upload_stats_lock:
+        upload_stats["completed"] += len(uploaded)
+        upload_stats["failed"] += len(items) - len(uploaded)
+        upload_stats["deduplicated"] += deduplicated
+    return {
+        "uploaded": len(uploaded),
+        "failed": len(items) - len(uploaded),
+        "deduplicated": deduplicated,
+        "seconds": round(seconds, 3),
+        "files_per_second": round(len(uploaded) / seconds, 2),
+        "bytes_per_second": round(size / seconds),
+        "results": [{
+            "filename": item["file"].filename,
+            "id": item.get("id") if item["error"] is None else None,
+            "status": "uploaded" if item["error"] is None else "failed",
+            "deduplicated": item.get("duplicate", False) if item["error"] is None else False,
+            "error": item["error"]
+        } for item in items]
+    }
 
 @utilsAPIs.put("/edit/{photo_id}")
 def edit_photo(photo_id: str, photo: PhotoUpdate) -> dict[str, str]:
@@ -682,16 +2528,19 @@ def edit_photo(photo_id: str, photo: PhotoUpdate) -> dict[str, str]:
     Returns:
     dict: Message indicating photo updated successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE images SET name=?, theme=?, collection=?, favourite=?,
-                          camera_model=?, focal_length=?, exposure_time=?, iso=?, aperture=?
-        WHERE id=?
-    ''', (photo.name, photo.theme, photo.collection, photo.favourite,
-          photo.camera_model, photo.focal_length, photo.exposure_time, photo.iso, photo.aperture, photo_id))
-    conn.commit()
-    conn.close()
+    # Keep the typed columns used for filtering in step with the edited display values
+    typed = typed_exif_from_text(photo.focal_length, photo.exposure_time, photo.iso, photo.aperture)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE images SET name=?, theme=?, collection=?, favourite=?,
+                              camera_model=?, focal_length=?, exposure_time=?, iso=?, aperture=?,
+                              focal_length_mm=?, f_number=?, exposure_seconds=?, iso_speed=?
+            WHERE id=?
+        ''', (photo.name, photo.theme, photo.collection, photo.favourite,
+              photo.camera_model, photo.focal_length, photo.exposure_time, photo.iso, photo.aperture,
+              typed["focal_length_mm"], typed["f_number"], typed["exposure_seconds"], typed["iso_speed"], photo_id))
+        conn.commit()
     return {"message": "Photo updated successfully"}
 
 @utilsAPIs.delete("/delete/{photo_id}")
@@ -705,17 +2554,188 @@ def delete_photo(photo_id: str) -> dict[str, str]:
     Returns:
     dict: Message indicating photo deleted successfully
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE images SET status='inactive' WHERE id=?", (photo_id,))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE images SET status='inactive' WHERE id=?", (photo_id,))
+        conn.commit()
     return {"message": "Photo deleted successfully"}
 #endregion
 
+#region Jobs
+DERIVATIVE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+BATCH_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+batch_pool = None  # process pool for batch uploads, started with the app
+batch_slots = asyncio.Semaphore(BATCH_WORKERS)
+
+def prepare_derivative_job(job:dict) -> tuple:
+    """
+    Make sure the original is on local disk, downloading it from MinIO if the spooled copy is gone
+
+    Parameters:
+    job (dict): Job with image_id and local_path
+
+    Returns:
+    tuple: Arguments for build_derivatives
+    """
+    local_path = job["local_path"]
+    if local_path and os.path.isfile(local_path):
+        return (local_path,)
+    with get_db_connection() as conn:
+        photo = conn.execute("SELECT filepath FROM images WHERE id=?", (job["image_id"],)).fetchone()
+    if photo is None:
+        raise RuntimeError(f"Photo {job['image_id']} no longer exists")
+    local_path = os.path.join(tempfile.gettempdir(), os.path.basename(photo["filepath"]))
+    print(f"Downloading original for {job['image_id']} to {local_path}")
+    s3_client.download_file(MINIO_BUCKET, object_key(photo["filepath"]), local_path)
+    job["local_path"] = local_path
+    return (local_path,)
+
+# Duplicates uploaded while a job for the same content was pending have no job of their own (see
+# record_upload); the job's result or failure applies to them too. Parameters: the job's image id, twice.
+JOB_FOLLOWERS = '''
+    content_hash=(SELECT content_hash FROM images WHERE id=?) AND id<>?
+    AND processing_status IN ('pending', 'processing') AND id NOT IN (SELECT image_id FROM processing_jobs)
+'''
+
+def complete_derivative_job(job:dict, result:tuple) -> None:
+    """
+    Upload the preview and store EXIF data for a processed photo
+
+    Parameters:
+    job (dict): Finished job
+    result (tuple): Return value of build_derivatives
+
+    Returns:
+    None
+    """
+    exif, preview_local, timings = result
+    for operation, seconds in timings.items():
+        IMAGE_SECONDS.observe(seconds, operation=operation)
+    with get_db_connection() as conn:
+        photo = conn.execute("SELECT filepath, theme, collection FROM images WHERE id=?", (job["image_id"],)).fetchone()
+    try:
+        preview_path = f"{photo['theme']}/{photo['collection']}/previews/{os.path.basename(preview_local)}"
+        print(f"Uploading WebP preview to S3 path: {preview_path}")
+        s3_client.upload_file(preview_local, MINIO_BUCKET, preview_path)
+    finally:
+        os.remove(preview_local)
+    with get_db_connection() as conn:
+        conn.execute(f'''
+            UPDATE images SET {', '.join(f"{column}=?" for column in DERIVED_COLUMNS)},
+                              preview_image=?, processing_status='done'
+            WHERE id=? OR ({JOB_FOLLOWERS})
+        ''', (*(exif.get(column) for column in DERIVED_COLUMNS), f"{MINIO_BUCKET}/{preview_path}",
+              job["image_id"], job["image_id"], job["image_id"]))
+        conn.execute('''
+            UPDATE blobs SET preview_image=?
+            WHERE sha256=(SELECT content_hash FROM images WHERE id=?) AND preview_image IS NULL
+        ''', (f"{MINIO_BUCKET}/{preview_path}", job["image_id"]))
+        conn.commit()
+    remove_spooled_original(job)
+
+def remove_spooled_original(job:dict, error:Exception=None) -> None:
+    """
+    Remove the local copy of the original once it is no longer needed
+
+    Parameters:
+    job (dict): Finished or abandoned job
+    error (Exception): Failure reason, if the job gave up
+
+    Returns:
+    None
+    """
+    local_path = job["local_path"]
+    if local_path and os.path.isfile(local_path):
+        os.remove(local_path)
+        print(f"Removed original temp file: {local_path}")
+
+def fail_derivative_job(job:dict, error:Exception) -> None:
+    """
+    Mark the duplicates waiting on a job that gave up as failed and remove its local original
+
+    Parameters:
+    job (dict): Abandoned job
+    error (Exception): Failure reason
+
+    Returns:
+    None
+    """
+    with get_db_connection() as conn:
+        conn.execute(f"UPDATE images SET processing_status='failed' WHERE {JOB_FOLLOWERS}",
+                     (job["image_id"], job["image_id"]))
+        conn.commit()
+    remove_spooled_original(job, error)
+
+derivative_queue = JobQueue(
+    get_db_connection,
+    prepare=prepare_derivative_job,
+    work=build_derivatives,
+    complete=complete_derivative_job,
+    fail=fail_derivative_job,
+    workers=DERIVATIVE_WORKERS,
+    budget=decode_budget,
+    # Previews dominate a job's memory; EXIF reads only the header and the placeholder decodes at 1/8 scale
+    cost=lambda image_path: decode_cost(image_path, (PREVIEW_MAX_DIMENSION, PREVIEW_MAX_DIMENSION))
+)
+#endregion
+
+#region Metrics
+THREADPOOL_TOKENS = gauge("threadpool_threads", "Request threadpool capacity and threads in use", ("state",))
+THREADPOOL_WAITING = gauge("threadpool_queue_depth", "Sync handlers waiting for a threadpool thread")
+gauge("uploads_in_flight", "Uploads currently being received or stored",
+      collect=lambda: {(): upload_stats["in_flight"]})
+gauge("s3_storage_calls", "Calls on the S3 storage thread pool", ("state",),
+      collect=lambda: {("in_flight",): storage.stats()["in_flight"], ("queued",): storage.stats()["queued"]})
+gauge("decode_budget_bytes", "Decoded image memory reserved and available", ("state",),
+      collect=lambda: {("used",): decode_budget.stats()["used_bytes"], ("max",): decode_budget.max_bytes})
+gauge("derivative_jobs_deferred", "Claimed derivative jobs waiting for decode memory",
+      collect=lambda: {(): derivative_queue.deferred})
+gauge("preview_cache_bytes", "Size of the local preview cache",
+      collect=lambda: {(): preview_cache.stats()["bytes"]} if preview_cache else {})
+gauge("sqlite_pool_connections", "Pooled SQLite connections", ("state",),
+      collect=lambda: {(state,): db_pool.stats()[state] for state in ("open", "in_use", "idle")})
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    """
+    Expose metrics in the Prometheus text format
+
+    Parameters:
+    None
+
+    Returns:
+    PlainTextResponse: Request, SQLite, S3, Pillow, threadpool and upload metrics
+    """
+    # The threadpool limiter is only reachable from the event loop, so sample it here
+    limiter = anyio.to_thread.current_default_thread_limiter().statistics()
+    THREADPOOL_TOKENS.set(limiter.total_tokens, state="capacity")
+    THREADPOOL_TOKENS.set(limiter.borrowed_tokens, state="busy")
+    THREADPOOL_WAITING.set(limiter.tasks_waiting)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+#endregion
+
 #region APIsRouter
+@app.on_event("startup")
+def migrate_db() -> None:
+    with get_db_connection() as conn:
+        apply_migrations(conn)
+    derivative_queue.start()
+    threadpool_size = anyio.to_thread.current_default_thread_limiter().total_tokens
+    db_pool.max_size = max(db_pool.max_size, int(threadpool_size) + DB_POOL_EXTRA)
+    global batch_pool
+    batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+
+@app.on_event("shutdown")
+def close_db_pool() -> None:
+    derivative_queue.stop()
+    if batch_pool is not None:
+        batch_pool.shutdown(wait=True)
+    storage.close()
+    db_pool.close_all()
+
 app.include_router(themesAPIs, tags=["Themes"])
 app.include_router(collectionsAPIs, tags=["Collections"])
 app.include_router(photosAPIs, tags=["Photos"])
+app.include_router(galleryAPIs, tags=["Gallery"])
 app.include_router(utilsAPIs, tags=["Utils"])
 #endregion
\ No newline at end of file
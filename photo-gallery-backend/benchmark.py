@@ -0,0 +1,607 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import re
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from PIL import Image, ExifTags
+
+# Synthetic catalog shape
+THEMES = 10
+COLLECTIONS_PER_THEME = 10
+DISTINCT_ORIGINALS = 50   # generated JPEGs shared by all rows through the blobs table
+WORDS = ["sunset", "beach", "mountain", "forest", "city", "night", "portrait", "river", "snow", "desert",
+         "harbor", "bridge", "street", "garden", "storm", "lake", "market", "temple", "field", "coast"]
+CAMERAS = ["Canon EOS R5", "Nikon Z6", "Sony A7 III", "Fujifilm X-T4", "Leica Q2"]
+FOCAL_LENGTHS = [14.0, 24.0, 35.0, 50.0, 85.0, 135.0, 200.0]
+F_NUMBERS = [1.4, 1.8, 2.8, 4.0, 5.6, 8.0, 11.0]
+ISO_SPEEDS = [100, 200, 400, 800, 1600, 3200, 6400]
+EXPOSURES = [1 / 2000, 1 / 500, 1 / 250, 1 / 60, 1 / 15, 0.5]
+SERIALIZE_ROWS = 10000   # rows per serialization micro-benchmark call
+
+def percentile(sorted_values:list, fraction:float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+
+    Parameters:
+    sorted_values (list): Sorted samples
+    fraction (float): Percentile between 0 and 1
+
+    Returns:
+    float: Sample at the percentile, None for no samples
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def summarize(latencies:list, elapsed:float, errors:int) -> dict:
+    """
+    Summarize latency samples in milliseconds
+
+    Parameters:
+    latencies (list): Latencies in seconds
+    elapsed (float): Wall time of the run in seconds
+    errors (int): Failed calls
+
+    Returns:
+    dict: Sample count, errors, p50/p95/p99/mean/max in ms and throughput per second
+    """
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else None,
+    }
+
+def make_jpeg(width:int, height:int, rng:random.Random) -> bytes:
+    """
+    Generate a noisy JPEG with camera EXIF tags
+
+    Parameters:
+    width (int): Image width
+    height (int): Image height
+    rng (random.Random): Random source
+
+    Returns:
+    bytes: JPEG file contents
+    """
+    img = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    exif = img.getexif()
+    exif[ExifTags.Base.Model] = rng.choice(CAMERAS)
+    exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    exif_ifd[ExifTags.Base.FocalLength] = rng.choice(FOCAL_LENGTHS)
+    exif_ifd[ExifTags.Base.FNumber] = rng.choice(F_NUMBERS)
+    exif_ifd[ExifTags.Base.ISOSpeedRatings] = rng.choice(ISO_SPEEDS)
+    exif_ifd[ExifTags.Base.ExposureTime] = rng.choice(EXPOSURES)
+    exif_ifd[ExifTags.Base.DateTimeOriginal] = f"20{rng.randint(10, 24)}:{rng.randint(1, 12):02}:{rng.randint(1, 28):02} 12:00:00"
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+def seed_catalog(conn:sqlite3.Connection, s3_client, bucket:str, rows:int, image_size:tuple, seed:int) -> dict:
+    """
+    Fill an empty database and bucket with a synthetic catalog
+
+    Parameters:
+    conn (sqlite3.Connection): Migrated, empty database
+    s3_client: Blocking S3 client
+    bucket (str): Bucket name
+    rows (int): Number of photos
+    image_size (tuple): (width, height) of the generated originals
+    seed (int): Random seed
+
+    Returns:
+    dict: Names and ids used to build benchmark requests
+    """
+    rng = random.Random(seed)
+    themes = [f"Theme{t:02}" for t in range(THEMES)]
+    collections = [(theme, f"Collection{c:02}") for theme in themes for c in range(COLLECTIONS_PER_THEME)]
+
+    originals = []
+    for i in range(DISTINCT_ORIGINALS):
+        data = make_jpeg(*image_size, rng)
+        key = f"bench/originals/{i}.jpg"
+        preview_key = f"bench/previews/{i}.webp"
+        s3_client.put_object(Bucket=bucket, Key=key, Body=data)
+        s3_client.put_object(Bucket=bucket, Key=preview_key, Body=data)
+        originals.append((f"{i:064x}", key, f"{bucket}/{preview_key}", len(data)))
+    conn.executemany("INSERT INTO blobs (sha256, filepath, preview_image, size, created_at) VALUES (?, ?, ?, ?, '2024-01-01 00:00:00')",
+                     originals)
+    conn.executemany("INSERT INTO themes (id, name, preview_image, status) VALUES (?, ?, ?, 'active')",
+                     [(str(uuid4()), theme, originals[i % DISTINCT_ORIGINALS][2]) for i, theme in enumerate(themes)])
+    conn.executemany("INSERT INTO collections (id, name, theme, preview_image, status) VALUES (?, ?, ?, ?, 'active')",
+                     [(str(uuid4()), collection, theme, originals[i % DISTINCT_ORIGINALS][2])
+                      for i, (theme, collection) in enumerate(collections)])
+
+    start = datetime(2020, 1, 1)
+    photo_ids = []
+    batch = []
+    for i in range(rows):
+        theme, collection = collections[i % len(collections)]
+        sha256, key, preview, _ = originals[i % DISTINCT_ORIGINALS]
+        focal, f_number, iso = rng.choice(FOCAL_LENGTHS), rng.choice(F_NUMBERS), rng.choice(ISO_SPEEDS)
+        exposure = rng.choice(EXPOSURES)
+        photo_id = str(uuid4())
+        if len(photo_ids) < 1000:
+            photo_ids.append(photo_id)
+        batch.append((photo_id, f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}.jpg", key,
+                      (start + timedelta(seconds=i * 60)).strftime("%Y-%m-%d %H:%M:%S"), theme, collection,
+                      int(rng.random() < 0.05), rng.choice(CAMERAS), f"{focal:g}", f"1/{round(1 / exposure)}"
+                      if exposure < 1 else f"{exposure:g}", str(iso), f"{f_number:g}", preview,
+                      focal, f_number, exposure, iso,
+                      f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02} 12:00:00",
+                      *image_size, sha256))
+        if len(batch) >= 10000 or i == rows - 1:
+            conn.executemany('''
+                INSERT INTO images (id, name, filepath, date_added, theme, collection, favourite, camera_model,
+                                    focal_length, exposure_time, iso, aperture, preview_image,
+                                    focal_length_mm, f_number, exposure_seconds, iso_speed, taken_at,
+                                    width, height, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            batch = []
+    conn.commit()
+    conn.execute("ANALYZE")
+    return {"themes": themes, "collections": collections, "photo_ids": photo_ids,
+            "upload": make_jpeg(*image_size, rng), "sample_original": "bench/originals/0.jpg"}
+
+def endpoint_cases(catalog:dict, rng:random.Random) -> list:
+    """
+    Requests exercised per router
+
+    Parameters:
+    catalog (dict): Return value of seed_catalog
+    rng (random.Random): Random source
+
+    Returns:
+    list: (router, name, request factory) where the factory returns (method, url, kwargs)
+    """
+    def photo():
+        return rng.choice(catalog["photo_ids"])
+    def collection():
+        return rng.choice(catalog["collections"])
+
+    return [
+        ("themesAPIs", "GET /themes/", lambda: ("GET", "/themes/", {})),
+        ("collectionsAPIs", "GET /collections/", lambda: ("GET", "/collections/", {})),
+        ("collectionsAPIs", "GET /collections/{theme}", lambda: ("GET", f"/collections/{rng.choice(catalog['themes'])}", {})),
+        ("galleryAPIs", "GET /gallery/overview", lambda: ("GET", "/gallery/overview", {})),
+        ("photosAPIs", "GET /photos/theme/{theme}/collection/{collection}?limit=50",
+         lambda: ("GET", "/photos/theme/{}/collection/{}?limit=50".format(*collection()), {})),
+        ("photosAPIs", "GET /photos/search?q=", lambda: ("GET", f"/photos/search?q={rng.choice(WORDS)}&limit=50", {})),
+        ("photosAPIs", "GET /photos/search?focal_min=&iso_min=",
+         lambda: ("GET", f"/photos/search?focal_min={rng.choice(FOCAL_LENGTHS)}&iso_min={rng.choice(ISO_SPEEDS)}&limit=50", {})),
+        ("photosAPIs", "GET /photos/search?taken_after=&taken_before= (one day)",
+         lambda: ("GET", "/photos/search?taken_after={0}&taken_before={0}%2023:59:59&limit=50".format(
+             f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}"), {})),
+        ("photosAPIs", "GET /photos/detail/{photo_id}", lambda: ("GET", f"/photos/detail/{photo()}", {})),
+        ("photosAPIs", "GET /photos/status/{photo_id}", lambda: ("GET", f"/photos/status/{photo()}", {})),
+        ("photosAPIs", "GET /photos/download/{photo_id}", lambda: ("GET", f"/photos/download/{photo()}", {})),
+        ("photosAPIs", "GET /photos/{photo_id}/preview", lambda: ("GET", f"/photos/{photo()}/preview", {})),
+        ("photosAPIs", "GET /photos/{photo_id}/render?w=320",
+         lambda: ("GET", f"/photos/{photo()}/render?w=320", {"headers": {"Accept": "image/webp"}})),
+        ("utilsAPIs", "GET /utils/favorites?limit=50", lambda: ("GET", "/utils/favorites?limit=50", {})),
+        ("utilsAPIs", "PUT /utils/favorite/{photo_id}",
+         lambda: ("PUT", f"/utils/favorite/{photo()}?favorite={rng.choice(['true', 'false'])}", {})),
+        ("utilsAPIs", "PUT /utils/bulk/favorite",
+         lambda: ("PUT", "/utils/bulk/favorite", {"json": {"ids": rng.sample(catalog["photo_ids"], 100), "favourite": True}})),
+        ("utilsAPIs", "POST /utils/upload",
+         # Trailing bytes after the JPEG end marker make every upload a new original instead of a duplicate
+         lambda: ("POST", "/utils/upload", {"files": {"file": ("bench.jpg", catalog["upload"] + uuid4().bytes, "image/jpeg")},
+                                            "data": {"theme": catalog["themes"][0], "collection": "Uploads"}})),
+        ("utilsAPIs", "POST /utils/upload/batch (10 files)",
+         lambda: ("POST", "/utils/upload/batch", {
+             "files": [("files", (f"bench{i}.jpg", catalog["upload"] + uuid4().bytes, "image/jpeg")) for i in range(10)],
+             "data": {"theme": catalog["themes"][0], "collection": "Uploads"}})),
+    ]
+
+def explain_cases(catalog:dict, rng:random.Random) -> list:
+    """
+    Requests checked by --explain on top of endpoint_cases, for query shapes the load run leaves out
+
+    Parameters:
+    catalog (dict): Return value of seed_catalog
+    rng (random.Random): Random source
+
+    Returns:
+    list: (router, name, request factory) like endpoint_cases
+    """
+    theme, collection = catalog["collections"][0]
+    return [
+        ("photosAPIs", "GET /photos/?limit=50", lambda: ("GET", "/photos/?limit=50", {})),
+        ("photosAPIs", "GET /photos/theme/{theme}/collection/{collection} (NDJSON)",
+         lambda: ("GET", f"/photos/theme/{theme}/collection/{collection}?limit=50",
+                  {"headers": {"Accept": "application/x-ndjson"}})),
+        ("photosAPIs", "GET /photos/search?q=&iso_min=",
+         lambda: ("GET", f"/photos/search?q={rng.choice(WORDS)}&iso_min=3200&limit=50", {})),
+        ("photosAPIs", "GET /photos/search?camera_model=&focal_min=",
+         lambda: ("GET", f"/photos/search?camera_model={rng.choice(CAMERAS)}&focal_min=135&limit=50", {})),
+        ("photosAPIs", "GET /photos/search?theme=&collection=",
+         lambda: ("GET", f"/photos/search?theme={theme}&collection={collection}&limit=50", {})),
+    ]
+
+# A step walking images, with or without an index; only SEARCH steps, which seek by key, pass
+IMAGES_SCAN = re.compile(r"^SCAN images\b")
+
+def normalize_sql(sql:str) -> str:
+    """
+    Replace the literals of an expanded statement with placeholders, so repeated requests group together
+
+    Parameters:
+    sql (str): Statement as passed to a trace callback
+
+    Returns:
+    str: Statement with ? for string and number literals, on one line
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", sql)
+    return " ".join(sql.split())
+
+def explain_queries(client, db_file:str, statements:list, cases:list) -> dict:
+    """
+    Send every request once, following X-Next-Cursor to a second page, and get the plan of each
+    statement the endpoints ran
+
+    Parameters:
+    client (TestClient): Client bound to the app
+    db_file (str): Database the app uses
+    statements (list): Filled with executed SQL by the connection pool's trace callback
+    cases (list): (router, name, request factory)
+
+    Returns:
+    dict: Normalized statement -> {"endpoints", "plan"}
+    """
+    plans = {}
+    conn = sqlite3.connect(db_file)
+    for _, name, factory in cases:
+        del statements[:]
+        method, url, kwargs = factory()
+        response = client.request(method, url, **kwargs)
+        if response.headers.get("X-Next-Cursor"):
+            separator = "&" if "?" in url else "?"
+            client.request(method, f"{url}{separator}cursor={response.headers['X-Next-Cursor']}", **kwargs)
+        for sql in list(statements):
+            if sql.split(None, 1)[0].upper() not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+                continue
+            entry = plans.setdefault(normalize_sql(sql), {"endpoints": [], "plan": None})
+            if name not in entry["endpoints"]:
+                entry["endpoints"].append(name)
+            if entry["plan"] is None:
+                entry["plan"] = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    conn.close()
+    return plans
+
+def read_generations(db_file:str) -> dict:
+    """
+    Read every catalog generation counter
+
+    Parameters:
+    db_file (str): Database the app uses
+
+    Returns:
+    dict: Scope -> generation
+    """
+    conn = sqlite3.connect(db_file)
+    generations = dict(conn.execute("SELECT scope, generation FROM catalog_generations").fetchall())
+    conn.close()
+    return generations
+
+def check_bulk_generations(client, db_file:str, catalog:dict) -> list:
+    """
+    Send each bulk write once and check it advanced the generation of every scope it changed by exactly 1
+
+    Parameters:
+    client (TestClient): Client bound to the app
+    db_file (str): Database the app uses
+    catalog (dict): Return value of seed_catalog
+
+    Returns:
+    list: One line per failed call, empty if all passed
+    """
+    theme, collection = catalog["collections"][0]
+    ids = catalog["photo_ids"][:200]
+    cases = [
+        ("PUT /utils/bulk/favorite", "PUT", "/utils/bulk/favorite", {"ids": ids, "favourite": True}),
+        ("PUT /utils/bulk/move", "PUT", "/utils/bulk/move", {"ids": ids, "theme": theme, "collection": collection}),
+        ("PUT /utils/bulk/edit", "PUT", "/utils/bulk/edit", {"ids": ids, "camera_model": "Bulk Check"}),
+        ("POST /utils/bulk/delete", "POST", "/utils/bulk/delete", {"ids": ids[:100]}),
+    ]
+    failures = []
+    conn = sqlite3.connect(db_file)
+    for name, method, url, body in cases:
+        rows = conn.execute(f"SELECT theme, collection, favourite, status FROM images WHERE id IN ({', '.join('?' * len(body['ids']))})",
+                            body["ids"]).fetchall()
+        expected = set()
+        for old_theme, old_collection, favourite, status in rows:
+            new_theme, new_collection = body.get("theme", old_theme), body.get("collection", old_collection)
+            new_status = "inactive" if "delete" in url else status
+            expected.add(json.dumps(["collection", old_theme, old_collection], separators=(",", ":")))
+            expected.add(json.dumps(["collection", new_theme, new_collection], separators=(",", ":")))
+            if favourite or body.get("favourite"):
+                expected.add('["favorites"]')
+            if (old_theme, old_collection, status) != (new_theme, new_collection, new_status):
+                expected.add('["gallery"]')
+        before = read_generations(db_file)
+        response = client.request(method, url, json=body)
+        after = read_generations(db_file)
+        advanced = {scope: after[scope] - before.get(scope, 0) for scope in after if after[scope] != before.get(scope, 0)}
+        if response.status_code != 200 or set(advanced) != expected or any(step != 1 for step in advanced.values()):
+            failures.append(f"{name}: status {response.status_code}, advanced {advanced}, expected +1 on {sorted(expected)}")
+    conn.close()
+    return failures
+
+def run_endpoint(client, factory, requests:int, concurrency:int, warmup:int) -> dict:
+    """
+    Issue requests from a thread pool and measure each one
+
+    Parameters:
+    client (TestClient): Client bound to the app
+    factory (Callable): Returns (method, url, kwargs) for the next request
+    requests (int): Measured requests
+    concurrency (int): Requests in flight at once
+    warmup (int): Unmeasured requests sent first
+
+    Returns:
+    dict: summarize() of the measured requests
+    """
+    def call(_):
+        method, url, kwargs = factory()
+        begin = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        return time.perf_counter() - begin, response.status_code >= 400
+
+    for i in range(warmup):
+        call(i)
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - begin
+    return summarize([latency for latency, _ in results], elapsed, sum(failed for _, failed in results))
+
+def run_micro(fn, iterations:int) -> dict:
+    """
+    Time a function call repeatedly on one thread
+
+    Parameters:
+    fn (Callable): Function without arguments
+    iterations (int): Number of calls
+
+    Returns:
+    dict: summarize() of the calls
+    """
+    latencies = []
+    errors = 0
+    begin = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - begin, errors)
+
+def micro_benchmarks(apis, catalog:dict, work_dir:str, iterations:int) -> dict:
+    """
+    Micro-benchmarks of the image, URL and row serialization helpers
+
+    Parameters:
+    apis (module): Imported API module
+    catalog (dict): Return value of seed_catalog
+    work_dir (str): Scratch directory
+    iterations (int): Calls per benchmark
+
+    Returns:
+    dict: Benchmark name -> summarize() result
+    """
+    from fastapi.encoders import jsonable_encoder
+    from imaging import convert_to_webp, get_exif_data, render_variant
+
+    source = os.path.join(work_dir, "micro.jpg")
+    with open(source, "wb") as f:
+        f.write(catalog["upload"])
+
+    def webp():
+        os.remove(convert_to_webp(source))
+
+    def presign_cold():
+        apis.presigned_url_cache.clear()
+        apis.generate_presigned_url(catalog["sample_original"])
+
+    # Serialization of SERIALIZE_ROWS listing rows, fetched once so only mapping and encoding is timed
+    with apis.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM images WHERE status='active' LIMIT ?", (SERIALIZE_ROWS,))
+        full_rows = cursor.fetchall()
+        cursor.execute(f"SELECT {', '.join(apis.PHOTO_FIELDS)} FROM images WHERE status='active' LIMIT ?",
+                       (SERIALIZE_ROWS,))
+        projected_rows = cursor.fetchall()
+    repeat = -(-SERIALIZE_ROWS // max(len(full_rows), 1))
+    full_rows = (full_rows * repeat)[:SERIALIZE_ROWS]
+    projected_rows = (projected_rows * repeat)[:SERIALIZE_ROWS]
+
+    def serialize_legacy():
+        # Per-column dict literals encoded the way FastAPI's default JSONResponse does
+        photos = [{field: (apis.generate_presigned_url(row["preview_image"]) if field == "preview_image" else row[field])
+                   for field in apis.PHOTO_FIELDS} for row in full_rows]
+        json.dumps(jsonable_encoder(photos), ensure_ascii=False, separators=(",", ":")).encode()
+
+    def serialize_projected():
+        to_dict = apis.row_mapper(apis.PHOTO_FIELDS)
+        apis.json_dumps([to_dict(row) for row in projected_rows])
+
+    serialize_iterations = max(iterations // 20, 5)
+    return {
+        "convert_to_webp": run_micro(webp, iterations),
+        "get_exif_data": run_micro(lambda: get_exif_data(source), iterations),
+        "render_variant 320px": run_micro(lambda: render_variant(source, 320, None, "webp"), iterations),
+        "generate_presigned_url (cold)": run_micro(presign_cold, iterations),
+        "generate_presigned_url (cached)": run_micro(lambda: apis.generate_presigned_url(catalog["sample_original"]),
+                                                     iterations),
+        f"serialize {SERIALIZE_ROWS} rows (legacy)": run_micro(serialize_legacy, serialize_iterations),
+        f"serialize {SERIALIZE_ROWS} rows (row_mapper)": run_micro(serialize_projected, serialize_iterations),
+    }
+
+def compare(current:dict, baseline_path:str) -> None:
+    """
+    Print the p50/p95 change of every benchmark against an earlier results file
+
+    Parameters:
+    current (dict): Results of this run
+    baseline_path (str): Earlier JSON results
+
+    Returns:
+    None
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for section in ("endpoints", "micro"):
+        for name, result in current[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before or not before.get("p50_ms") or not result.get("p50_ms"):
+                continue
+            print(f"{name:62} p50 {before['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} ms "
+                  f"({(result['p50_ms'] / before['p50_ms'] - 1) * 100:+6.1f}%)  "
+                  f"p95 {before['p95_ms']:9.3f} -> {result['p95_ms']:9.3f} ms")
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load and micro-benchmarks for the photo gallery API")
+    parser.add_argument("--rows", type=int, default=10000, help="Photos in the synthetic catalog (10k-1M)")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint")
+    parser.add_argument("--micro-iterations", type=int, default=200, help="Calls per micro-benchmark")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(1600, 1200), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--s3", choices=("moto", "minio"), default="moto",
+                        help="In-process S3 stand-in (moto) or the MinIO server configured in apis.py")
+    parser.add_argument("--only", help="Run only endpoints whose name contains this text")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Results file (default benchmark-<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--explain", action="store_true",
+                        help="Instead of benchmarking, check that no statement an endpoint runs scans the images table")
+    parser.add_argument("--check-generations", action="store_true",
+                        help="Instead of benchmarking, check that one bulk write bumps each catalog generation once")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # The API opens images.db relative to the working directory
+    work_dir = tempfile.mkdtemp(prefix="photo-gallery-bench-")
+    os.chdir(work_dir)
+
+    if args.s3 == "moto":
+        try:
+            from moto import mock_aws
+        except ImportError:
+            sys.exit("The in-process S3 stand-in needs moto: pip install moto")
+        mock_aws().start()
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        sys.exit("The load benchmarks need httpx: pip install httpx")
+
+    import boto3
+    import apis
+    from migrations import apply_migrations
+    from disk_cache import DiskLRUCache
+    if args.s3 == "moto":
+        apis.s3_client = apis.storage.client = boto3.client("s3", region_name="us-east-1")
+    try:
+        apis.s3_client.create_bucket(Bucket=apis.MINIO_BUCKET)
+    except apis.s3_client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    if apis.preview_cache is not None:
+        # Start every run with a cold preview cache
+        apis.preview_cache = DiskLRUCache(os.path.join(work_dir, "previews"), apis.PREVIEW_CACHE_MAX_BYTES)
+
+    print(f"Seeding {args.rows} photos in {work_dir}")
+    begin = time.perf_counter()
+    conn = sqlite3.connect(apis.DB_FILE)
+    apply_migrations(conn)
+    catalog = seed_catalog(conn, apis.s3_client, apis.MINIO_BUCKET, args.rows, tuple(args.image_size), args.seed)
+    conn.close()
+    print(f"Seeded in {time.perf_counter() - begin:.1f}s")
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "endpoints": {},
+        "micro": {},
+    }
+
+    rng = random.Random(args.seed)
+    if args.explain:
+        statements = []
+        apis.db_pool.close_all()
+        apis.db_pool.trace_callback = statements.append
+        with TestClient(apis.app) as client:
+            plans = explain_queries(client, apis.DB_FILE, statements,
+                                    endpoint_cases(catalog, rng) + explain_cases(catalog, rng))
+        scans = {sql: entry for sql, entry in plans.items() if any(IMAGES_SCAN.match(step) for step in entry["plan"])}
+        for sql, entry in plans.items():
+            print(f"{'SCAN' if sql in scans else 'ok':9} {sql}\n          {entry['plan']}\n"
+                  f"          from {', '.join(entry['endpoints'])}")
+        print(f"{len(plans)} statements, {len(scans)} scanning images")
+        sys.exit(1 if scans else 0)
+
+    if args.check_generations:
+        with TestClient(apis.app) as client:
+            failures = check_bulk_generations(client, apis.DB_FILE, catalog)
+        for failure in failures:
+            print(failure)
+        print(f"Bulk writes: {len(failures)} failed")
+        sys.exit(1 if failures else 0)
+
+    with TestClient(apis.app) as client:
+        for router, name, factory in endpoint_cases(catalog, rng):
+            if args.only and args.only not in name:
+                continue
+            result = run_endpoint(client, factory, args.requests, args.concurrency, args.warmup)
+            results["endpoints"][name] = {"router": router, "concurrency": args.concurrency, **result}
+            print(f"{name:62} p50 {result['p50_ms']:9.3f}  p95 {result['p95_ms']:9.3f}  "
+                  f"p99 {result['p99_ms']:9.3f} ms  {result['throughput_rps']:8.1f} req/s  {result['errors']} errors")
+        if not args.only:
+            results["micro"] = micro_benchmarks(apis, catalog, work_dir, args.micro_iterations)
+            for name, result in results["micro"].items():
+                print(f"{name:62} p50 {result['p50_ms']:9.3f}  p95 {result['p95_ms']:9.3f}  p99 {result['p99_ms']:9.3f} ms")
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from metrics import SQLITE_QUERY_SECONDS, SQLITE_POOL_WAIT_SECONDS
+from tracing import add_span
+
+# Pragmas applied to every pooled connection
+PRAGMAS = {
+    "journal_mode": "WAL",          # readers no longer block the writer
+    "synchronous": "NORMAL",        # durable at checkpoints, safe with WAL
+    "cache_size": -64000,           # ~64 MB page cache per connection
+    "mmap_size": 268435456,         # 256 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,           # wait for the write lock instead of failing with "database is locked"
+}
+
+def _statement_kind(sql:str) -> str:
+    # First keyword only, so the metric label stays low-cardinality
+    words = sql.lstrip().split(None, 1)
+    return words[0].lower() if words else "other"
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor recording execute time in sqlite_query_duration_seconds and the request trace"""
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            SQLITE_QUERY_SECONDS.observe(elapsed, statement=_statement_kind(sql))
+            add_span("sqlite", elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            SQLITE_QUERY_SECONDS.observe(elapsed, statement=_statement_kind(sql))
+            add_span("sqlite", elapsed)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors and shortcut methods are timed"""
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    """
+    Thread-aware SQLite connection pool
+
+    Connections are opened lazily up to `max_size` and kept open between
+    requests so their page cache and prepared statement cache stay warm.
+    A thread gets back the connection it used last whenever that connection
+    is idle, otherwise the most recently released one. `trace_callback`,
+    if set, receives every statement run on connections opened afterwards
+    (see sqlite3.Connection.set_trace_callback).
+    """
+    def __init__(self, db_file:str, max_size:int=16, timeout:float=30.0, cached_statements:int=256,
+                 trace_callback=None):
+        self.db_file = db_file
+        self.trace_callback = trace_callback
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._stats = {
+            "acquired": 0,
+            "thread_reuse": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "peak_in_use": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open and configure a new connection
+
+        Parameters:
+        None
+
+        Returns:
+        sqlite3.Connection: Configured connection
+        """
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=PRAGMAS["busy_timeout"] / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=TimedConnection
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        if self.trace_callback is not None:
+            conn.set_trace_callback(self.trace_callback)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Check a connection out of the pool
+
+        Parameters:
+        None
+
+        Returns:
+        sqlite3.Connection: Connection reserved for the caller until release()
+        """
+        deadline = None
+        with self._cond:
+            while True:
+                conn = self._take_idle()
+                if conn is not None:
+                    break
+                if self._created < self.max_size:
+                    self._created += 1
+                    conn = None
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    self._stats["waits"] += 1
+                    wait_start = time.monotonic()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    self._stats["wait_seconds"] += time.monotonic() - wait_start
+                    raise sqlite3.OperationalError(f"Connection pool exhausted after {self.timeout}s")
+                self._cond.wait(remaining)
+            if deadline is not None:
+                waited = time.monotonic() - wait_start
+                self._stats["wait_seconds"] += waited
+                SQLITE_POOL_WAIT_SECONDS.observe(waited)
+                add_span("sqlite_pool_wait", waited)
+            self._in_use += 1
+            self._stats["acquired"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        self._local.conn = conn
+        return conn
+
+    def _take_idle(self) -> sqlite3.Connection:
+        # Prefer this thread's previous connection, then the most recently used one
+        own = getattr(self._local, "conn", None)
+        if own is not None:
+            for i, conn in enumerate(self._idle):
+                if conn is own:
+                    self._stats["thread_reuse"] += 1
+                    return self._idle.pop(i)
+        if self._idle:
+            return self._idle.pop()
+        return None
+
+    def release(self, conn:sqlite3.Connection) -> None:
+        """
+        Return a connection to the pool, rolling back any uncommitted work
+
+        Parameters:
+        conn (sqlite3.Connection): Connection obtained from acquire()
+
+        Returns:
+        None
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped instead of being handed out again
+            conn.close()
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block
+
+        Uncommitted changes are rolled back when the block exits, so callers
+        must still commit explicitly.
+
+        Parameters:
+        None
+
+        Returns:
+        sqlite3.Connection: Pooled connection
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        """
+        Close every idle connection
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close()
+                self._created -= 1
+
+    def stats(self) -> dict:
+        """
+        Get pool statistics for sizing against the worker count
+
+        Parameters:
+        None
+
+        Returns:
+        dict: Pool size, usage and contention counters
+        """
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats
+            }
@@ -0,0 +1,196 @@
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+# Suffix of files still being filled; removed on startup
+PARTIAL_SUFFIX = ".part"
+
+class DiskLRUCache:
+    """
+    Size-bounded cache of remote objects on local disk with LRU eviction
+
+    Files are named by a hash of the object key, so the cache survives
+    restarts; existing files are re-indexed oldest first by mtime. Readers
+    `acquire` a lease on a file and `release` it once served; leased files
+    are never evicted, so the total may briefly exceed `max_bytes` when every
+    file is in use. Concurrent misses for the same key share one fill.
+
+    Parameters:
+    directory (str): Cache directory, created if missing
+    max_bytes (int): Total size of cached files
+    """
+    def __init__(self, directory:str, max_bytes:int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._leases = {}  # file name -> responses still reading the file
+        self._inflight = {}  # key -> Future of the running fill
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def _name(self, key:str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest() + os.path.splitext(key)[1].lower()
+
+    def _evict(self) -> None:
+        # Called with the lock held; files are removed under it so a refill cannot be deleted
+        for name in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if name in self._leases:
+                continue
+            self._bytes -= self._entries.pop(name)
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def acquire(self, key:str) -> str:
+        """
+        Lease a cached file, marking it most recently used
+
+        Parameters:
+        key (str): Object key
+
+        Returns:
+        str: Local file path, or None on miss; pass the key to `release` when done
+        """
+        name = self._name(key)
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self._leases[name] = self._leases.get(name, 0) + 1
+            self.hits += 1
+        return os.path.join(self.directory, name)
+
+    def release(self, key:str) -> None:
+        """
+        Return a lease taken by `acquire` or `get_or_fill`
+
+        Parameters:
+        key (str): Object key
+
+        Returns:
+        None
+        """
+        name = self._name(key)
+        with self._lock:
+            remaining = self._leases.get(name, 0) - 1
+            if remaining > 0:
+                self._leases[name] = remaining
+            else:
+                self._leases.pop(name, None)
+                self._evict()
+
+    def put(self, key:str, source:str) -> str:
+        """
+        Move a complete file into the cache and lease it
+
+        Parameters:
+        key (str): Object key
+        source (str): File on the same filesystem as the cache directory
+
+        Returns:
+        str: Local file path
+        """
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        size = os.path.getsize(source)
+        with self._lock:
+            os.replace(source, path)
+            self._bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._leases[name] = self._leases.get(name, 0) + 1
+            self._evict()
+        return path
+
+    async def get_or_fill(self, key:str, fill) -> str:
+        """
+        Lease a cached file, filling it on miss
+
+        Parameters:
+        key (str): Object key
+        fill (Callable): Async function writing the object to the local path it is given
+
+        Returns:
+        str: Local file path; pass the key to `release` when done
+        """
+        while True:
+            path = self.acquire(key)
+            if path is not None:
+                return path
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            await asyncio.wait({pending})
+            if not pending.cancelled() and pending.exception() is not None:
+                raise pending.exception()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        partial = os.path.join(self.directory, uuid4().hex + PARTIAL_SUFFIX)
+        try:
+            await fill(partial)
+            path = self.put(key, partial)
+            future.set_result(None)
+            return path
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; no "never retrieved" warning without them
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def stats(self) -> dict:
+        """
+        Get cache counters
+
+        Parameters:
+        None
+
+        Returns:
+        dict: hits, misses, evictions, hit_ratio, entries, leased, filling, bytes and max_bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "leased": len(self._leases),
+                "filling": len(self._inflight),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
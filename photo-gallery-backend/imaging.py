@@ -0,0 +1,466 @@
+import io
+import os
+import time
+import base64
+import threading
+from contextlib import contextmanager
+from PIL import Image, ExifTags
+
+# Metadata columns on `images` filled from EXIF, in insert order.
+# The TEXT columns are for display and editing, the typed ones for filtering.
+EXIF_COLUMNS = ("camera_model", "focal_length", "exposure_time", "iso", "aperture",
+                "focal_length_mm", "f_number", "exposure_seconds", "iso_speed",
+                "taken_at", "width", "height", "orientation")
+
+# Columns on `images` describing the tile shown while the preview loads
+PLACEHOLDER_COLUMNS = ("placeholder", "average_color")
+# Every column derived from the original at upload or ingest time, in insert order
+DERIVED_COLUMNS = EXIF_COLUMNS + PLACEHOLDER_COLUMNS
+
+PLACEHOLDER_SIZE = 20      # longest side in pixels
+PLACEHOLDER_QUALITY = 40
+
+# Images above this many pixels are rejected before decoding. Pillow itself only raises at twice
+# its limit and merely warns in between, so the limit is also enforced explicitly in open_image.
+MAX_IMAGE_PIXELS = 100_000_000
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+# Longest side of WebP previews; larger JPEG originals are decoded in draft mode
+PREVIEW_MAX_DIMENSION = 4096
+
+class DecodeBudgetExceeded(RuntimeError):
+    """Raised when decode memory could not be reserved in time"""
+
+class DecodeBudget:
+    """
+    Weighted semaphore bounding the memory held by decoded images
+
+    Decoders reserve width x height x bands bytes (see decode_cost) before
+    loading pixels and give them back once done. A single image costing more
+    than the whole budget can still run, but only on its own.
+
+    Parameters:
+    max_bytes (int): Total bytes of decoded pixels allowed at once
+    """
+    def __init__(self, max_bytes:int):
+        self.max_bytes = max_bytes
+        self._used = 0
+        self._condition = threading.Condition()
+        self.peak = 0
+        self.rejected = 0
+
+    def acquire(self, cost:int, timeout:float=None) -> bool:
+        """
+        Reserve decode memory, waiting for it to become available
+
+        Parameters:
+        cost (int): Bytes to reserve
+        timeout (float): Seconds to wait; 0 does not wait, None waits forever
+
+        Returns:
+        bool: True if reserved; pass the same cost to `release` later
+        """
+        cost = min(cost, self.max_bytes)
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._used + cost <= self.max_bytes, timeout):
+                self.rejected += 1
+                return False
+            self._used += cost
+            self.peak = max(self.peak, self._used)
+            return True
+
+    def release(self, cost:int) -> None:
+        """
+        Return memory reserved by `acquire`
+
+        Parameters:
+        cost (int): Bytes passed to `acquire`
+
+        Returns:
+        None
+        """
+        with self._condition:
+            self._used -= min(cost, self.max_bytes)
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, cost:int, timeout:float=None):
+        """Hold decode memory for a `with` block, raising DecodeBudgetExceeded after `timeout` seconds"""
+        if not self.acquire(cost, timeout):
+            raise DecodeBudgetExceeded(f"No decode memory for {cost} bytes within {timeout}s")
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def exhausted(self) -> bool:
+        with self._condition:
+            return self._used >= self.max_bytes
+
+    def available(self) -> int:
+        """Bytes that can be reserved right now without waiting"""
+        with self._condition:
+            return self.max_bytes - self._used
+
+    def stats(self) -> dict:
+        """
+        Get budget usage
+
+        Parameters:
+        None
+
+        Returns:
+        dict: max_bytes, used_bytes, peak_bytes and rejected reservations
+        """
+        with self._condition:
+            return {"max_bytes": self.max_bytes, "used_bytes": self._used, "peak_bytes": self.peak,
+                    "rejected": self.rejected}
+
+def open_image(image_path:str, max_size:tuple=None) -> Image.Image:
+    """
+    Open an image, refusing decompression bombs before any pixels are decoded
+
+    Parameters:
+    image_path (str): Image file path
+    max_size (tuple): (width, height) the caller scales down to; JPEGs are then
+        decoded in draft mode at the smallest scale still covering it
+
+    Returns:
+    Image.Image: Opened, not yet loaded image
+    """
+    img = Image.open(image_path)
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        img.close()
+        raise Image.DecompressionBombError(
+            f"Image of {img.width}x{img.height} pixels exceeds the limit of {MAX_IMAGE_PIXELS} pixels")
+    if max_size is not None and img.format == "JPEG":
+        img.draft("RGB", max_size)
+    return img
+
+def decode_cost(image_path:str, box:tuple=None) -> int:
+    """
+    Estimate the memory needed to decode an image from its header
+
+    Parameters:
+    image_path (str): Image file path
+    box (tuple): (max width, max height) the image is scaled down to, None for either side
+        leaves it unbounded; JPEGs are then costed at their draft-mode size
+
+    Returns:
+    int: width x height x bands of the decoded image, 0 if the file is not a readable image
+    """
+    try:
+        with open_image(image_path) as img:
+            if box is not None and img.format == "JPEG":
+                img.draft("RGB", fit_size(img.size, box))
+            return img.width * img.height * len(img.getbands())
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return 0
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def _format_number(value:float) -> str:
+    return f"{value:g}" if value is not None else None
+
+def _format_exposure(seconds:float) -> str:
+    if seconds is None:
+        return None
+    if 0 < seconds < 1:
+        return f"1/{round(1 / seconds)}"
+    return f"{seconds:g}"
+
+def parse_exposure(text:str) -> float:
+    """
+    Parse an exposure time such as "1/250", "0.004" or "2s" into seconds
+
+    Parameters:
+    text (str): Exposure time
+
+    Returns:
+    float: Exposure time in seconds, or None if unparseable
+    """
+    if text is None:
+        return None
+    text = str(text).strip().rstrip("s")
+    if "/" in text:
+        numerator, _, denominator = text.partition("/")
+        numerator, denominator = _to_float(numerator), _to_float(denominator)
+        return numerator / denominator if numerator is not None and denominator else None
+    return _to_float(text)
+
+def typed_exif_from_text(focal_length:str, exposure_time:str, iso:str, aperture:str) -> dict:
+    """
+    Derive the typed EXIF columns from user-edited display values
+
+    Parameters:
+    focal_length (str): Focal length, e.g. "35" or "35mm"
+    exposure_time (str): Exposure time, e.g. "1/250"
+    iso (str): ISO speed
+    aperture (str): f-number, e.g. "2.8" or "f/2.8"
+
+    Returns:
+    dict: focal_length_mm, f_number, exposure_seconds and iso_speed
+    """
+    def strip(text, *affixes):
+        text = str(text).strip().lower() if text is not None else None
+        for affix in affixes:
+            if text:
+                text = text.replace(affix, "")
+        return text
+
+    iso_speed = _to_float(strip(iso, "iso"))
+    return {
+        "focal_length_mm": _to_float(strip(focal_length, "mm")),
+        "f_number": _to_float(strip(aperture, "f/")),
+        "exposure_seconds": parse_exposure(exposure_time),
+        "iso_speed": int(iso_speed) if iso_speed is not None else None
+    }
+
+def get_exif_data(image_path:str) -> dict:
+    """
+    Extract EXIF data from the image header without decoding pixel data
+
+    Image.open only parses the file header; only the handful of tags the
+    catalog stores are looked up instead of walking every tag.
+
+    Parameters:
+    image_path (str): Image file path
+
+    Returns:
+    dict: Values for every column in EXIF_COLUMNS, None where the image has no such tag
+    """
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            exif = img.getexif()
+            exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    except Exception as e:
+        print(f"Error extracting EXIF from {image_path}: {e}")
+        return {}
+
+    focal_mm = _to_float(exif_ifd.get(ExifTags.Base.FocalLength))
+    f_number = _to_float(exif_ifd.get(ExifTags.Base.FNumber))
+    exposure = _to_float(exif_ifd.get(ExifTags.Base.ExposureTime))
+    iso = exif_ifd.get(ExifTags.Base.ISOSpeedRatings)
+    if isinstance(iso, tuple):
+        iso = iso[0] if iso else None
+    iso = int(iso) if _to_float(iso) is not None else None
+    taken_at = exif_ifd.get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    if isinstance(taken_at, str) and len(taken_at) >= 19:
+        # "YYYY:MM:DD HH:MM:SS" -> same format as date_added
+        taken_at = taken_at[:10].replace(":", "-") + taken_at[10:19]
+    else:
+        taken_at = None
+    model = exif.get(ExifTags.Base.Model)
+    model = str(model).strip("\x00 ") or None if model is not None else None
+
+    return {
+        "camera_model": model,
+        "focal_length": _format_number(focal_mm),
+        "exposure_time": _format_exposure(exposure),
+        "iso": str(iso) if iso is not None else None,
+        "aperture": _format_number(f_number),
+        "focal_length_mm": focal_mm,
+        "f_number": f_number,
+        "exposure_seconds": exposure,
+        "iso_speed": iso,
+        "taken_at": taken_at,
+        "width": width,
+        "height": height,
+        "orientation": exif.get(ExifTags.Base.Orientation)
+    }
+
+def get_placeholder(image_path:str) -> dict:
+    """
+    Render a tiny inline placeholder and the average color of an image
+
+    JPEG sources are decoded at 1/8 scale with draft(). Like the WebP
+    preview it stands in for, the placeholder keeps the stored orientation.
+
+    Parameters:
+    image_path (str): Image file path
+
+    Returns:
+    dict: placeholder (WebP data URI, a few hundred bytes) and average_color ("#rrggbb"),
+        None for both if the image cannot be read
+    """
+    try:
+        with open_image(image_path, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE)) as img:
+            img.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+            thumbnail = img.convert("RGB")
+        red, green, blue = thumbnail.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+        output = io.BytesIO()
+        thumbnail.save(output, "WEBP", quality=PLACEHOLDER_QUALITY)
+    except Exception as e:
+        print(f"Error creating placeholder for {image_path}: {e}")
+        return {"placeholder": None, "average_color": None}
+    return {
+        "placeholder": "data:image/webp;base64," + base64.b64encode(output.getvalue()).decode(),
+        "average_color": f"#{red:02x}{green:02x}{blue:02x}"
+    }
+
+def convert_to_webp(image_path: str, timings: dict = None) -> str:
+    """
+    Convert an image to WebP format
+    
+    Parameters:
+    image_path (str): Original image path
+    timings (dict): Filled with decode and encode seconds when given
+    
+    Returns:
+    str: Path to the WebP version or None if conversion failed
+    """
+    try:
+        # Create output filename - make sure we use a clean name without path issues
+        base_filename = os.path.basename(image_path).rsplit('.', 1)[0]
+        temp_dir = os.path.dirname(image_path)
+        preview_path = os.path.join(temp_dir, f"{base_filename}.webp")
+        
+        print(f"Attempting to create WebP at: {preview_path}")
+        
+        # Open, convert, and save the image; large JPEGs are decoded at reduced scale
+        with open_image(image_path, (PREVIEW_MAX_DIMENSION, PREVIEW_MAX_DIMENSION)) as img:
+            start = time.perf_counter()
+            img.load()
+            decoded = time.perf_counter()
+            img.thumbnail((PREVIEW_MAX_DIMENSION, PREVIEW_MAX_DIMENSION))
+            if img.mode in ("RGBA", "P"):
+                img = img.convert("RGB")
+            img.save(preview_path, "WEBP", quality=80)
+            # Force flush to disk
+            img.close()
+        if timings is not None:
+            timings["decode"] = decoded - start
+            timings["encode"] = time.perf_counter() - decoded
+        
+        # Verify file was created with a retry mechanism
+        for _ in range(3):  # retry up to 3 times
+            if os.path.isfile(preview_path):
+                file_size = os.path.getsize(preview_path)
+                if file_size > 0:
+                    print(f"WebP created successfully at: {preview_path} (size: {file_size} bytes)")
+                    return preview_path
+            # Small delay before checking again
+            time.sleep(0.2)
+        
+        print(f"Failed to create WebP at: {preview_path} after retries")
+        return None
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        print(f"Error converting to WebP: {str(e)}\n{error_details}")
+        return None
+
+def build_derivatives(image_path:str) -> tuple:
+    """
+    Extract EXIF data and render the placeholder and WebP preview, run in a worker process
+
+    Parameters:
+    image_path (str): Local path of the original image
+
+    Returns:
+    tuple: (EXIF and placeholder dict, local WebP preview path, seconds spent per image operation)
+    """
+    # Timings travel back with the result because metrics recorded in the worker process are lost
+    timings = {}
+    start = time.perf_counter()
+    exif = get_exif_data(image_path)
+    timings["exif"] = time.perf_counter() - start
+    start = time.perf_counter()
+    exif.update(get_placeholder(image_path))
+    timings["placeholder"] = time.perf_counter() - start
+    preview_local = convert_to_webp(image_path, timings)
+    if not preview_local:
+        raise RuntimeError(f"Preview creation failed for {image_path}")
+    return exif, preview_local, timings
+
+# Output formats of render_variant: name -> (Pillow format, media type)
+VARIANT_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+# EXIF orientation -> transpose that displays the image upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def fit_size(size:tuple, box:tuple) -> tuple:
+    """
+    Scale a size down to fit a bounding box, keeping the aspect ratio
+
+    Parameters:
+    size (tuple): (width, height) of the image
+    box (tuple): (max width, max height); None leaves that side unbounded
+
+    Returns:
+    tuple: (width, height), never larger than `size`
+    """
+    width, height = size
+    max_width, max_height = box
+    scale = min(max_width / width if max_width else 1, max_height / height if max_height else 1, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def render_variant(image_path:str, width:int=None, height:int=None, fmt:str="webp", quality:int=80,
+                   timings:dict=None) -> bytes:
+    """
+    Render an upright copy of an image scaled to fit within width x height
+
+    JPEG sources are decoded straight at a reduced scale with draft(), so a
+    large original is never fully decoded. reduce() then does the bulk of
+    any remaining downscaling with a cheap integer box filter, leaving only
+    a small final Lanczos resize.
+
+    Parameters:
+    image_path (str): Image file path
+    width (int): Maximum width, None for unbounded
+    height (int): Maximum height, None for unbounded
+    fmt (str): Output format, a key of VARIANT_FORMATS
+    quality (int): Encoder quality, 1-100
+    timings (dict): Filled with decode, resize and encode seconds when given
+
+    Returns:
+    bytes: Encoded image
+    """
+    start = time.perf_counter()
+    with open_image(image_path) as img:
+        transpose = ORIENTATION_TRANSPOSE.get(img.getexif().get(ExifTags.Base.Orientation))
+        # Width and height apply to the upright image; 90 degree rotations swap the stored sides
+        box = (height, width) if transpose in (Image.Transpose.TRANSPOSE, Image.Transpose.ROTATE_270,
+                                               Image.Transpose.TRANSVERSE, Image.Transpose.ROTATE_90) else (width, height)
+        target = fit_size(img.size, box)
+        if img.format == "JPEG":
+            img.draft("RGB", target)
+        img.load()
+        decoded = time.perf_counter()
+
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if img.size != target:
+            img = img.resize(target, Image.Resampling.LANCZOS)
+        if transpose is not None:
+            img = img.transpose(transpose)
+        resized = time.perf_counter()
+
+        pillow_format = VARIANT_FORMATS[fmt][0]
+        if pillow_format == "JPEG":
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+        output = io.BytesIO()
+        img.save(output, pillow_format, quality=quality, **({"progressive": True} if pillow_format == "JPEG" else {}))
+    if timings is not None:
+        timings["decode"] = decoded - start
+        timings["resize"] = resized - decoded
+        timings["encode"] = time.perf_counter() - resized
+    return output.getvalue()
@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+class JobQueue:
+    """
+    SQLite-backed background job queue executed on a local process pool
+
+    Jobs live in the `processing_jobs` table so they survive restarts. A
+    dispatcher thread claims due jobs, runs `work` in a worker process and
+    hands the result to `complete` on the dispatcher thread. Failed jobs are
+    retried with exponential backoff until `max_attempts` is reached.
+
+    Several API worker processes may share the table. A claim records the
+    claiming process and a time that is renewed while the job is held; a
+    running job is only put back in the queue once that lease is `lease`
+    seconds old, i.e. its process died or hung.
+
+    With a `budget`, a claimed job only starts once `cost(*args)` bytes of
+    decode memory are reserved; until then it waits in claim order and
+    counts towards `deferred` and `deferred_bytes`.
+
+    Parameters:
+    get_connection (Callable): Returns a context manager yielding a SQLite connection
+    prepare (Callable): prepare(job) -> tuple of arguments for `work`, run on the dispatcher thread
+    work (Callable): Picklable top-level function run in a worker process
+    complete (Callable): complete(job, result) run on the dispatcher thread after `work` succeeds
+    fail (Callable): fail(job, error) run when a job exhausts its retries
+    budget (DecodeBudget): Decode memory shared with the rest of the process
+    cost (Callable): cost(*args) -> bytes to reserve from `budget` while the job runs
+    lease (float): Seconds without renewal after which another process may reclaim a running job
+    """
+    def __init__(self, get_connection, prepare, work, complete, fail=None,
+                 workers:int=2, max_attempts:int=5, backoff:float=2.0, poll_interval:float=0.5,
+                 budget=None, cost=None, lease:float=60.0):
+        self.get_connection = get_connection
+        self.prepare = prepare
+        self.work = work
+        self.complete = complete
+        self.fail = fail
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.budget = budget
+        self.cost = cost
+        self.lease = lease
+        self.deferred = 0
+        self.deferred_bytes = 0
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def enqueue(self, conn, image_id:str, local_path:str=None) -> None:
+        """
+        Add a job inside the caller's transaction
+
+        Parameters:
+        conn (sqlite3.Connection): Connection with the caller's open transaction
+        image_id (str): Image ID to process
+        local_path (str): Local copy of the original, if still on disk
+
+        Returns:
+        None
+        """
+        conn.execute('''
+            INSERT OR REPLACE INTO processing_jobs (image_id, local_path, status, attempts, next_attempt_at, created_at)
+            VALUES (?, ?, 'pending', 0, ?, ?)
+        ''', (image_id, local_path, time.time(), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def notify(self) -> None:
+        """Wake the dispatcher after enqueueing"""
+        self._wake.set()
+
+    def start(self) -> None:
+        """
+        Start the worker processes and the dispatcher thread
+
+        Jobs whose claim has expired, and jobs claimed by an earlier process
+        with this process id, are put back in the queue.
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self._reclaim(include_own=True)
+        self._stop.clear()
+        # Forked children would inherit locks held by the dispatcher, S3 and pool threads; forkserver
+        # workers start clean and import only the module defining `work`
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+        self._thread = threading.Thread(target=self._run, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop dispatching and wait for running jobs
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _reclaim(self, include_own:bool=False) -> None:
+        now = time.time()
+        with self.get_connection() as conn:
+            # Claims made before leases existed have no claimed_at
+            stale = [row["image_id"] for row in conn.execute('''
+                SELECT image_id FROM processing_jobs
+                WHERE status='running' AND (claimed_at IS NULL OR claimed_at<? OR (? AND owner_pid=?))
+            ''', (now - self.lease, include_own, os.getpid())).fetchall()]
+            for image_id in stale:
+                cursor = conn.execute('''
+                    UPDATE processing_jobs SET status='pending', claimed_at=NULL, owner_pid=NULL
+                    WHERE image_id=? AND status='running' AND (claimed_at IS NULL OR claimed_at<? OR (? AND owner_pid=?))
+                ''', (image_id, now - self.lease, include_own, os.getpid()))
+                if cursor.rowcount:
+                    print(f"Reclaimed job for {image_id}")
+                    conn.execute("UPDATE images SET processing_status='pending' WHERE id=?", (image_id,))
+            conn.commit()
+
+    def _renew(self, image_ids:list) -> None:
+        if not image_ids:
+            return
+        with self.get_connection() as conn:
+            conn.execute(f'''
+                UPDATE processing_jobs SET claimed_at=?
+                WHERE image_id IN ({', '.join('?' * len(image_ids))}) AND status='running' AND owner_pid=?
+            ''', (time.time(), *image_ids, os.getpid()))
+            conn.commit()
+
+    def _claim(self, count:int) -> list:
+        with self.get_connection() as conn:
+            due = conn.execute('''
+                SELECT image_id, local_path, attempts FROM processing_jobs
+                WHERE status='pending' AND next_attempt_at<=?
+                ORDER BY next_attempt_at LIMIT ?
+            ''', (time.time(), count)).fetchall()
+            if not due:
+                return []
+            # Other API worker processes may poll the same table, so claim each job atomically
+            jobs = []
+            for job in due:
+                cursor = conn.execute('''
+                    UPDATE processing_jobs SET status='running', claimed_at=?, owner_pid=?
+                    WHERE image_id=? AND status='pending'
+                ''', (time.time(), os.getpid(), job["image_id"]))
+                if cursor.rowcount:
+                    conn.execute("UPDATE images SET processing_status='processing' WHERE id=?", (job["image_id"],))
+                    jobs.append(dict(job))
+            conn.commit()
+        return jobs
+
+    def _run(self) -> None:
+        in_flight = {}  # future -> (job, reserved cost)
+        waiting = []  # (job, args, cost) claimed but not started for lack of budget
+        renewed = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                # Renew the claims held here and reclaim those of dead processes well within one lease
+                if time.monotonic() - renewed >= self.lease / 3:
+                    self._renew([job["image_id"] for job, _ in in_flight.values()]
+                                + [job["image_id"] for job, _, _ in waiting])
+                    self._reclaim()
+                    renewed = time.monotonic()
+                free = self.workers - len(in_flight) - len(waiting)
+                for job in self._claim(free) if free > 0 else []:
+                    try:
+                        args = self.prepare(job)
+                        waiting.append((job, args, self.cost(*args) if self.cost is not None else 0))
+                    except Exception as e:
+                        self._retry(job, e)
+                while waiting:
+                    job, args, cost = waiting[0]
+                    if self.budget is not None and not self.budget.acquire(cost, timeout=0):
+                        break
+                    waiting.pop(0)
+                    in_flight[self._executor.submit(self.work, *args)] = (job, cost)
+                self.deferred = len(waiting)
+                self.deferred_bytes = sum(cost for _, _, cost in waiting)
+
+                if not in_flight:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+
+                done, _ = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, cost = in_flight.pop(future)
+                    if self.budget is not None:
+                        self.budget.release(cost)
+                    try:
+                        self.complete(job, future.result())
+                        with self.get_connection() as conn:
+                            conn.execute("DELETE FROM processing_jobs WHERE image_id=?", (job["image_id"],))
+                            conn.commit()
+                    except Exception as e:
+                        self._retry(job, e)
+            except Exception as e:
+                print(f"Job dispatcher error: {e}\n{traceback.format_exc()}")
+                time.sleep(self.poll_interval)
+        wait(in_flight)
+
+    def _retry(self, job:dict, error:Exception) -> None:
+        attempts = job["attempts"] + 1
+        print(f"Job for {job['image_id']} failed (attempt {attempts}/{self.max_attempts}): {error}")
+        with self.get_connection() as conn:
+            if attempts >= self.max_attempts:
+                conn.execute("UPDATE processing_jobs SET status='failed', attempts=?, last_error=? WHERE image_id=?",
+                             (attempts, str(error), job["image_id"]))
+                conn.execute("UPDATE images SET processing_status='failed' WHERE id=?", (job["image_id"],))
+            else:
+                delay = self.backoff * 2 ** (attempts - 1)
+                conn.execute('''
+                    UPDATE processing_jobs SET status='pending', attempts=?, last_error=?, next_attempt_at=?
+                    WHERE image_id=?
+                ''', (attempts, str(error), time.time() + delay, job["image_id"]))
+                conn.execute("UPDATE images SET processing_status='pending' WHERE id=?", (job["image_id"],))
+            conn.commit()
+        if attempts >= self.max_attempts and self.fail is not None:
+            try:
+                self.fail(job, error)
+            except Exception as e:
+                print(f"Job failure handler error for {job['image_id']}: {e}")
@@ -1,45 +1,19 @@
 import os
+import argparse
+import hashlib
 import sqlite3
 import datetime
-import boto3
 import random
-import multiprocessing    # added import
-from PIL import Image
-from PIL.ExifTags import TAGS
+import queue
+import threading
+import time
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from uuid import uuid4
-
-def get_exif_data(image_path):
-    try:
-        img = Image.open(image_path)
-        exif_data = img._getexif()
-        if not exif_data:
-            return {}
-        
-        exif = {}
-        for tag, value in exif_data.items():
-            decoded = TAGS.get(tag, tag)
-            exif[decoded] = value
-        
-        return {
-            "camera_model": exif.get("Model", "Unknown"),
-            "focal_length": exif.get("FocalLength", "Unknown"),
-            "exposure_time": exif.get("ExposureTime", "Unknown"),
-            "iso": exif.get("ISOSpeedRatings", "Unknown"),
-            "aperture": exif.get("FNumber", "Unknown")
-        }
-    except Exception as e:
-        print(f"Error extracting EXIF from {image_path}: {e}")
-        return {}
-
-def convert_to_webp(image_path):
-    webp_path = image_path.rsplit('.', 1)[0] + ".webp"
-    try:
-        img = Image.open(image_path)
-        img.save(webp_path, "WEBP", quality=80)
-        return webp_path
-    except Exception as e:
-        print(f"Error converting {image_path} to WebP: {e}")
-        return None
+from migrations import apply_migrations
+from storage import S3Storage
+from imaging import DERIVED_COLUMNS, convert_to_webp, get_exif_data, get_placeholder
 
 def upload_to_minio(file_path, minio_path):
     try:
@@ -52,98 +26,389 @@ def upload_to_minio(file_path, minio_path):
 def generate_uuid():
     return str(uuid4())
 
-def process_images(base_dir):
-    pool = multiprocessing.Pool(processes=8)
-    theme_previews = {}
-    
+# Pipeline tuning
+HASH_THREADS = 8          # content hashing / duplicate detection
+CONVERT_PROCESSES = 8     # EXIF + WebP workers
+UPLOAD_THREADS = 16       # concurrent MinIO uploads
+QUEUE_SIZE = 64           # items buffered between stages
+INSERT_BATCH_SIZE = 500   # rows per executemany/commit
+PROGRESS_INTERVAL = 5     # seconds between progress reports
+BLOB_PREFIX = "blobs/"    # originals and previews are stored under their sha256
+
+_DONE = object()
+
+# Content hashes already stored in MinIO or claimed by an earlier file in this run
+known_hashes = set()
+known_hashes_lock = threading.Lock()
+
+def iter_image_files(base_dir):
+    # Yields (theme, collection, file_name, file_path) for every file two levels below base_dir
     for theme in os.listdir(base_dir):
         theme_path = os.path.join(base_dir, theme)
         if not os.path.isdir(theme_path):
             continue
-        
-        collection_previews = []     # collect each collection preview URL
-        
         for collection in os.listdir(theme_path):
             collection_path = os.path.join(theme_path, collection)
             if not os.path.isdir(collection_path):
                 continue
-            
-            images_list = []         # store tuples (file_path, file_name) for uploaded images
-            # Remove inline preview setting: collection_preview_image = None
-            
             for file_name in os.listdir(collection_path):
                 file_path = os.path.join(collection_path, file_name)
-                if not os.path.isfile(file_path):
-                    continue
-                
-                minio_path = f"{theme}/{collection}/{file_name}"   # upload original image
-                minio_url = upload_to_minio(file_path, minio_path)
-                
-                if minio_url:
-                    # Save original image info to DB with uuid as id
-                    exif = get_exif_data(file_path)
-                    date_added = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # Convert image to WebP for preview in a separate process 
-                    preview_path = pool.apply_async(convert_to_webp, (file_path,)).get()
-                    preview_url = None
-                    if preview_path:
-                        preview_minio_path = f"{theme}/{collection}/previews/{os.path.basename(preview_path)}"
-                        preview_url = upload_to_minio(preview_path, preview_minio_path)
-                        os.remove(preview_path)
-                    
-                    cursor.execute('''
-                        INSERT INTO images (id, name, filepath, date_added, theme, collection, 
-                                            camera_model, focal_length, exposure_time, iso, aperture, preview_image)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (generate_uuid(), file_name, minio_url, date_added, theme, collection, 
-                          exif.get("camera_model"), exif.get("focal_length"), 
-                          exif.get("exposure_time"), exif.get("iso"), exif.get("aperture"), preview_url))
-                    conn.commit()
-                    print(f"Stored: {file_name}")
-                    
-                    images_list.append((file_path, file_name))
-            
-            if images_list:
-                # Randomly select one image to serve as collection preview
-                chosen_file_path, chosen_file_name = random.choice(images_list)
-                preview_webp_path = pool.apply_async(convert_to_webp, (chosen_file_path,)).get()
-                if preview_webp_path:
-                    preview_minio_path = f"{theme}/{collection}/{os.path.basename(preview_webp_path)}"
-                    preview_minio_url = upload_to_minio(preview_webp_path, preview_minio_path)
-                    # Insert collection preview record with uuid as id
-                    cursor.execute('''INSERT INTO collections (id, name, theme, preview_image) VALUES (?, ?, ?, ?)''',
-                               (generate_uuid(), collection, theme, preview_minio_url))
-                    conn.commit()
-                    collection_previews.append(preview_minio_url)
-                    os.remove(preview_webp_path)   # Remove the local webp file after upload
-            
-        if collection_previews:
-            # Randomly select a preview among the collection previews for the theme
-            theme_preview = random.choice(collection_previews)
-            cursor.execute('''INSERT INTO themes (id, name, preview_image) VALUES (?, ?, ?)''', (generate_uuid(), theme, theme_preview))
+                if os.path.isfile(file_path):
+                    yield theme, collection, file_name, file_path
+
+def load_manifest():
+    # Manifest of already ingested files: path -> row
+    cursor.execute("SELECT path, size, mtime, sha256, image_id FROM ingest_manifest")
+    return {row[0]: {"size": row[1], "mtime": row[2], "sha256": row[3], "image_id": row[4]}
+            for row in cursor.fetchall()}
+
+def manifest_key(theme, collection, file_name):
+    return f"{theme}/{collection}/{file_name}"
+
+def file_sha256(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def walk_images(base_dir, outbox, manifest, counters):
+    # Stage 1: directory walk; files whose size and mtime match the manifest are skipped without reading them
+    for theme, collection, file_name, file_path in iter_image_files(base_dir):
+        stat = os.stat(file_path)
+        key = manifest_key(theme, collection, file_name)
+        previous = manifest.get(key)
+        if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+            counters["skipped"] += 1
+            continue
+        outbox.put({"theme": theme, "collection": collection, "file_name": file_name, "file_path": file_path,
+                    "key": key, "size": stat.st_size, "mtime": stat.st_mtime, "previous": previous})
+    outbox.put(_DONE)
+
+def hash_image(item):
+    # Stage 2, runs in a hashing thread
+    item["sha256"] = file_sha256(item["file_path"])
+    previous = item["previous"]
+    # Touched but not modified: only the manifest needs updating
+    item["unchanged"] = bool(previous and previous["sha256"] == item["sha256"])
+    item["duplicate"] = False
+    if not item["unchanged"]:
+        with known_hashes_lock:
+            item["duplicate"] = item["sha256"] in known_hashes
+            known_hashes.add(item["sha256"])
+    return item
+
+def convert_image(item):
+    # Stage 3, runs in a worker process
+    if item["unchanged"] or item["duplicate"]:
+        return item
+    item["exif"] = get_exif_data(item["file_path"])
+    item["exif"].update(get_placeholder(item["file_path"]))
+    item["preview_path"] = convert_to_webp(item["file_path"])
+    return item
+
+def blob_key(sha256, file_name):
+    # Keys are derived from the content, so a stored object is never rewritten when its file is modified
+    return f"{BLOB_PREFIX}{sha256}{os.path.splitext(file_name)[1].lower()}"
+
+def upload_image(item):
+    # Stage 4, runs in an upload thread
+    if item["unchanged"] or item["duplicate"]:
+        return item
+    item["minio_url"] = upload_to_minio(item["file_path"], blob_key(item["sha256"], item["file_name"]))
+    item["preview_url"] = None
+    if item["preview_path"]:
+        if item["minio_url"]:
+            item["preview_url"] = upload_to_minio(item["preview_path"], f"{BLOB_PREFIX}previews/{item['sha256']}.webp")
+        os.remove(item["preview_path"])
+    return item
+
+def run_stage(executor, fn, inbox, outbox, max_in_flight):
+    # Feed items from inbox through executor, forwarding results to outbox as they finish.
+    # Blocking on the bounded outbox is what propagates backpressure upstream.
+    # An item whose stage raised carries the error on to the writer, which counts it as failed.
+    in_flight = {}
+    exhausted = False
+    while not exhausted or in_flight:
+        while not exhausted and len(in_flight) < max_in_flight:
+            try:
+                item = inbox.get(timeout=0.05) if in_flight else inbox.get()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                exhausted = True
+            elif "error" in item:
+                outbox.put(item)
+            else:
+                in_flight[executor.submit(fn, item)] = item
+        if in_flight:
+            done, _ = wait(in_flight, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    outbox.put(future.result())
+                except Exception as e:
+                    print(f"Pipeline stage {fn.__name__} failed for {item['key']}: {e}")
+                    outbox.put({**item, "error": f"{fn.__name__}: {e}"})
+    outbox.put(_DONE)
+
+def load_known_hashes():
+    cursor.execute("SELECT sha256 FROM blobs")
+    return {row[0] for row in cursor.fetchall()}
+
+def write_batch(images, manifest_rows, blobs):
+    # Images and their manifest entries commit together, so an interrupted run resumes after the last batch.
+    # Modified files keep their image id and therefore their favourite flag and status.
+    cursor.executemany('''
+        INSERT OR IGNORE INTO blobs (sha256, filepath, preview_image, size, created_at) VALUES (?, ?, ?, ?, ?)
+    ''', blobs)
+    cursor.executemany(f'''
+        INSERT INTO images (id, name, filepath, date_added, theme, collection, 
+                            {', '.join(DERIVED_COLUMNS)}, preview_image, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' * len(DERIVED_COLUMNS))}, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name=excluded.name, filepath=excluded.filepath, theme=excluded.theme, collection=excluded.collection,
+            {', '.join(f"{column}=excluded.{column}" for column in DERIVED_COLUMNS)},
+            preview_image=excluded.preview_image, content_hash=excluded.content_hash
+    ''', images)
+    cursor.executemany('''
+        INSERT OR REPLACE INTO ingest_manifest (path, size, mtime, sha256, image_id, ingested_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', manifest_rows)
+    conn.commit()
+
+def plan_ingest(base_dir):
+    # Dry run: compare the tree with the manifest using stat only, without reading, uploading or writing anything
+    manifest = load_manifest()
+    delta = {"new": [], "modified": [], "unchanged": 0, "missing": []}
+    seen = set()
+    for theme, collection, file_name, file_path in iter_image_files(base_dir):
+        key = manifest_key(theme, collection, file_name)
+        seen.add(key)
+        stat = os.stat(file_path)
+        previous = manifest.get(key)
+        if previous is None:
+            delta["new"].append(key)
+        elif previous["size"] != stat.st_size or previous["mtime"] != stat.st_mtime:
+            delta["modified"].append(key)
+        else:
+            delta["unchanged"] += 1
+    delta["missing"] = sorted(set(manifest) - seen)
+
+    print(f"New: {len(delta['new'])}")
+    for key in delta["new"]:
+        print(f"  + {key}")
+    print(f"Modified: {len(delta['modified'])}")
+    for key in delta["modified"]:
+        print(f"  ~ {key}")
+    print(f"Missing from disk: {len(delta['missing'])}")
+    for key in delta["missing"]:
+        print(f"  - {key}")
+    print(f"Unchanged: {delta['unchanged']}")
+    return delta
+
+def resolve_duplicates(duplicates, collection_previews):
+    # Point duplicate files at the original and preview already stored for the same content.
+    # Their previews are candidate covers too, so a collection made only of copies still gets a row.
+    images, manifest_rows = [], []
+    bytes_saved = 0
+    for item in duplicates:
+        cursor.execute("SELECT filepath, preview_image FROM blobs WHERE sha256=?", (item["sha256"],))
+        blob = cursor.fetchone()
+        if blob is None:
+            # The first copy failed to upload; leave this file out of the manifest so the next run retries it
+            print(f"Original for duplicate {item['key']} was not stored, skipping")
+            continue
+        cursor.execute(f"SELECT {', '.join(DERIVED_COLUMNS)} FROM images WHERE content_hash=? LIMIT 1", (item["sha256"],))
+        exif = cursor.fetchone() or (None,) * len(DERIVED_COLUMNS)
+        if blob[1]:
+            derived = dict(zip(DERIVED_COLUMNS, exif))
+            collection_previews.setdefault((item["theme"], item["collection"]), []).append(
+                (blob[1], derived["placeholder"], derived["average_color"]))
+        date_added = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        image_id = item["previous"]["image_id"] if item["previous"] else generate_uuid()
+        images.append((image_id, item["file_name"], blob[0], date_added, item["theme"], item["collection"],
+                       *exif, blob[1], item["sha256"]))
+        manifest_rows.append((item["key"], item["size"], item["mtime"], item["sha256"], image_id, date_added))
+        bytes_saved += item["size"]
+    write_batch(images, manifest_rows, [])
+    return len(images), bytes_saved
+
+def process_images(base_dir):
+    manifest = load_manifest()
+    counters = {"skipped": 0}
+    known_hashes.clear()
+    known_hashes.update(load_known_hashes())
+    walked = queue.Queue(maxsize=QUEUE_SIZE)
+    hashed = queue.Queue(maxsize=QUEUE_SIZE)
+    converted = queue.Queue(maxsize=QUEUE_SIZE)
+    uploaded = queue.Queue(maxsize=QUEUE_SIZE)
+
+    hash_pool = ThreadPoolExecutor(max_workers=HASH_THREADS)
+    # Forked children would inherit locks held by the hashing and upload threads
+    convert_pool = ProcessPoolExecutor(max_workers=CONVERT_PROCESSES, mp_context=multiprocessing.get_context("forkserver"))
+    upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_THREADS)
+    stages = [
+        threading.Thread(target=walk_images, args=(base_dir, walked, manifest, counters), daemon=True),
+        threading.Thread(target=run_stage, args=(hash_pool, hash_image, walked, hashed, HASH_THREADS * 2), daemon=True),
+        threading.Thread(target=run_stage, args=(convert_pool, convert_image, hashed, converted, CONVERT_PROCESSES * 2), daemon=True),
+        threading.Thread(target=run_stage, args=(upload_pool, upload_image, converted, uploaded, UPLOAD_THREADS * 2), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # Stage 5: single writer, batched inserts
+    collection_previews = {}   # (theme, collection) -> (uploaded preview URL, placeholder, average color)
+    images, manifest_rows, blobs = [], [], []
+    duplicates = []
+    stored = failed = unchanged = 0
+    start = last_report = time.monotonic()
+    while True:
+        item = uploaded.get()
+        if item is _DONE:
+            break
+        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        previous = item["previous"]
+        if "error" in item:
+            # Left out of the manifest, so the next run retries the file
+            failed += 1
+            continue
+        elif item["unchanged"]:
+            unchanged += 1
+            manifest_rows.append((item["key"], item["size"], item["mtime"], item["sha256"], previous["image_id"], now_str))
+        elif item["duplicate"]:
+            # Resolved once every original of this run has been written
+            duplicates.append(item)
+            continue
+        elif not item["minio_url"]:
+            failed += 1
+            continue
+        else:
+            exif = item["exif"]
+            image_id = previous["image_id"] if previous else generate_uuid()
+            images.append((image_id, item["file_name"], item["minio_url"], now_str, item["theme"], item["collection"],
+                           *(exif.get(column) for column in DERIVED_COLUMNS), item["preview_url"], item["sha256"]))
+            blobs.append((item["sha256"], item["minio_url"], item["preview_url"], item["size"], now_str))
+            manifest_rows.append((item["key"], item["size"], item["mtime"], item["sha256"], image_id, now_str))
+            if item["preview_url"]:
+                collection_previews.setdefault((item["theme"], item["collection"]), []).append(
+                    (item["preview_url"], exif.get("placeholder"), exif.get("average_color")))
+        if len(manifest_rows) >= INSERT_BATCH_SIZE:
+            write_batch(images, manifest_rows, blobs)
+            stored += len(images)
+            images, manifest_rows, blobs = [], [], []
+
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            done = stored + len(images)
+            print(f"Processed {done} images ({done / (now - start):.1f} img/s), "
+                  f"{counters['skipped'] + unchanged} unchanged, {failed} failed")
+            last_report = now
+
+    if manifest_rows:
+        write_batch(images, manifest_rows, blobs)
+        stored += len(images)
+    deduplicated, bytes_saved = resolve_duplicates(duplicates, collection_previews)
+
+    for stage in stages:
+        stage.join()
+    hash_pool.shutdown()
+    convert_pool.shutdown()
+    upload_pool.shutdown()
+
+    # Randomly select one preview per new collection, then one collection preview per new theme
+    theme_previews = {}
+    for (theme, collection), previews in collection_previews.items():
+        preview = random.choice(previews)
+        cursor.execute("SELECT 1 FROM collections WHERE name=? AND theme=?", (collection, theme))
+        if cursor.fetchone() is None:
+            cursor.execute('''INSERT INTO collections (id, name, theme, preview_image, placeholder, average_color)
+                              VALUES (?, ?, ?, ?, ?, ?)''',
+                           (generate_uuid(), collection, theme, *preview))
+        theme_previews.setdefault(theme, []).append(preview)
+    for theme, previews in theme_previews.items():
+        cursor.execute("SELECT 1 FROM themes WHERE name=?", (theme,))
+        if cursor.fetchone() is None:
+            cursor.execute('''INSERT INTO themes (id, name, preview_image, placeholder, average_color)
+                              VALUES (?, ?, ?, ?, ?)''',
+                           (generate_uuid(), theme, *random.choice(previews)))
+    conn.commit()
+
+    elapsed = time.monotonic() - start
+    print(f"Stored {stored} images in {elapsed:.1f}s ({stored / elapsed if elapsed else 0:.1f} img/s), "
+          f"{counters['skipped'] + unchanged} unchanged, {failed} failed")
+    print(f"Deduplicated {deduplicated} images, saving {bytes_saved / 1024 / 1024:.1f} MB of storage")
+
+def placeholder_from_preview(preview_url):
+    # Runs in an upload thread: previews are much smaller than originals and have the same orientation
+    prefix = f"{MINIO_BUCKET}/"
+    key = preview_url[len(prefix):] if preview_url.startswith(prefix) else preview_url
+    local_path = os.path.join(tempfile.gettempdir(), f"{generate_uuid()}{os.path.splitext(key)[1]}")
+    try:
+        s3_client.download_file(MINIO_BUCKET, key, local_path)
+        return preview_url, get_placeholder(local_path)
+    except Exception as e:
+        print(f"Error downloading preview {preview_url}: {e}")
+        return preview_url, None
+    finally:
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+def backfill_placeholders():
+    # Fill placeholders of rows stored before they existed, reading each distinct preview once.
+    # Every batch commits, so an interrupted backfill resumes where it stopped.
+    cursor.execute("SELECT DISTINCT preview_image FROM images WHERE placeholder IS NULL AND preview_image IS NOT NULL")
+    previews = [row[0] for row in cursor.fetchall()]
+    print(f"Backfilling placeholders for {len(previews)} previews")
+    filled = failed = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=UPLOAD_THREADS) as pool:
+        for i in range(0, len(previews), INSERT_BATCH_SIZE):
+            rows = []
+            for preview_url, placeholder in pool.map(placeholder_from_preview, previews[i:i + INSERT_BATCH_SIZE]):
+                if placeholder and placeholder["placeholder"]:
+                    rows.append((placeholder["placeholder"], placeholder["average_color"], preview_url))
+                else:
+                    failed += 1
+            cursor.executemany("UPDATE images SET placeholder=?, average_color=? WHERE preview_image=?", rows)
             conn.commit()
+            filled += len(rows)
+            print(f"Backfilled {filled} previews ({filled / (time.monotonic() - start):.1f}/s), {failed} failed")
 
-    for theme, preview_image in theme_previews.items():
-        cursor.execute('''INSERT INTO themes (id, name, preview_image) VALUES (?, ?, ?)''', (generate_uuid(), theme, preview_image))
-        conn.commit()
-    
-    pool.close()
-    pool.join()
+    # Collection and theme covers take the placeholder of the photo with the same preview
+    for table in ("collections", "themes"):
+        cursor.execute(f'''
+            UPDATE {table} SET (placeholder, average_color) = (
+                SELECT placeholder, average_color FROM images WHERE images.preview_image = {table}.preview_image LIMIT 1
+            )
+            WHERE placeholder IS NULL AND preview_image IS NOT NULL
+        ''')
+        print(f"Backfilled {cursor.rowcount} {table}")
+    conn.commit()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a local theme/collection/photo tree into MinIO and SQLite")
+    parser.add_argument("base_dir", nargs="?", default=r"C:\Users\YapWH\Desktop\photos")
+    parser.add_argument("--dry-run", action="store_true", help="Report new, modified and missing files without ingesting")
+    parser.add_argument("--backfill-placeholders", action="store_true",
+                        help="Compute missing placeholders of stored photos, collections and themes, then exit")
+    args = parser.parse_args()
+
     # MinIO Configuration
     MINIO_ENDPOINT = "http://localhost:9500"
     MINIO_ACCESS_KEY = "minioadmin"
     MINIO_SECRET_KEY = "minioadmin"
     MINIO_BUCKET = "photo-gallery"
 
-    s3_client = boto3.client(
-        "s3", 
-        endpoint_url=MINIO_ENDPOINT,
-        aws_access_key_id=MINIO_ACCESS_KEY,
-        aws_secret_access_key=MINIO_SECRET_KEY
+    # One pooled connection per upload thread, with the API's timeouts and retries
+    storage = S3Storage(
+        MINIO_ENDPOINT,
+        MINIO_ACCESS_KEY,
+        MINIO_SECRET_KEY,
+        MINIO_BUCKET,
+        max_connections=UPLOAD_THREADS
     )
+    s3_client = storage.client
 
     # Ensure MinIO bucket exists
     def create_bucket():
@@ -152,54 +417,20 @@ if __name__ == "__main__":
         except s3_client.exceptions.BucketAlreadyOwnedByYou:
             pass  # Ignore if bucket exists
 
-    create_bucket()
-
     # Database setup
     DB_FILE = "images.db"
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS images (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            filepath TEXT,
-            date_added TEXT,
-            theme TEXT,
-            collection TEXT,
-            favourite BOOLEAN DEFAULT 0,
-            camera_model TEXT,
-            focal_length TEXT,
-            exposure_time TEXT,
-            iso TEXT,
-            aperture TEXT,
-            preview_image TEXT,
-            status TEXT DEFAULT 'active'
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS collections (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            theme TEXT,
-            preview_image TEXT,
-            status TEXT DEFAULT 'active'
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS themes (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            preview_image TEXT,
-            status TEXT DEFAULT 'active'
-        )
-    ''')
-    
-    conn.commit()
+    apply_migrations(conn)
 
     # Run script
-    BASE_DIR = r"C:\Users\YapWH\Desktop\photos"
-    process_images(BASE_DIR)
+    if args.dry_run:
+        plan_ingest(args.base_dir)
+    elif args.backfill_placeholders:
+        backfill_placeholders()
+    else:
+        create_bucket()
+        process_images(args.base_dir)
+    storage.close()
     conn.close()
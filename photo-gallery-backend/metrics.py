@@ -0,0 +1,173 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond queries to slow uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames:tuple, values:tuple, extra:str="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value:float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = None
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels:dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    type = "counter"
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount:float=1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(_Metric):
+    """
+    Current value per label set
+
+    Gauges given a `collect` callable are read at scrape time; it returns a
+    dict of label value tuples (or () without labels) to values.
+    """
+    type = "gauge"
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.collect = collect
+
+    def set(self, value:float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> list:
+        if self.collect is not None:
+            try:
+                values = list(self.collect().items())
+            except Exception:
+                values = []
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(_Metric):
+    """Cumulative bucketed observations per label set"""
+    type = "histogram"
+
+    def __init__(self, name:str, documentation:str, labelnames:tuple=(), buckets:tuple=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value:float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a `with` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        lines = []
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    """Named metrics rendered together in the Prometheus text format"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric:_Metric) -> _Metric:
+        with self._lock:
+            # Modules imported twice (e.g. by a worker process) get the existing metric back
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """
+        Render every metric
+
+        Parameters:
+        None
+
+        Returns:
+        str: Prometheus text exposition format, version 0.0.4
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name:str, documentation:str, labelnames:tuple=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name:str, documentation:str, labelnames:tuple=(), collect=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, collect))
+
+def histogram(name:str, documentation:str, labelnames:tuple=(), buckets:tuple=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+# Metrics shared by several modules
+SQLITE_QUERY_SECONDS = histogram("sqlite_query_duration_seconds",
+                                 "Time spent executing SQLite statements", ("statement",))
+SQLITE_POOL_WAIT_SECONDS = histogram("sqlite_pool_wait_duration_seconds",
+                                     "Time spent waiting for a pooled SQLite connection")
+S3_REQUEST_SECONDS = histogram("s3_request_duration_seconds",
+                               "S3 API call latency including retries", ("operation", "outcome"))
+S3_BYTES = counter("s3_bytes_total", "Bytes sent to and received from S3", ("direction",))
+IMAGE_SECONDS = histogram("image_processing_duration_seconds",
+                          "Pillow decode, encode and EXIF extraction time", ("operation",))
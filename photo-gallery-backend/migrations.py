@@ -0,0 +1,470 @@
+import sqlite3
+
+# Typed EXIF columns search_photos filters by range, and the covering index led by each (migration 11).
+# search_photos names these indexes in INDEXED BY, which fails outright if one is missing, so the names
+# are defined once here for both.
+SEARCH_RANGE_COLUMNS = ("focal_length_mm", "f_number", "iso_speed", "taken_at")
+SEARCH_RANGE_INDEXES = {column: f"idx_images_active_{column}" for column in SEARCH_RANGE_COLUMNS}
+SEARCH_DATE_INDEX = "idx_images_active_date_exif"
+
+# Ordered schema migrations, tracked with PRAGMA user_version.
+# Each entry is (version, description, statements); never edit a released
+# migration, append a new one instead.
+MIGRATIONS = [
+    (1, "Base schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS images (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            filepath TEXT,
+            date_added TEXT,
+            theme TEXT,
+            collection TEXT,
+            favourite BOOLEAN DEFAULT 0,
+            camera_model TEXT,
+            focal_length TEXT,
+            exposure_time TEXT,
+            iso TEXT,
+            aperture TEXT,
+            preview_image TEXT,
+            status TEXT DEFAULT 'active'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS collections (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            theme TEXT,
+            preview_image TEXT,
+            status TEXT DEFAULT 'active'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS themes (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            preview_image TEXT,
+            status TEXT DEFAULT 'active'
+        )
+        ''',
+    ]),
+    (2, "Indexes for listing queries", [
+        # get_photos_by_theme_and_collection, ordered by (date_added, id)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_images_active_theme_collection
+        ON images (theme, collection, date_added, id) WHERE status='active'
+        ''',
+        # get_all_photos
+        '''
+        CREATE INDEX IF NOT EXISTS idx_images_active_date
+        ON images (date_added, id) WHERE status='active'
+        ''',
+        # get_favorites
+        '''
+        CREATE INDEX IF NOT EXISTS idx_images_favourite_date
+        ON images (date_added, id) WHERE favourite=1
+        ''',
+        # get_collections_by_theme and get_all_collections
+        '''
+        CREATE INDEX IF NOT EXISTS idx_collections_active_theme
+        ON collections (theme, name) WHERE status='active'
+        ''',
+        # get_all_themes
+        '''
+        CREATE INDEX IF NOT EXISTS idx_themes_active
+        ON themes (name) WHERE status='active'
+        ''',
+    ]),
+    (3, "Background derivative processing", [
+        "ALTER TABLE images ADD COLUMN processing_status TEXT DEFAULT 'done'",
+        '''
+        CREATE TABLE IF NOT EXISTS processing_jobs (
+            image_id TEXT PRIMARY KEY,
+            local_path TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            created_at TEXT
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_processing_jobs_due
+        ON processing_jobs (next_attempt_at) WHERE status='pending'
+        ''',
+    ]),
+    (4, "Ingest manifest", [
+        # One row per ingested source file, relative to the ingest base directory
+        '''
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            sha256 TEXT,
+            image_id TEXT,
+            ingested_at TEXT
+        )
+        ''',
+    ]),
+    (5, "Content-addressed originals", [
+        # One row per distinct original; images point at it through content_hash
+        '''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            filepath TEXT,
+            preview_image TEXT,
+            size INTEGER,
+            created_at TEXT
+        )
+        ''',
+        "ALTER TABLE images ADD COLUMN content_hash TEXT",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_images_content_hash
+        ON images (content_hash) WHERE content_hash IS NOT NULL
+        ''',
+        # Backfill from files already hashed by the ingest manifest
+        '''
+        UPDATE images SET content_hash=(SELECT sha256 FROM ingest_manifest WHERE image_id=images.id)
+        WHERE id IN (SELECT image_id FROM ingest_manifest)
+        ''',
+        '''
+        INSERT OR IGNORE INTO blobs (sha256, filepath, preview_image, size, created_at)
+        SELECT ingest_manifest.sha256, images.filepath, images.preview_image, ingest_manifest.size, ingest_manifest.ingested_at
+        FROM ingest_manifest JOIN images ON images.id = ingest_manifest.image_id
+        ''',
+    ]),
+    (6, "Typed EXIF columns", [
+        "ALTER TABLE images ADD COLUMN focal_length_mm REAL",
+        "ALTER TABLE images ADD COLUMN f_number REAL",
+        "ALTER TABLE images ADD COLUMN exposure_seconds REAL",
+        "ALTER TABLE images ADD COLUMN iso_speed INTEGER",
+        "ALTER TABLE images ADD COLUMN taken_at TEXT",
+        "ALTER TABLE images ADD COLUMN width INTEGER",
+        "ALTER TABLE images ADD COLUMN height INTEGER",
+        "ALTER TABLE images ADD COLUMN orientation INTEGER",
+        # Backfill from the TEXT columns where they hold plain numbers
+        "UPDATE images SET focal_length_mm=CAST(focal_length AS REAL) WHERE focal_length GLOB '[0-9]*'",
+        "UPDATE images SET f_number=CAST(aperture AS REAL) WHERE aperture GLOB '[0-9]*'",
+        "UPDATE images SET exposure_seconds=CAST(exposure_time AS REAL) WHERE exposure_time GLOB '[0-9]*' AND exposure_time NOT LIKE '%/%'",
+        '''
+        UPDATE images SET exposure_seconds=CAST(substr(exposure_time, 1, instr(exposure_time, '/') - 1) AS REAL)
+                                          / CAST(substr(exposure_time, instr(exposure_time, '/') + 1) AS REAL)
+        WHERE exposure_time GLOB '[0-9]*/[0-9]*'
+        ''',
+        "UPDATE images SET iso_speed=CAST(iso AS INTEGER) WHERE iso GLOB '[0-9]*'",
+        "CREATE INDEX IF NOT EXISTS idx_images_focal_length_mm ON images (focal_length_mm) WHERE focal_length_mm IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_images_f_number ON images (f_number) WHERE f_number IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_images_iso_speed ON images (iso_speed) WHERE iso_speed IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_images_taken_at ON images (taken_at) WHERE taken_at IS NOT NULL",
+    ]),
+    (7, "Full-text search over photo names", [
+        # External-content FTS5 index over images, kept in sync by triggers
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+            name, theme, collection,
+            content='images', content_rowid='rowid', prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+            INSERT INTO images_fts (rowid, name, theme, collection)
+            VALUES (new.rowid, new.name, new.theme, new.collection);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+            INSERT INTO images_fts (images_fts, rowid, name, theme, collection)
+            VALUES ('delete', old.rowid, old.name, old.theme, old.collection);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE OF name, theme, collection ON images BEGIN
+            INSERT INTO images_fts (images_fts, rowid, name, theme, collection)
+            VALUES ('delete', old.rowid, old.name, old.theme, old.collection);
+            INSERT INTO images_fts (rowid, name, theme, collection)
+            VALUES (new.rowid, new.name, new.theme, new.collection);
+        END
+        ''',
+        "INSERT INTO images_fts (images_fts) VALUES ('rebuild')",
+        # search_photos: camera equality keeps (date_added, id) order
+        '''
+        CREATE INDEX IF NOT EXISTS idx_images_active_camera_date
+        ON images (camera_model COLLATE NOCASE, date_added, id) WHERE status='active'
+        ''',
+        # search_photos: range filters are evaluated inside the index while walking it in (date_added, id) order
+        f'''
+        CREATE INDEX IF NOT EXISTS {SEARCH_DATE_INDEX}
+        ON images (date_added, id, {", ".join(SEARCH_RANGE_COLUMNS)}) WHERE status='active'
+        ''',
+    ]),
+    (8, "Per-collection photo counts", [
+        # Active photo count per (theme, collection), kept current by triggers on images
+        '''
+        CREATE TABLE IF NOT EXISTS collection_stats (
+            theme TEXT,
+            collection TEXT,
+            photo_count INTEGER DEFAULT 0,
+            PRIMARY KEY (theme, collection)
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO collection_stats (theme, collection, photo_count)
+        SELECT theme, collection, COUNT(*) FROM images
+        WHERE status='active' AND theme IS NOT NULL AND collection IS NOT NULL
+        GROUP BY theme, collection
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS collection_stats_insert AFTER INSERT ON images
+        WHEN new.status='active' BEGIN
+            INSERT INTO collection_stats (theme, collection, photo_count) VALUES (new.theme, new.collection, 1)
+            ON CONFLICT (theme, collection) DO UPDATE SET photo_count=photo_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS collection_stats_delete AFTER DELETE ON images
+        WHEN old.status='active' BEGIN
+            UPDATE collection_stats SET photo_count=photo_count - 1
+            WHERE theme=old.theme AND collection=old.collection;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS collection_stats_update AFTER UPDATE OF theme, collection, status ON images
+        WHEN old.status IS 'active' OR new.status IS 'active' BEGIN
+            UPDATE collection_stats SET photo_count=photo_count - 1
+            WHERE old.status='active' AND theme=old.theme AND collection=old.collection;
+            INSERT INTO collection_stats (theme, collection, photo_count)
+            SELECT new.theme, new.collection, 1 WHERE new.status='active'
+            ON CONFLICT (theme, collection) DO UPDATE SET photo_count=photo_count + 1;
+        END
+        ''',
+    ]),
+    (9, "Inline preview placeholders", [
+        # Filled at upload and ingest time; `python local_to_sql.py --backfill-placeholders` fills existing rows
+        "ALTER TABLE images ADD COLUMN placeholder TEXT",
+        "ALTER TABLE images ADD COLUMN average_color TEXT",
+        "ALTER TABLE collections ADD COLUMN placeholder TEXT",
+        "ALTER TABLE collections ADD COLUMN average_color TEXT",
+        "ALTER TABLE themes ADD COLUMN placeholder TEXT",
+        "ALTER TABLE themes ADD COLUMN average_color TEXT",
+        # Collection and theme covers take the placeholder of the photo with the same preview
+        '''
+        CREATE INDEX IF NOT EXISTS idx_images_preview_image
+        ON images (preview_image) WHERE preview_image IS NOT NULL
+        ''',
+    ]),
+    (10, "Catalog generation counters", [
+        # Listing ETags are built from these counters. Triggers bump them in the writing transaction, so every
+        # API worker process and the ingest script see the same values. Scopes are JSON arrays, e.g.
+        # ["collection","Travel","Japan"]; the random epoch tells ETags of a recreated database apart.
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_generations (
+            scope TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        "INSERT OR IGNORE INTO catalog_generations (scope, generation) VALUES (json_array('epoch'), abs(random() % 1000000000))",
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_themes_insert AFTER INSERT ON themes BEGIN
+            INSERT INTO catalog_generations (scope, generation) VALUES (json_array('themes'), 1)
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_themes_update AFTER UPDATE ON themes BEGIN
+            INSERT INTO catalog_generations (scope, generation) VALUES (json_array('themes'), 1)
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_themes_delete AFTER DELETE ON themes BEGIN
+            INSERT INTO catalog_generations (scope, generation) VALUES (json_array('themes'), 1)
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_collections_insert AFTER INSERT ON collections BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            VALUES (json_array('collections'), 1), (json_array('theme', new.theme), 1)
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_collections_update AFTER UPDATE ON collections BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            SELECT DISTINCT column1, 1 FROM (VALUES (json_array('collections')), (json_array('theme', old.theme)),
+                                                    (json_array('theme', new.theme))) WHERE true
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_collections_delete AFTER DELETE ON collections BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            VALUES (json_array('collections'), 1), (json_array('theme', old.theme), 1)
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_images_insert AFTER INSERT ON images BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            SELECT column1, 1 FROM (VALUES (json_array('gallery')), (json_array('collection', new.theme, new.collection)),
+                                           (CASE WHEN new.favourite=1 THEN json_array('favorites') END))
+            WHERE column1 IS NOT NULL
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        # Only columns a listing can return; processing_status changes by the job queue do not invalidate
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_images_update AFTER UPDATE OF
+            name, date_added, theme, collection, favourite, camera_model, focal_length, exposure_time, iso,
+            aperture, focal_length_mm, f_number, exposure_seconds, iso_speed, taken_at, width, height,
+            orientation, preview_image, placeholder, average_color, status ON images BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            SELECT DISTINCT column1, 1 FROM (VALUES
+                (json_array('collection', old.theme, old.collection)),
+                (json_array('collection', new.theme, new.collection)),
+                (CASE WHEN old.favourite=1 OR new.favourite=1 THEN json_array('favorites') END),
+                (CASE WHEN old.theme IS NOT new.theme OR old.collection IS NOT new.collection
+                           OR old.status IS NOT new.status THEN json_array('gallery') END))
+            WHERE column1 IS NOT NULL
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_images_delete AFTER DELETE ON images BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            SELECT column1, 1 FROM (VALUES (json_array('gallery')), (json_array('collection', old.theme, old.collection)),
+                                           (CASE WHEN old.favourite=1 THEN json_array('favorites') END))
+            WHERE column1 IS NOT NULL
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+    ]),
+    (11, "Covering indexes for EXIF range search", [
+        # search_photos: a selective range is read from its index and the other typed filters are checked in
+        # the same entries, so only matching photos are fetched and sorted
+        "DROP INDEX IF EXISTS idx_images_focal_length_mm",
+        "DROP INDEX IF EXISTS idx_images_f_number",
+        "DROP INDEX IF EXISTS idx_images_iso_speed",
+        "DROP INDEX IF EXISTS idx_images_taken_at",
+        *(f'''
+        CREATE INDEX IF NOT EXISTS {SEARCH_RANGE_INDEXES[column]}
+        ON images ({", ".join((column,) + tuple(other for other in SEARCH_RANGE_COLUMNS if other != column))})
+        WHERE status='active' AND {column} IS NOT NULL
+        ''' for column in SEARCH_RANGE_COLUMNS),
+    ]),
+    (12, "Longer full-text prefix index", [
+        # FTS5 answers a prefix query longer than every prefix index by merging the postings of all matching
+        # terms up front, about 6 ms per common word on a million photos. With prefixes up to 8 characters
+        # indexed, most search words are read lazily and a page stops after its first matches.
+        "DROP TABLE IF EXISTS images_fts",
+        '''
+        CREATE VIRTUAL TABLE images_fts USING fts5(
+            name, theme, collection,
+            content='images', content_rowid='rowid', prefix='2 3 4 5 6 7 8'
+        )
+        ''',
+        "INSERT INTO images_fts (images_fts) VALUES ('rebuild')",
+    ]),
+    (13, "Per-batch catalog generation bumps", [
+        # A bulk write holds a row here for the length of its transaction and bumps the scopes it changed
+        # once at the end. The row is uncommitted, so only the writing connection sees it and every other
+        # writer, which waits for the write lock, still bumps per row.
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_bulk_writes (
+            started_at TEXT NOT NULL
+        )
+        ''',
+        "DROP TRIGGER IF EXISTS catalog_images_update",
+        '''
+        CREATE TRIGGER catalog_images_update AFTER UPDATE OF
+            name, date_added, theme, collection, favourite, camera_model, focal_length, exposure_time, iso,
+            aperture, focal_length_mm, f_number, exposure_seconds, iso_speed, taken_at, width, height,
+            orientation, preview_image, placeholder, average_color, status ON images
+        WHEN NOT EXISTS (SELECT 1 FROM catalog_bulk_writes) BEGIN
+            INSERT INTO catalog_generations (scope, generation)
+            SELECT DISTINCT column1, 1 FROM (VALUES
+                (json_array('collection', old.theme, old.collection)),
+                (json_array('collection', new.theme, new.collection)),
+                (CASE WHEN old.favourite=1 OR new.favourite=1 THEN json_array('favorites') END),
+                (CASE WHEN old.theme IS NOT new.theme OR old.collection IS NOT new.collection
+                           OR old.status IS NOT new.status THEN json_array('gallery') END))
+            WHERE column1 IS NOT NULL
+            ON CONFLICT (scope) DO UPDATE SET generation=generation + 1;
+        END
+        ''',
+    ]),
+    (14, "Job claim leases", [
+        # A running job belongs to the process that claimed it until its lease, renewed while the job runs,
+        # expires; only then may another API worker process put it back in the queue
+        "ALTER TABLE processing_jobs ADD COLUMN claimed_at REAL",
+        "ALTER TABLE processing_jobs ADD COLUMN owner_pid INTEGER",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_processing_jobs_claimed
+        ON processing_jobs (claimed_at) WHERE status='running'
+        ''',
+    ]),
+    (15, "Seekable date-ordered listing indexes", [
+        # The first page of a date-ordered listing walked these indexes from their start (a SCAN, stopped by
+        # LIMIT). Leading with the column of the partial index's condition lets it seek to status='active'
+        # or favourite=1 instead, and the order of the remaining columns still serves ORDER BY
+        "DROP INDEX IF EXISTS idx_images_active_date",
+        '''
+        CREATE INDEX idx_images_active_date
+        ON images (status, date_added, id) WHERE status='active'
+        ''',
+        "DROP INDEX IF EXISTS idx_images_favourite_date",
+        '''
+        CREATE INDEX idx_images_favourite_date
+        ON images (favourite, date_added, id) WHERE favourite=1
+        ''',
+        f"DROP INDEX IF EXISTS {SEARCH_DATE_INDEX}",
+        f'''
+        CREATE INDEX {SEARCH_DATE_INDEX}
+        ON images (status, date_added, id, {", ".join(SEARCH_RANGE_COLUMNS)}) WHERE status='active'
+        ''',
+    ]),
+]
+
+def get_schema_version(conn:sqlite3.Connection) -> int:
+    """
+    Get the schema version of a database
+
+    Parameters:
+    conn (sqlite3.Connection): SQLite database connection
+
+    Returns:
+    int: Last applied migration version, 0 for a new database
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_migrations(conn:sqlite3.Connection) -> int:
+    """
+    Apply every pending migration, each in its own transaction
+
+    Parameters:
+    conn (sqlite3.Connection): SQLite database connection
+
+    Returns:
+    int: Schema version after migrating
+    """
+    version = get_schema_version(conn)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the write lock
+            if get_schema_version(conn) >= target:
+                conn.rollback()
+                version = get_schema_version(conn)
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {target}: {description}")
+        version = target
+    return version
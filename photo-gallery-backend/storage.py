@@ -0,0 +1,281 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import boto3
+from botocore.config import Config
+from metrics import S3_REQUEST_SECONDS, S3_BYTES
+from tracing import add_span, join_trace
+
+# DeleteObjects accepts at most this many keys per request
+DELETE_BATCH_SIZE = 1000
+
+def _body_size(body) -> int:
+    if body is None:
+        return 0
+    if hasattr(body, "__len__"):
+        return len(body)
+    try:
+        position = body.tell()
+        size = body.seek(0, 2) - position
+        body.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return 0
+
+def instrument_client(client) -> None:
+    """
+    Record latency and bytes of every S3 call made through a boto3 client
+
+    botocore events cover direct calls as well as the managed transfers
+    behind upload_file and download_file. Calls made in the context of a
+    traced request also add to its `s3` stage; the threads of managed
+    transfers do not carry that context.
+
+    Parameters:
+    client: boto3 S3 client
+
+    Returns:
+    None
+    """
+    def before_call(params, context, **kwargs):
+        context["metrics_start"] = time.perf_counter()
+        # params is the serialized request dict here
+        S3_BYTES.inc(_body_size(params.get("body")), direction="sent")
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        outcome = "ok" if http_response.status_code < 400 else "error"
+        elapsed = time.perf_counter() - context.get("metrics_start", time.perf_counter())
+        S3_REQUEST_SECONDS.observe(elapsed, operation=model.name, outcome=outcome)
+        add_span("s3", elapsed)
+        if model.name == "GetObject" and outcome == "ok":
+            S3_BYTES.inc(parsed.get("ContentLength") or 0, direction="received")
+
+    def after_call_error(model, context, **kwargs):
+        elapsed = time.perf_counter() - context.get("metrics_start", time.perf_counter())
+        S3_REQUEST_SECONDS.observe(elapsed, operation=model.name, outcome="error")
+        add_span("s3", elapsed)
+
+    events = client.meta.events
+    events.register("before-call.s3", before_call)
+    events.register("after-call.s3", after_call)
+    events.register("after-call-error.s3", after_call_error)
+
+class S3Storage:
+    """
+    Shared S3/MinIO client with a sized connection pool and async operations
+
+    boto3 is blocking, so async callers run every request on a dedicated
+    thread pool with one thread per pooled HTTP connection. Slow storage then
+    waits on that pool instead of the event loop or the server's request
+    threadpool. Blocking code (worker threads, ingest) can use `client`
+    directly and shares the same connection pool, timeouts and retries.
+
+    Parameters:
+    endpoint (str): S3 endpoint URL
+    access_key (str): Access key
+    secret_key (str): Secret key
+    bucket (str): Bucket name
+    max_connections (int): HTTP connection pool size and number of storage threads
+    connect_timeout (float): Seconds to wait for a connection
+    read_timeout (float): Seconds to wait for a response
+    max_attempts (int): Attempts per request, including the first, for throttling and transient errors
+    verify (bool): Verify TLS certificates
+    """
+    def __init__(self, endpoint:str, access_key:str, secret_key:str, bucket:str,
+                 max_connections:int=32, connect_timeout:float=5.0, read_timeout:float=60.0,
+                 max_attempts:int=5, verify:bool=True):
+        self.bucket = bucket
+        self.max_connections = max_connections
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            verify=verify,
+            config=Config(
+                max_pool_connections=max_connections,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                retries={"max_attempts": max_attempts, "mode": "standard"}
+            )
+        )
+        instrument_client(self.client)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="s3")
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+        }
+
+    def _call(self, fn, *args, **kwargs):
+        join_trace()
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["in_flight"] += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking storage call on the storage thread pool
+
+        Parameters:
+        fn (Callable): Blocking function, usually a method of `client`
+        args, kwargs: Arguments for `fn`
+
+        Returns:
+        Any: Return value of `fn`
+        """
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context over so the call is attributed to its request trace
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(context.run, self._call, fn, *args, **kwargs))
+
+    async def upload_file(self, local_path:str, key:str) -> str:
+        """
+        Upload a local file
+
+        Parameters:
+        local_path (str): Local file path
+        key (str): Object key
+
+        Returns:
+        str: Object key
+        """
+        await self.run(self.client.upload_file, local_path, self.bucket, key)
+        return key
+
+    async def download_file(self, key:str, local_path:str) -> str:
+        """
+        Download an object to a local file
+
+        Parameters:
+        key (str): Object key
+        local_path (str): Destination path
+
+        Returns:
+        str: Local file path
+        """
+        await self.run(self.client.download_file, self.bucket, key, local_path)
+        return local_path
+
+    async def get_bytes(self, key:str) -> bytes:
+        """
+        Read a small object into memory
+
+        Parameters:
+        key (str): Object key
+
+        Returns:
+        bytes: Object content, or None if the object does not exist
+        """
+        def get():
+            try:
+                response = self.client.get_object(Bucket=self.bucket, Key=key)
+            except self.client.exceptions.NoSuchKey:
+                return None
+            return response["Body"].read()
+        return await self.run(get)
+
+    async def put_bytes(self, key:str, data:bytes, content_type:str=None) -> str:
+        """
+        Write an in-memory object
+
+        Parameters:
+        key (str): Object key
+        data (bytes): Object content
+        content_type (str): Content-Type stored with the object
+
+        Returns:
+        str: Object key
+        """
+        extra = {"ContentType": content_type} if content_type else {}
+        await self.run(self.client.put_object, Bucket=self.bucket, Key=key, Body=data, **extra)
+        return key
+
+    async def delete(self, key:str) -> None:
+        """
+        Delete an object
+
+        Parameters:
+        key (str): Object key
+
+        Returns:
+        None
+        """
+        await self.run(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def upload_many(self, files:list) -> list:
+        """
+        Upload several files concurrently
+
+        Parameters:
+        files (list): (local_path, key) pairs
+
+        Returns:
+        list: Object key or the exception raised, per file in order
+        """
+        return await asyncio.gather(*(self.upload_file(local_path, key) for local_path, key in files),
+                                    return_exceptions=True)
+
+    async def delete_many(self, keys:list) -> list:
+        """
+        Delete several objects with batched DeleteObjects requests sent concurrently
+
+        Parameters:
+        keys (list): Object keys
+
+        Returns:
+        list: Keys that could not be deleted
+        """
+        batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+        responses = await asyncio.gather(*(
+            self.run(self.client.delete_objects, Bucket=self.bucket,
+                     Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+            for batch in batches
+        ), return_exceptions=True)
+        failed = []
+        for batch, response in zip(batches, responses):
+            if isinstance(response, Exception):
+                failed.extend(batch)
+            else:
+                failed.extend(error["Key"] for error in response.get("Errors", []))
+        return failed
+
+    def stats(self) -> dict:
+        """
+        Get storage call counters
+
+        Parameters:
+        None
+
+        Returns:
+        dict: Pool size, queued calls, calls, errors and calls in flight on the storage thread pool
+        """
+        with self._lock:
+            return {"max_connections": self.max_connections, "queued": self._executor._work_queue.qsize(), **self._stats}
+
+    def close(self) -> None:
+        """
+        Wait for running storage calls and stop the thread pool
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        """
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,181 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("trace", default=None)
+
+class Trace:
+    """
+    Stage timings of one request
+
+    Spans with the same name are summed, so a listing running 40 queries
+    reports one `sqlite` stage with its total time and call count. Spans
+    may overlap (S3 calls run concurrently), so stages need not add up to
+    the request duration. Threads that record a span or call join_trace
+    join the trace and are followed by a SamplingProfiler attached to it.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # name -> [seconds, count]
+        self.threads = {threading.get_ident()}
+        self._lock = threading.Lock()
+
+    def join(self) -> None:
+        with self._lock:
+            self.threads.add(threading.get_ident())
+
+    def add(self, name:str, seconds:float) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += 1
+            self.threads.add(threading.get_ident())
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def summary(self) -> dict:
+        """
+        Get the stage timings
+
+        Parameters:
+        None
+
+        Returns:
+        dict: Stage name -> {"ms", "count"}, slowest first
+        """
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1][0], reverse=True)
+        return {name: {"ms": round(seconds * 1000, 3), "count": count} for name, (seconds, count) in stages}
+
+    def server_timing(self) -> str:
+        """
+        Format the stage timings as a Server-Timing header value
+
+        Parameters:
+        None
+
+        Returns:
+        str: e.g. sqlite;dur=1.2;desc="3x", total;dur=4.5
+        """
+        metrics = [f'{name};dur={stage["ms"]};desc="{stage["count"]}x"' for name, stage in self.summary().items()]
+        metrics.append(f"total;dur={round(self.elapsed() * 1000, 3)}")
+        return ", ".join(metrics)
+
+def start_trace() -> tuple:
+    """
+    Start tracing the current request
+
+    Tasks created and threadpool calls made afterwards inherit the trace;
+    plain executors need contextvars.copy_context() to do the same.
+
+    Parameters:
+    None
+
+    Returns:
+    tuple: (Trace, token to pass to end_trace)
+    """
+    trace = Trace()
+    return trace, _current.set(trace)
+
+def end_trace(token) -> None:
+    _current.reset(token)
+
+def join_trace() -> None:
+    """Mark the calling thread as working on the current trace, if any, so it is profiled"""
+    trace = _current.get()
+    if trace is not None:
+        trace.join()
+
+def add_span(name:str, seconds:float) -> None:
+    """Add a timing measured elsewhere to the current trace, if any"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+@contextmanager
+def span(name:str):
+    """Time a `with` block as a stage of the current trace, if any"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    trace.join()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler:
+    """
+    Sample the stacks of the threads working on one trace
+
+    A background thread reads the current frame of every thread in
+    `trace.threads` each `interval` seconds. The event loop thread and
+    pooled worker threads are shared with other requests, so concurrent
+    requests can show up in the profile; it is meant for one slow request
+    reproduced on a quiet server.
+
+    Parameters:
+    trace (Trace): Trace of the profiled request
+    interval (float): Seconds between samples
+    """
+    def __init__(self, trace:Trace, interval:float=0.005):
+        self.trace = trace
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        # Called on the event loop, so signal the thread instead of joining it; it exits within one
+        # interval and takes no sample once stop() has returned
+        self._stop.set()
+        with self._lock:
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self.trace._lock:
+                threads = list(self.trace.threads)
+            with self._lock:
+                if self._stop.is_set():
+                    break
+                for ident in threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self.stacks[_fold(frame)] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        """
+        Render the samples in the collapsed stack format read by flamegraph.pl and speedscope
+
+        Parameters:
+        None
+
+        Returns:
+        str: One "frame;frame;frame count" line per distinct stack, most sampled first
+        """
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())